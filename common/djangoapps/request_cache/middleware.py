@@ -2,19 +2,33 @@ import threading
 
 _request_cache_threadlocal = threading.local()
 _request_cache_threadlocal.data = {}
+_request_cache_threadlocal.in_request = False
 
 class RequestCache(object):
     @classmethod
     def get_request_cache(cls):
         return _request_cache_threadlocal
-            
+
+    @classmethod
+    def get_request_cache_dict(cls, name):
+        """
+        Return the dict called `name` in the cache of the request this thread
+        is processing, or None if it isn't processing one (e.g. in tests,
+        celery tasks or management commands, where nothing would clear it).
+        """
+        if not getattr(_request_cache_threadlocal, 'in_request', False):
+            return None
+        return _request_cache_threadlocal.data.setdefault(name, {})
+
     def clear_request_cache(self):
         _request_cache_threadlocal.data = {}
 
     def process_request(self, request):
         self.clear_request_cache()
+        _request_cache_threadlocal.in_request = True
         return None
 
     def process_response(self, request, response):
         self.clear_request_cache()
-        return response
\ No newline at end of file
+        _request_cache_threadlocal.in_request = False
+        return response
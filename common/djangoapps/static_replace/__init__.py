@@ -1,6 +1,8 @@
 import logging
 import re
 
+from lazy import lazy
+
 from staticfiles.storage import staticfiles_storage
 from staticfiles import finders
 from django.conf import settings
@@ -8,9 +10,17 @@ from django.conf import settings
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore import XML_MODULESTORE_TYPE
 from xmodule.contentstore.content import StaticContent
+from request_cache.middleware import RequestCache
 
 log = logging.getLogger(__name__)
 
+# Name of the request cache dict mapping (course_id, data_directory, static_asset_path)
+# to the urls that static paths were rewritten to for that course
+STATIC_URLS_CACHE = 'static_replace.static_urls'
+
+# Compiled regexes, by pattern
+_REGEXES = {}
+
 
 def _url_replace_regex(prefix):
     """
@@ -28,6 +38,26 @@ def _url_replace_regex(prefix):
         """.format(prefix=prefix)
 
 
+def _compiled(pattern):
+    """
+    Return the compiled regex for pattern, compiling it only once
+    """
+    regex = _REGEXES.get(pattern)
+    if regex is None:
+        regex = _REGEXES[pattern] = re.compile(pattern)
+    return regex
+
+
+def _static_url_prefix_regex(data_directory, static_asset_path):
+    """
+    Return the regex matching the prefixes of the static urls to replace
+    """
+    return '(?:{static_url}|/static/)(?!{data_dir})'.format(
+        static_url=settings.STATIC_URL,
+        data_dir=static_asset_path or data_directory
+    )
+
+
 def try_staticfiles_lookup(path):
     """
     Try to lookup a path in staticfiles_storage.  If it fails, return
@@ -69,7 +99,7 @@ def replace_jump_to_id_urls(text, course_id, jump_to_id_base_url):
         rest = match.group('rest')
         return "".join([quote, jump_to_id_base_url + rest, quote])
 
-    return re.sub(_url_replace_regex('/jump_to_id/'), replace_jump_to_id_url, text)
+    return _compiled(_url_replace_regex('/jump_to_id/')).sub(replace_jump_to_id_url, text)
 
 
 def replace_course_urls(text, course_id):
@@ -87,7 +117,7 @@ def replace_course_urls(text, course_id):
         rest = match.group('rest')
         return "".join([quote, '/courses/' + course_id + '/', rest, quote])
 
-    return re.sub(_url_replace_regex('/course/'), replace_course_url, text)
+    return _compiled(_url_replace_regex('/course/')).sub(replace_course_url, text)
 
 
 def replace_static_urls(text, data_directory, course_id=None, static_asset_path=''):
@@ -103,21 +133,93 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
     static_asset_path: Path for static assets, which overrides data_directory and course_namespace, if nonempty
     """
 
+    static_url = _StaticUrlResolver(data_directory, course_id, static_asset_path)
+
     def replace_static_url(match):
-        original = match.group(0)
-        prefix = match.group('prefix')
+        return static_url(match.group(0), match.group('quote'), match.group('prefix'), match.group('rest'))
+
+    return _compiled(
+        _url_replace_regex(_static_url_prefix_regex(data_directory, static_asset_path))
+    ).sub(replace_static_url, text)
+
+
+def replace_urls(text, data_directory, course_id, jump_to_id_base_url, static_asset_path=''):
+    """
+    Apply replace_static_urls, replace_course_urls and replace_jump_to_id_urls
+    to text, with a single scan of it.
+
+    text: The source text to do the substitutions in
+    data_directory, static_asset_path: As for replace_static_urls
+    course_id: The course_id in which this rewrite happens
+    jump_to_id_base_url: As for replace_jump_to_id_urls
+    """
+    static_url = _StaticUrlResolver(data_directory, course_id, static_asset_path)
+
+    def replace_url(match):
         quote = match.group('quote')
         rest = match.group('rest')
+        if match.group('static') is not None:
+            return static_url(match.group(0), quote, match.group('static'), rest)
+        elif match.group('course') is not None:
+            return "".join([quote, '/courses/' + course_id + '/', rest, quote])
+        else:
+            return "".join([quote, jump_to_id_base_url + rest, quote])
+
+    return _compiled(_url_replace_regex(
+        '(?P<static>{static})|(?P<course>/course/)|(?P<jump_to_id>/jump_to_id/)'.format(
+            static=_static_url_prefix_regex(data_directory, static_asset_path)
+        )
+    )).sub(replace_url, text)
+
 
+class _StaticUrlResolver(object):
+    """
+    Callable returning the quoted replacement of a static url matched by
+    _url_replace_regex in a course, as described in replace_static_urls.
+
+    Within a request, the urls are remembered per course, so that a path is only
+    looked up in storage once however many times the page refers to it.
+    """
+    def __init__(self, data_directory, course_id, static_asset_path):
+        self.data_directory = data_directory
+        self.course_id = course_id
+        self.static_asset_path = static_asset_path
+
+        cache = RequestCache.get_request_cache_dict(STATIC_URLS_CACHE)
+        if cache is not None:
+            self.urls = cache.setdefault((course_id, data_directory, static_asset_path), {})
+        else:
+            self.urls = {}
+
+    @lazy
+    def use_contentstore(self):
+        """
+        Whether we're running with a MongoBacked store course_namespace is not None,
+        and so use studio style urls
+        """
+        return bool(
+            (not self.static_asset_path) and self.course_id and
+            modulestore().get_modulestore_type(self.course_id) != XML_MODULESTORE_TYPE
+        )
+
+    def __call__(self, original, quote, prefix, rest):
         # Don't mess with things that end in '?raw'
         if rest.endswith('?raw'):
             return original
 
+        key = (quote, prefix, rest)
+        if key not in self.urls:
+            self.urls[key] = self._resolve(original, quote, prefix, rest)
+        return self.urls[key]
+
+    def _resolve(self, original, quote, prefix, rest):
+        """
+        Return the replacement of the static url `original`
+        """
         # In debug mode, if we can find the url as is,
         if settings.DEBUG and finders.find(rest, True):
             return original
-        # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
-        elif (not static_asset_path) and course_id and modulestore().get_modulestore_type(course_id) != XML_MODULESTORE_TYPE:
+        elif self.use_contentstore:
             # first look in the static file pipeline and see if we are trying to reference
             # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
 
@@ -133,10 +235,10 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
             else:
                 # if not, then assume it's courseware specific content and then look in the
                 # Mongo-backed database
-                url = StaticContent.convert_legacy_static_url_with_course_id(rest, course_id)
+                url = StaticContent.convert_legacy_static_url_with_course_id(rest, self.course_id)
         # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
         else:
-            course_path = "/".join((static_asset_path or data_directory, rest))
+            course_path = "/".join((self.static_asset_path or self.data_directory, rest))
 
             try:
                 if staticfiles_storage.exists(rest):
@@ -150,12 +252,3 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
                 url = "".join([prefix, course_path])
 
         return "".join([quote, url, quote])
-
-    return re.sub(
-        _url_replace_regex('(?:{static_url}|/static/)(?!{data_dir})'.format(
-            static_url=settings.STATIC_URL,
-            data_dir=static_asset_path or data_directory
-        )),
-        replace_static_url,
-        text
-    )
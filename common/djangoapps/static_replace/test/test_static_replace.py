@@ -2,8 +2,10 @@ import re
 
 from nose.tools import assert_equals, assert_true, assert_false  # pylint: disable=E0611
 from static_replace import (replace_static_urls, replace_course_urls,
+                            replace_jump_to_id_urls, replace_urls,
                             _url_replace_regex)
 from mock import patch, Mock
+from request_cache.middleware import RequestCache
 from xmodule.modulestore import Location
 from xmodule.modulestore.mongo import MongoModuleStore
 from xmodule.modulestore.xml import XMLModuleStore
@@ -104,6 +106,52 @@ def test_static_url_with_query(mock_modulestore, mock_storage):
     assert_equals(post_text, replace_static_urls(pre_text, DATA_DIRECTORY, COURSE_ID))
 
 
+@patch('static_replace.staticfiles_storage')
+@patch('static_replace.modulestore')
+def test_replace_urls_single_pass(mock_modulestore, mock_storage):
+    """
+    Make sure replace_urls does what the three replace functions do in turn
+    """
+    mock_storage.exists.return_value = False
+    mock_storage.url.side_effect = lambda path: '/static/' + path
+    mock_modulestore.return_value = Mock(XMLModuleStore)
+    jump_to_id_base_url = '/courses/org/course/run/jump_to_id/'
+
+    text = (
+        '<img src="/static/file.png"/><a href=\'/course/info\'>info</a>'
+        '<a href="/jump_to_id/abc">jump</a><img src="/static/raw.png?raw"/>'
+        '<script src="/static/js/file.js"></script><img src="/static/data_dir/other.png"/>'
+    )
+    expected = replace_jump_to_id_urls(
+        replace_course_urls(replace_static_urls(text, DATA_DIRECTORY, COURSE_ID), COURSE_ID),
+        COURSE_ID,
+        jump_to_id_base_url
+    )
+    assert_equals(expected, replace_urls(text, DATA_DIRECTORY, COURSE_ID, jump_to_id_base_url))
+
+
+@patch('static_replace.staticfiles_storage')
+def test_static_urls_cached_in_request(mock_storage):
+    """
+    Make sure each static path is only looked up once per request
+    """
+    mock_storage.exists.return_value = True
+    mock_storage.url.return_value = '/static/file.png'
+
+    middleware = RequestCache()
+    middleware.process_request(None)
+    try:
+        for _ in range(10):
+            assert_equals(STATIC_SOURCE * 3, replace_static_urls(STATIC_SOURCE * 3, DATA_DIRECTORY))
+    finally:
+        middleware.process_response(None, None)
+    assert_equals(mock_storage.exists.call_count, 1)
+
+    # and looked up again outside of requests
+    replace_static_urls(STATIC_SOURCE, DATA_DIRECTORY)
+    assert_equals(mock_storage.exists.call_count, 2)
+
+
 def test_regex():
     yes = ('"/static/foo.png"',
            '"/static/foo.png"',
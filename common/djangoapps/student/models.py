@@ -24,6 +24,7 @@ from django.db.models.signals import post_save
 from django.dispatch import receiver, Signal
 import django.dispatch
 from django.forms import ModelForm, forms
+from django.core.cache import cache
 from django.core.exceptions import ObjectDoesNotExist
 
 from course_modes.models import CourseMode
@@ -31,6 +32,8 @@ import lms.lib.comment_client as cc
 from pytz import UTC
 import crum
 
+from request_cache.middleware import RequestCache
+
 from track import contexts
 from track.views import server_track
 from eventtracking import tracker
@@ -55,12 +58,77 @@ class AnonymousUserId(models.Model):
     unique_together = (user, course_id)
 
 
+# Name of the request cache dict of anonymous ids, keyed by (user id, course_id)
+ANONYMOUS_IDS_CACHE = 'student.anonymous_ids'
+
+# Number of users whose stored anonymous ids are fetched in one query
+ANONYMOUS_IDS_BATCH_SIZE = 500
+
+# Number of seconds an anonymous id is remembered as stored, after which it is
+# checked for in the AnonymousUserId table again (e.g. in case the row was
+# deleted)
+ANONYMOUS_ID_STORED_TIMEOUT = 24 * 60 * 60
+
+
+def _compute_anonymous_id(user_id, course_id):
+    """
+    Return the anonymous id of the user with id `user_id` in the course `course_id`
+    """
+    # include the secret key as a salt, and to make the ids unique across different LMS installs.
+    hasher = hashlib.md5()
+    hasher.update(settings.SECRET_KEY)
+    hasher.update(str(user_id))
+    hasher.update(course_id)
+    return hasher.hexdigest()
+
+
+def _stored_anonymous_id_key(digest):
+    """
+    Return the shared cache key recording that the anonymous id `digest` is
+    stored in the AnonymousUserId table
+    """
+    return u'student.anonymous_id.stored.{}'.format(digest)
+
+
+def _remember_anonymous_id(user, course_id, digest, request_cache):
+    """
+    Cache the anonymous id `digest` of `user` in `course_id` on the user and in the request
+    """
+    if not hasattr(user, '_anonymous_id'):
+        user._anonymous_id = {}
+    user._anonymous_id[course_id] = digest
+    if request_cache is not None:
+        request_cache[(user.id, course_id)] = digest
+
+
+def _check_stored_anonymous_id(user, course_id, stored, digest):
+    """
+    Log an error if the anonymous id `stored` for `user` in `course_id`
+    doesn't match the computed `digest`
+    """
+    if stored != digest:
+        log.error(
+            "Stored anonymous user id {stored!r} for user {user!r} "
+            "in course {course!r} doesn't match computed id {digest!r}".format(
+                user=user,
+                course=course_id,
+                stored=stored,
+                digest=digest
+            )
+        )
+
+
 def anonymous_id_for_user(user, course_id):
     """
     Return a unique id for a (user, course) pair, suitable for inserting
     into e.g. personalized survey links.
 
     If user is an `AnonymousUser`, returns `None`
+
+    Ids are cached on the user and for the rest of the request. Ids found
+    already stored in the AnonymousUserId table are remembered in the shared
+    cache, so that the table isn't queried for them again. Ids stored by this
+    call aren't, as the transaction storing them may still be rolled back.
     """
     # This part is for ability to get xblock instance in xblock_noauth handlers, where user is unauthenticated.
     if user.is_anonymous():
@@ -70,42 +138,99 @@ def anonymous_id_for_user(user, course_id):
     if cached_id is not None:
         return cached_id
 
-    # include the secret key as a salt, and to make the ids unique across different LMS installs.
-    hasher = hashlib.md5()
-    hasher.update(settings.SECRET_KEY)
-    hasher.update(str(user.id))
-    hasher.update(course_id)
-    digest = hasher.hexdigest()
+    request_cache = RequestCache.get_request_cache_dict(ANONYMOUS_IDS_CACHE)
+    if request_cache is not None and (user.id, course_id) in request_cache:
+        digest = request_cache[(user.id, course_id)]
+        _remember_anonymous_id(user, course_id, digest, request_cache)
+        return digest
 
-    try:
-        anonymous_user_id, created = AnonymousUserId.objects.get_or_create(
-            defaults={'anonymous_user_id': digest},
-            user=user,
-            course_id=course_id
-        )
-        if anonymous_user_id.anonymous_user_id != digest:
-            log.error(
-                "Stored anonymous user id {stored!r} for user {user!r} "
-                "in course {course!r} doesn't match computed id {digest!r}".format(
-                    user=user,
-                    course=course_id,
-                    stored=anonymous_user_id.anonymous_user_id,
-                    digest=digest
-                )
+    digest = _compute_anonymous_id(user.id, course_id)
+
+    if cache.get(_stored_anonymous_id_key(digest)) is None:
+        try:
+            anonymous_user_id, created = AnonymousUserId.objects.get_or_create(
+                defaults={'anonymous_user_id': digest},
+                user=user,
+                course_id=course_id
             )
-    except IntegrityError:
-        # Another thread has already created this entry, so
-        # continue
-        pass
+            _check_stored_anonymous_id(user, course_id, anonymous_user_id.anonymous_user_id, digest)
+            if not created:
+                cache.set(_stored_anonymous_id_key(digest), True, ANONYMOUS_ID_STORED_TIMEOUT)
+        except IntegrityError:
+            # Another thread has already created this entry, so
+            # continue
+            pass
 
-    if not hasattr(user, '_anonymous_id'):
-        user._anonymous_id = {}
-
-    user._anonymous_id[course_id] = digest
+    _remember_anonymous_id(user, course_id, digest, request_cache)
 
     return digest
 
 
+def anonymous_ids_for_users(users, course_id):
+    """
+    Return a dict mapping the id of each of `users` to its anonymous id in
+    `course_id` (as `anonymous_id_for_user` would), storing the missing ids in
+    the AnonymousUserId table with a few bulk queries rather than one or two
+    queries per user.
+
+    `users` shouldn't include `AnonymousUser`s. Meant for reports over many
+    users, e.g. all the students of a course.
+    """
+    request_cache = RequestCache.get_request_cache_dict(ANONYMOUS_IDS_CACHE)
+    anonymous_ids = {}
+    unchecked = {}
+    for user in users:
+        digest = _compute_anonymous_id(user.id, course_id)
+        anonymous_ids[user.id] = digest
+        _remember_anonymous_id(user, course_id, digest, request_cache)
+        unchecked[digest] = user
+
+    # Skip the ids already known to be stored
+    keys = dict((_stored_anonymous_id_key(digest), digest) for digest in unchecked)
+    for key in cache.get_many(keys.keys()):
+        unchecked.pop(keys[key], None)
+
+    # Only ids read back from the table are remembered as stored: the
+    # transaction creating the missing ones may still be rolled back
+    found = []
+    unchecked = unchecked.values()
+    for start in xrange(0, len(unchecked), ANONYMOUS_IDS_BATCH_SIZE):
+        batch = dict((user.id, user) for user in unchecked[start:start + ANONYMOUS_IDS_BATCH_SIZE])
+        stored = AnonymousUserId.objects.filter(
+            course_id=course_id,
+            user__in=batch.keys(),
+        ).values_list('user_id', 'anonymous_user_id')
+        for user_id, stored_id in stored:
+            _check_stored_anonymous_id(batch.pop(user_id), course_id, stored_id, anonymous_ids[user_id])
+            found.append(anonymous_ids[user_id])
+
+        missing = [
+            AnonymousUserId(user=user, course_id=course_id, anonymous_user_id=anonymous_ids[user.id])
+            for user in batch.values()
+        ]
+        try:
+            AnonymousUserId.objects.bulk_create(missing)
+        except IntegrityError:
+            # Another thread has created some of these entries; fall back
+            # to creating the others one at a time
+            for row in missing:
+                try:
+                    AnonymousUserId.objects.get_or_create(
+                        defaults={'anonymous_user_id': row.anonymous_user_id},
+                        user=row.user,
+                        course_id=course_id
+                    )
+                except IntegrityError:
+                    pass
+
+    cache.set_many(
+        dict((_stored_anonymous_id_key(digest), True) for digest in found),
+        ANONYMOUS_ID_STORED_TIMEOUT
+    )
+
+    return anonymous_ids
+
+
 def user_by_anonymous_id(id):
     """
     Return user by anonymous_user_id using AnonymousUserId lookup table.
@@ -237,6 +362,14 @@ def unique_id_for_user(user):
     return anonymous_id_for_user(user, '')
 
 
+def unique_ids_for_users(users):
+    """
+    Return a dict mapping the id of each of `users` to its unique id
+    (as `unique_id_for_user` would), in a few bulk queries.
+    """
+    return anonymous_ids_for_users(users, '')
+
+
 # TODO: Should be renamed to generic UserGroup, and possibly
 # Given an optional field for type of group
 class UserTestGroup(models.Model):
@@ -20,15 +20,17 @@ from django.contrib.auth.hashers import UNUSABLE_PASSWORD
 from django.contrib.auth.tokens import default_token_generator
 from django.utils.http import int_to_base36
 from django.core.urlresolvers import reverse
+from django.core.cache import cache
 
 from xmodule.modulestore.tests.factories import CourseFactory
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from courseware.tests.tests import TEST_DATA_MIXED_MODULESTORE
 
-from mock import Mock, patch, sentinel
+from mock import ANY, Mock, patch, sentinel
 from textwrap import dedent
 
-from student.models import anonymous_id_for_user, user_by_anonymous_id, CourseEnrollment, unique_id_for_user
+from student.models import (anonymous_id_for_user, anonymous_ids_for_users, user_by_anonymous_id, CourseEnrollment,
+                            unique_id_for_user, AnonymousUserId, ANONYMOUS_ID_STORED_TIMEOUT)
 from student.views import (process_survey_link, _cert_info, password_reset, password_reset_confirm_wrapper,
                            change_enrollment, complete_course_mode_info)
 from student.tests.factories import UserFactory, CourseModeFactory
@@ -556,3 +558,61 @@ class AnonymousLookupTable(TestCase):
         anonymous_id = anonymous_id_for_user(self.user, self.course.id)
         real_user = user_by_anonymous_id(anonymous_id)
         self.assertEqual(self.user, real_user)
+
+    def test_stored_once_per_user(self):
+        cache.clear()
+        anonymous_id = anonymous_id_for_user(self.user, self.course.id)
+
+        # A fresh copy of the user doesn't carry its ids. The id was just
+        # created, so it's looked up once more before being remembered as stored
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(1):
+            self.assertEqual(anonymous_id, anonymous_id_for_user(user, self.course.id))
+        user = User.objects.get(id=self.user.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(anonymous_id, anonymous_id_for_user(user, self.course.id))
+        self.assertEqual(self.user, user_by_anonymous_id(anonymous_id))
+
+    def test_stored_id_forgotten_after_timeout(self):
+        cache.clear()
+        anonymous_id = anonymous_id_for_user(self.user, self.course.id)
+        with patch('student.models.cache') as mock_cache:
+            mock_cache.get.return_value = None
+            anonymous_id_for_user(User.objects.get(id=self.user.id), self.course.id)
+            anonymous_ids_for_users([User.objects.get(id=self.user.id)], self.course.id)
+        mock_cache.set.assert_called_once_with(ANY, True, ANONYMOUS_ID_STORED_TIMEOUT)
+        self.assertEqual(mock_cache.set_many.call_args[0][1], ANONYMOUS_ID_STORED_TIMEOUT)
+        self.assertEqual(self.user, user_by_anonymous_id(anonymous_id))
+
+    def test_created_id_not_remembered(self):
+        cache.clear()
+        anonymous_id = anonymous_id_for_user(self.user, self.course.id)
+
+        # As if the request creating the row had been rolled back: the next
+        # call has to store it again
+        AnonymousUserId.objects.filter(user=self.user, course_id=self.course.id).delete()
+        user = User.objects.get(id=self.user.id)
+        self.assertEqual(anonymous_id, anonymous_id_for_user(user, self.course.id))
+        self.assertEqual(self.user, user_by_anonymous_id(anonymous_id))
+
+    def test_bulk_ids(self):
+        cache.clear()
+        users = [self.user] + [UserFactory() for _ in range(9)]
+        stored_id = anonymous_id_for_user(users[3], self.course.id)
+
+        fresh_users = list(User.objects.filter(id__in=[user.id for user in users]))
+        with self.assertNumQueries(2):
+            anonymous_ids = anonymous_ids_for_users(fresh_users, self.course.id)
+
+        self.assertEqual(stored_id, anonymous_ids[users[3].id])
+        self.assertEqual(10, AnonymousUserId.objects.filter(course_id=self.course.id).count())
+
+        # The rows are read back once before being remembered as stored
+        with self.assertNumQueries(1):
+            anonymous_ids_for_users(fresh_users, self.course.id)
+        with self.assertNumQueries(0):
+            anonymous_ids_for_users(fresh_users, self.course.id)
+
+        for user in users:
+            self.assertEqual(anonymous_ids[user.id], anonymous_id_for_user(User.objects.get(id=user.id), self.course.id))
+            self.assertEqual(user, user_by_anonymous_id(anonymous_ids[user.id]))
@@ -0,0 +1,206 @@
+"""
+Event tracker backend that hands events to another backend from a
+background thread, in batches, so that requests don't wait for them to
+be stored.
+
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import logging
+import os
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+from dogapi import dog_stats_api
+
+from track.backends import BaseBackend
+
+
+log = logging.getLogger(__name__)
+
+
+class BufferedBackend(BaseBackend):
+    """
+    Event tracker backend that queues events in memory and sends them to
+    another backend in batches, using its `send_many`, from a background
+    thread.
+
+    A batch is sent when it reaches `flush_size` events, or `flush_interval`
+    seconds after its first event was queued. When the queue is full, events
+    are dropped (and counted) rather than blocking the request.
+
+    Example configuration::
+
+      TRACKING_BACKENDS = {
+          'mongo': {
+              'ENGINE': 'track.backends.buffered.BufferedBackend',
+              'OPTIONS': {
+                  'backend': {
+                      'ENGINE': 'track.backends.mongodb.MongoBackend',
+                      'OPTIONS': {...},
+                  },
+                  'flush_size': 100,
+                  'flush_interval': 1,
+              }
+          }
+      }
+
+    """
+    def __init__(self, backend, max_queue_size=10000, flush_size=100, flush_interval=1.0, flush_timeout=5.0,
+                 **options):
+        """
+        :Parameters:
+
+          - `backend`: the backend events are sent to, or its configuration
+            as a dict with an 'ENGINE' and optional 'OPTIONS'
+          - `max_queue_size`: number of events queued before new ones are dropped
+          - `flush_size`: maximum number of events sent in one batch
+          - `flush_interval`: maximum number of seconds an event is queued
+            before being sent
+          - `flush_timeout`: maximum number of seconds `flush` waits for the
+            background thread to finish sending its batch
+
+        """
+        super(BufferedBackend, self).__init__(**options)
+
+        if isinstance(backend, dict):
+            # pylint: disable=cyclic-import
+            from track.tracker import _instantiate_backend_from_name
+            backend = _instantiate_backend_from_name(backend['ENGINE'], backend.get('OPTIONS', {}))
+        self.backend = backend
+
+        self.max_queue_size = max_queue_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.flush_timeout = flush_timeout
+
+        # Number of events dropped because the queue was full
+        self.dropped = 0
+
+        self._queue = Queue(max_queue_size)
+        self._lock = threading.Lock()
+        self._worker = None
+        self._worker_pid = None
+
+        atexit.register(self.flush)
+
+    def send(self, event):
+        """Queue event to be sent by the background thread"""
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(event)
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            dog_stats_api.increment('track.buffered.dropped')
+
+    def send_many(self, events):
+        for event in events:
+            self.send(event)
+
+    def flush(self):
+        """
+        Send all the queued events now, and wait up to `flush_timeout`
+        seconds for the background thread to finish sending the batch it may
+        be working on.
+        """
+        with self._lock:
+            self._forget_parent_events()
+        events = self._take(self.flush_size, block=False)
+        while events:
+            self._send_batch(events)
+            events = self._take(self.flush_size, block=False)
+        if self._worker_running():
+            self._wait_for_worker(self.flush_timeout)
+
+    def _ensure_worker(self):
+        """
+        Start the background thread if it isn't running in this process
+        (threads don't survive forking, e.g. into server workers)
+        """
+        if self._worker_running():
+            return
+
+        with self._lock:
+            if self._worker_running():
+                return
+            self._forget_parent_events()
+            self._worker = threading.Thread(target=self._run, name='track.backends.buffered')
+            self._worker.daemon = True
+            self._worker_pid = os.getpid()
+            self._worker.start()
+
+    def _forget_parent_events(self):
+        """
+        Empty the queue if it was copied from the process this one was forked
+        from: that process sends those events. Must hold `_lock`.
+        """
+        if self._worker_pid is not None and self._worker_pid != os.getpid():
+            self._queue = Queue(self.max_queue_size)
+            self._worker_pid = None
+
+    def _wait_for_worker(self, timeout):
+        """
+        Wait up to `timeout` seconds for every event taken from the queue to
+        be sent, like Queue.join with a timeout
+        """
+        deadline = time.time() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    log.warning('Gave up waiting for %d events to be sent', self._queue.unfinished_tasks)
+                    return
+                self._queue.all_tasks_done.wait(remaining)
+
+    def _worker_running(self):
+        """Return whether the background thread is running in this process"""
+        return self._worker_pid == os.getpid() and self._worker.is_alive()
+
+    def _run(self):
+        """Send the queued events in batches, forever"""
+        while True:
+            self._send_batch(self._take(self.flush_size, block=True))
+
+    def _take(self, count, block):
+        """
+        Return up to `count` events from the queue.
+
+        If `block`, wait for a first event, then for more until `flush_interval`
+        seconds later.
+        """
+        events = []
+        if block:
+            events.append(self._queue.get())
+            deadline = time.time() + self.flush_interval
+
+        while len(events) < count:
+            try:
+                if block:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    events.append(self._queue.get(timeout=remaining))
+                else:
+                    events.append(self._queue.get_nowait())
+            except Empty:
+                break
+        return events
+
+    def _send_batch(self, events):
+        """Send events to the backend, and mark them done in the queue"""
+        if not events:
+            return
+        try:
+            with dog_stats_api.timer('track.buffered.send_many'):
+                self.backend.send_many(events)
+            dog_stats_api.histogram('track.buffered.batch_size', len(events))
+        except Exception:  # pylint: disable=broad-except
+            # Don't let one bad batch stop the thread
+            log.exception('Error sending %d events to %r', len(events), self.backend)
+        finally:
+            for _ in events:
+                self._queue.task_done()
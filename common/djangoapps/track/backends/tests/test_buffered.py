@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+
+import os
+import threading
+
+from mock import patch
+
+from django.test import TestCase
+
+from track.backends import BaseBackend
+from track.backends.buffered import BufferedBackend
+
+
+class InMemoryBackend(BaseBackend):
+    """Backend keeping the batches it was sent"""
+    def __init__(self, **kwargs):
+        super(InMemoryBackend, self).__init__(**kwargs)
+        self.batches = []
+
+    def send(self, event):
+        self.send_many([event])
+
+    def send_many(self, events):
+        self.batches.append(list(events))
+
+    @property
+    def events(self):
+        return [event for batch in self.batches for event in batch]
+
+
+class TestBufferedBackend(TestCase):
+    def setUp(self):
+        self.inner = InMemoryBackend()
+
+    def test_events_sent_in_batches(self):
+        backend = BufferedBackend(self.inner, flush_size=2, flush_interval=0.05)
+        events = [{'test': i} for i in range(5)]
+        for event in events:
+            backend.send(event)
+        backend.flush()
+
+        self.assertEqual(sorted(self.inner.events), events)
+        self.assertTrue(all(len(batch) <= 2 for batch in self.inner.batches))
+
+    def test_sent_from_background_thread(self):
+        sent = threading.Event()
+        sending_threads = []
+
+        def send_many(events):  # pylint: disable=unused-argument
+            sending_threads.append(threading.current_thread())
+            sent.set()
+        self.inner.send_many = send_many
+
+        backend = BufferedBackend(self.inner, flush_interval=0.01)
+        backend.send({'test': 1})
+        sent.wait(5)
+        self.assertTrue(sent.is_set())
+        self.assertNotIn(threading.current_thread(), sending_threads)
+
+    def test_full_queue_drops_events(self):
+        backend = BufferedBackend(self.inner, max_queue_size=2)
+        with patch.object(backend, '_ensure_worker'):
+            for i in range(3):
+                backend.send({'test': i})
+        self.assertEqual(backend.dropped, 1)
+
+        backend.flush()
+        self.assertEqual(self.inner.events, [{'test': 0}, {'test': 1}])
+
+    def test_flush_leaves_events_of_parent_process(self):
+        backend = BufferedBackend(self.inner)
+        with patch.object(backend, '_ensure_worker'):
+            backend.send({'test': 1})
+
+        # as if this process had been forked from the one which queued the event
+        backend._worker_pid = os.getpid() + 1  # pylint: disable=protected-access
+        backend.flush()
+        self.assertEqual(self.inner.events, [])
+
+        backend.send({'test': 2})
+        backend.flush()
+        self.assertEqual(self.inner.events, [{'test': 2}])
+
+    def test_flush_timeout(self):
+        sending = threading.Event()
+        done = threading.Event()
+
+        def send_many(events):  # pylint: disable=unused-argument
+            sending.set()
+            done.wait(5)
+        self.inner.send_many = send_many
+
+        backend = BufferedBackend(self.inner, flush_interval=0.01, flush_timeout=0.05)
+        backend.send({'test': 1})
+        sending.wait(5)
+        backend.flush()
+        # flush returned while the batch was still being sent
+        self.assertEqual(backend._queue.unfinished_tasks, 1)  # pylint: disable=protected-access
+        done.set()
+
+    def test_backend_errors_are_logged(self):
+        self.inner.send_many = lambda events: 1 / 0
+        backend = BufferedBackend(self.inner)
+        with patch('track.backends.buffered.log') as mock_log:
+            backend.send({'test': 1})
+            backend.flush()
+        self.assertTrue(mock_log.exception.called)
+
+    def test_backend_from_configuration(self):
+        backend = BufferedBackend({'ENGINE': 'track.backends.logger.LoggerBackend', 'OPTIONS': {'name': 'tracking'}})
+        self.assertEqual(type(backend.backend).__name__, 'LoggerBackend')
@@ -23,3 +23,16 @@ class TestDjangoBackend(TestCase):
 
         # Check if time is stored in UTC
         self.assertEqual(str(results[0].time), '2013-01-01 17:01:00+00:00')
+
+    def test_send_many(self):
+        events = [
+            {'username': 'test{}'.format(i), 'time': '2013-01-01T12:01:00-05:00'}
+            for i in range(3)
+        ]
+        with self.assertNumQueries(1):
+            self.backend.send_many(events)
+
+        self.assertEqual(
+            sorted(TrackingLog.objects.values_list('username', flat=True)),
+            ['test0', 'test1', 'test2']
+        )
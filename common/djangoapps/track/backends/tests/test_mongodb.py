@@ -38,3 +38,9 @@ class TestMongoBackend(TestCase):
 
         self.assertEqual(events[0], first_argument(calls[0]))
         self.assertEqual(events[1], first_argument(calls[1]))
+
+    def test_send_many(self):
+        events = [{'test': 1}, {'test': 2}]
+        self.backend.send_many(events)
+
+        self.backend.collection.insert.assert_called_once_with(events, manipulate=False)
@@ -9,6 +9,11 @@ from xmodule.course_module import CourseDescriptor
 COURSE_REGEX = re.compile(r'^.*?/courses/(?P<course_id>[^/]+/[^/]+/[^/]+)')
 log = logging.getLogger(__name__)
 
+# course_id -> context, for the course ids seen since the cache was last emptied
+_COURSE_CONTEXTS = {}
+# Course ids come from urls, so the cache is emptied whenever it holds this many
+COURSE_CONTEXTS_CACHE_SIZE = 1000
+
 
 def course_context_from_url(url):
     """
@@ -39,6 +44,21 @@ def course_context_from_course_id(course_id):
     """
 
     course_id = course_id or ''
+    context = _COURSE_CONTEXTS.get(course_id)
+    if context is None:
+        context = _course_context(course_id)
+        if len(_COURSE_CONTEXTS) >= COURSE_CONTEXTS_CACHE_SIZE:
+            _COURSE_CONTEXTS.clear()
+        _COURSE_CONTEXTS[course_id] = context
+
+    return dict(context)
+
+
+def _course_context(course_id):
+    """
+    Creates the course context of `course_id`, as described in
+    `course_context_from_course_id()`.
+    """
     context = {
         'course_id': course_id,
         'org_id': ''
@@ -2,6 +2,8 @@ import json
 import re
 import logging
 
+from dogapi import dog_stats_api
+
 from django.conf import settings
 
 from track import views
@@ -13,6 +15,27 @@ log = logging.getLogger(__name__)
 
 CONTEXT_NAME = 'edx.request'
 
+# (TRACKING_IGNORE_URL_PATTERNS, a compiled regex matching any of them)
+_IGNORED_URLS_REGEX = (None, None)
+
+
+def _ignored_urls_regex():
+    """
+    Return a compiled regex matching the urls that aren't tracked, compiling
+    it again only when TRACKING_IGNORE_URL_PATTERNS changes.
+    """
+    global _IGNORED_URLS_REGEX  # pylint: disable=global-statement
+
+    patterns = tuple(getattr(settings, 'TRACKING_IGNORE_URL_PATTERNS', []))
+    cached_patterns, regex = _IGNORED_URLS_REGEX
+    if cached_patterns != patterns:
+        if patterns:
+            regex = re.compile('|'.join('(?:{})'.format(pattern) for pattern in patterns))
+        else:
+            regex = None
+        _IGNORED_URLS_REGEX = (patterns, regex)
+    return regex
+
 
 class TrackMiddleware(object):
     """
@@ -20,6 +43,7 @@ class TrackMiddleware(object):
     emitted events.
     """
 
+    @dog_stats_api.timed('track.middleware.process_request')
     def process_request(self, request):
         try:
             self.enter_request_context(request)
@@ -64,15 +88,8 @@ class TrackMiddleware(object):
 
     def should_process_request(self, request):
         """Don't track requests to the specified URL patterns"""
-        path = request.META['PATH_INFO']
-
-        ignored_url_patterns = getattr(settings, 'TRACKING_IGNORE_URL_PATTERNS', [])
-        for pattern in ignored_url_patterns:
-            # Note we are explicitly relying on python's internal caching of
-            # compiled regular expressions here.
-            if re.match(pattern, path):
-                return False
-        return True
+        regex = _ignored_urls_regex()
+        return regex is None or not regex.match(request.META['PATH_INFO'])
 
     def enter_request_context(self, request):
         """
@@ -80,7 +97,8 @@ class TrackMiddleware(object):
         context.
         """
         context = {}
-        context.update(contexts.course_context_from_url(request.build_absolute_uri()))
+        # The host can't contain a course id, so only look at the path
+        context.update(contexts.course_context_from_url(request.get_full_path()))
         try:
             context['user_id'] = request.user.pk
         except AttributeError:
@@ -93,6 +111,7 @@ class TrackMiddleware(object):
             context
         )
 
+    @dog_stats_api.timed('track.middleware.process_response')
     def process_response(self, request, response):  # pylint: disable=unused-argument
         """Exit the context if it exists."""
         try:
@@ -2,6 +2,8 @@
 
 from unittest import TestCase
 
+from mock import patch
+
 from track import contexts
 
 
@@ -42,3 +44,18 @@ class TestContexts(TestCase):
 
     def test_no_url(self):
         self.assert_empty_context_for_url(None)
+
+    def test_contexts_are_cached_copies(self):
+        url = 'http://foo.bar.com/courses/{course_id}/more/stuff'.format(course_id=self.COURSE_ID)
+        context = contexts.course_context_from_url(url)
+        context['org_id'] = 'changed'
+        with patch('track.contexts.CourseDescriptor') as mock_course_descriptor:
+            self.assertEquals(contexts.course_context_from_url(url)['org_id'], self.ORG_ID)
+        self.assertFalse(mock_course_descriptor.id_to_location.called)
+
+    @patch('track.contexts.COURSE_CONTEXTS_CACHE_SIZE', 2)
+    def test_cache_emptied_when_full(self):
+        with patch.dict('track.contexts._COURSE_CONTEXTS', clear=True):
+            for run in ('run_1', 'run_2', 'run_3'):
+                contexts.course_context_from_course_id('test/course_name/' + run)
+            self.assertEquals(contexts._COURSE_CONTEXTS.keys(), ['test/course_name/run_3'])
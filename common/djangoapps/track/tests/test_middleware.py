@@ -50,6 +50,17 @@ class TrackMiddlewareTestCase(TestCase):
         self.track_middleware.process_request(request)
         self.assertFalse(self.mock_server_track.called)
 
+    @override_settings(TRACKING_IGNORE_URL_PATTERNS=[r'^/first', r'/second$'])
+    def test_any_pattern_filters(self):
+        for url in ['/first/url', '/second']:
+            request = self.request_factory.get(url)
+            self.track_middleware.process_request(request)
+            self.assertFalse(self.mock_server_track.called)
+
+        request = self.request_factory.get('/third/second')
+        self.track_middleware.process_request(request)
+        self.assertTrue(self.mock_server_track.called)
+
     def test_request_in_course_context(self):
         request = self.request_factory.get('/courses/test_org/test_course/test_run/foo')
         self.track_middleware.process_request(request)
@@ -34,11 +34,7 @@ def user_track(request):
     except:
         username = "anonymous"
 
-    try:
-        scookie = request.META['HTTP_COOKIE']  # Get cookies
-        scookie = ";".join([c.split('=')[1] for c in scookie.split(";") if "sessionid" in c]).strip()  # Extract session ID
-    except:
-        scookie = ""
+    scookie = request.COOKIES.get('sessionid', '')  # Get session ID
 
     try:
         agent = request.META['HTTP_USER_AGENT']
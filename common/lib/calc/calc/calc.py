@@ -7,6 +7,9 @@ Uses pyparsing to parse. Main function as of now is evaluator().
 import math
 import operator
 import numbers
+import threading
+from collections import OrderedDict
+
 import numpy
 import scipy.constants
 import functions
@@ -50,6 +53,13 @@ DEFAULT_FUNCTIONS = {
     'arccsch': functions.arccsch,
     'arccoth': functions.arccoth
 }
+# Default functions which can be applied to a whole array of values at once;
+# the others (and user-defined functions) are applied to each value in turn.
+VECTORIZED_FUNCTIONS = set(
+    func for func in DEFAULT_FUNCTIONS.itervalues()
+    if func not in (math.factorial, functions.arccot)
+)
+
 DEFAULT_VARIABLES = {
     'i': numpy.complex(0, 1),
     'j': numpy.complex(0, 1),
@@ -228,85 +238,291 @@ def evaluator(variables, functions, math_expr, case_sensitive=False):
     if math_expr.strip() == "":
         return float('nan')
 
-    # Parse the tree.
-    math_interpreter = ParseAugmenter(math_expr, case_sensitive)
-    math_interpreter.parse_algebra()
+    return compile_expression(math_expr, case_sensitive).evaluate(variables, functions)
 
-    # Get our variables together.
-    all_variables, all_functions = add_defaults(variables, functions, case_sensitive)
 
-    # ...and check them
-    math_interpreter.check_variables(all_variables, all_functions)
+def evaluator_samples(samples, functions, math_expr, case_sensitive=False):
+    """
+    Evaluate an expression for each dict of variables in `samples`; return
+    the list of values `evaluator` would return for each.
 
-    # Create a recursion to evaluate the tree.
-    if case_sensitive:
-        casify = lambda x: x
-    else:
-        casify = lambda x: x.lower()  # Lowercase for case insens.
+    The samples are evaluated together, with arrays of values for each
+    variable, when they all define the same variables.
+    """
+    # No need to go further.
+    if math_expr.strip() == "":
+        return [float('nan')] * len(samples)
 
-    evaluate_actions = {
-        'number': eval_number,
-        'variable': lambda x: all_variables[casify(x[0])],
-        'function': lambda x: all_functions[casify(x[0])](x[1]),
-        'atom': eval_atom,
-        'power': eval_power,
-        'parallel': eval_parallel,
-        'product': eval_product,
-        'sum': eval_sum
-    }
+    compiled = compile_expression(math_expr, case_sensitive)
 
-    return math_interpreter.reduce_tree(evaluate_actions)
+    names = set(samples[0]) if samples else set()
+    if any(set(sample) != names for sample in samples):
+        return [compiled.evaluate(sample, functions) for sample in samples]
 
+    arrays = dict((name, [sample[name] for sample in samples]) for name in names)
+    return compiled.evaluate_arrays(arrays, functions, len(samples))
 
-class ParseAugmenter(object):
+
+def apply_each(func):
     """
-    Holds the data for a particular parse.
+    Return a version of the unary function `func` which, given an array,
+    applies `func` to each of its values.
+    """
+    def apply_to_values(values):
+        """
+        Apply `func` to `values`, or to each of them if it's an array.
+        """
+        if numpy.ndim(values) == 0:
+            return func(values)
+        return numpy.array([func(value) for value in values])
+    return apply_to_values
 
-    Retains the `math_expr` and `case_sensitive` so they needn't be passed
-    around method to method.
-    Eventually holds the parse tree and sets of variables as well.
+
+# Maximum number of compiled expressions kept by `compile_expression`
+COMPILED_CACHE_SIZE = 1000
+
+_COMPILED_CACHE = OrderedDict()
+_COMPILED_CACHE_LOCK = threading.Lock()
+
+
+def compile_expression(math_expr, case_sensitive=False):
+    """
+    Return the `CompiledExpression` for `math_expr`.
+
+    The most recently used `COMPILED_CACHE_SIZE` compiled expressions are
+    kept, so that evaluating the same expression again (e.g. against other
+    variable values) doesn't parse it again.
+    """
+    key = (math_expr, case_sensitive)
+    with _COMPILED_CACHE_LOCK:
+        compiled = _COMPILED_CACHE.pop(key, None)
+        if compiled is not None:
+            _COMPILED_CACHE[key] = compiled
+            return compiled
+
+    # Parse outside the lock; errors propagate and aren't cached.
+    compiled = CompiledExpression(math_expr, case_sensitive)
+
+    with _COMPILED_CACHE_LOCK:
+        _COMPILED_CACHE[key] = compiled
+        while len(_COMPILED_CACHE) > COMPILED_CACHE_SIZE:
+            _COMPILED_CACHE.popitem(last=False)
+    return compiled
+
+
+class CompiledExpression(object):
+    """
+    A math expression parsed once into a tree of closures, which can then be
+    evaluated many times against different variables and functions.
+
+    Each closure takes the dicts of (casified) variables and functions and
+    returns the value of its node, computed as the `eval_*` function for that
+    kind of node would from the values of its children.
     """
     def __init__(self, math_expr, case_sensitive=False):
         """
-        Create the ParseAugmenter for a given math expression string.
+        Parse `math_expr` and compile it.
 
-        Do the parsing later, when called like `OBJ.parse_algebra()`.
+        Raise a `pyparsing.ParseException` if it can't be parsed.
         """
-        self.case_sensitive = case_sensitive
         self.math_expr = math_expr
-        self.tree = None
-        self.variables_used = set()
-        self.functions_used = set()
+        self.case_sensitive = case_sensitive
 
-        def vpa(tokens):
-            """
-            When a variable is recognized, store it in `variables_used`.
-            """
-            varname = tokens[0][0]
-            self.variables_used.add(varname)
+        parser = ParseAugmenter(math_expr, case_sensitive)
+        parser.parse_algebra()
+        self.parser = parser
+        self.variables_used = parser.variables_used
+        self.functions_used = parser.functions_used
 
-        def fpa(tokens):
-            """
-            When a function is recognized, store it in `functions_used`.
-            """
-            varname = tokens[0][0]
-            self.functions_used.add(varname)
+        if case_sensitive:
+            self.casify = lambda x: x
+        else:
+            self.casify = lambda x: x.lower()  # Lowercase for case insens.
 
-        self.variable_parse_action = vpa
-        self.function_parse_action = fpa
+        self.compiled = self.compile_node(parser.tree)
 
-    def parse_algebra(self):
+    def evaluate(self, variables, functions):
         """
-        Parse an algebraic expression into a tree.
+        Return the value of the expression with the given variables and
+        functions (on top of the default ones).
 
-        Store a `pyparsing.ParseResult` in `self.tree` with proper groupings to
-        reflect parenthesis and order of operations. Leave all operators in the
-        tree and do not parse any strings of numbers into their float versions.
+        Raise an `UndefinedVariable` if it uses any variable or function not
+        defined there.
+        """
+        all_variables, all_functions = add_defaults(variables, functions, self.case_sensitive)
+        self.parser.check_variables(all_variables, all_functions)
+        return self.compiled(all_variables, all_functions)
 
-        Adding the groups and result names makes the `repr()` of the result
-        really gross. For debugging, use something like
-          print OBJ.tree.asXML()
+    def evaluate_arrays(self, arrays, functions, count):
+        """
+        Return the list of the `count` values of the expression when the
+        variables take each of the values in their lists in turn. `arrays`
+        maps variable names to lists of `count` values.
+
+        Try computing them all at once with numpy arrays. If that fails or
+        gives any infinite or NaN value, evaluate the expression for each set
+        of values instead, so that errors and special values are exactly
+        those `evaluate` gives.
+        """
+        all_variables, all_functions = add_defaults(arrays, functions, self.case_sensitive)
+        self.parser.check_variables(all_variables, all_functions)
+
+        try:
+            with numpy.errstate(all='ignore'):
+                values = self.compiled(
+                    dict(
+                        (name, numpy.array(value) if isinstance(value, (list, tuple)) else value)
+                        for name, value in all_variables.iteritems()
+                    ),
+                    dict(
+                        (name, func if func in VECTORIZED_FUNCTIONS else apply_each(func))
+                        for name, func in all_functions.iteritems()
+                    ),
+                )
+                values = numpy.asarray(values)
+                if values.ndim == 0:
+                    values = numpy.repeat(values, count)
+                if values.shape == (count,) and numpy.all(numpy.isfinite(values)):
+                    return values.tolist()
+        except Exception:  # pylint: disable=broad-except
+            pass
+
+        samples = [{} for _ in xrange(count)]
+        for name, values in arrays.iteritems():
+            for sample, value in zip(samples, values):
+                sample[name] = value
+        return [self.evaluate(sample, functions) for sample in samples]
+
+    def compile_node(self, node):
+        """
+        Return the closure computing the value of the parse tree `node`.
+        """
+        return getattr(self, 'compile_' + node.getName())(node)
+
+    def compile_children(self, node):
+        """
+        Return the closures of the children of `node` which are nodes
+        themselves, skipping the terminal (operator and parenthesis) tokens.
+        """
+        return [self.compile_node(kid) for kid in node if isinstance(kid, ParseResults)]
+
+    def compile_number(self, node):
+        """
+        Numbers don't depend on anything: compute them now.
+        """
+        value = eval_number(list(node))
+        return lambda variables, functions: value
+
+    def compile_variable(self, node):
+        """
+        Look up the variable when evaluated.
+        """
+        name = self.casify(node[0])
+        return lambda variables, functions: variables[name]
+
+    def compile_function(self, node):
+        """
+        Look up the function and call it on its argument when evaluated.
         """
+        name = self.casify(node[0])
+        argument = self.compile_node(node[1])
+        return lambda variables, functions: functions[name](argument(variables, functions))
+
+    def compile_atom(self, node):
+        """
+        Atoms just wrap a number, variable, function or parenthesized
+        expression (like `eval_atom`).
+        """
+        return self.compile_children(node)[0]
+
+    def compile_power(self, node):
+        """
+        See `eval_power`.
+        """
+        kids = self.compile_children(node)
+        if len(kids) == 1:
+            return kids[0]
+
+        def power(variables, functions):
+            """Exponentiate the children, right to left"""
+            values = reversed([kid(variables, functions) for kid in kids])
+            return reduce(lambda a, b: b ** a, values)
+        return power
+
+    def compile_parallel(self, node):
+        """
+        See `eval_parallel`.
+        """
+        kids = self.compile_children(node)
+        if len(kids) == 1:
+            return kids[0]
+
+        def parallel(variables, functions):
+            """Combine the children like parallel resistors"""
+            values = [kid(variables, functions) for kid in kids]
+            if any(numpy.ndim(value) for value in values):
+                # Arrays of values: NaN wherever one of them is 0
+                zero = reduce(numpy.logical_or, [numpy.equal(value, 0) for value in values])
+                return numpy.where(zero, float('nan'), 1. / sum(1. / value for value in values))
+            if 0 in values:
+                return float('nan')
+            return 1. / sum(1. / value for value in values)
+        return parallel
+
+    def compile_sum(self, node):
+        """
+        See `eval_sum`.
+        """
+        return self.compile_operations(node, 0.0, operator.add, {'+': operator.add, '-': operator.sub})
+
+    def compile_product(self, node):
+        """
+        See `eval_product`.
+        """
+        return self.compile_operations(node, 1.0, operator.mul, {'*': operator.mul, '/': operator.truediv})
+
+    def compile_operations(self, node, initial, current_op, operators):
+        """
+        Return a closure folding the children of `node` into `initial`, each
+        with the operator in `operators` preceding it (`current_op` if none).
+        """
+        steps = []
+        for kid in node:
+            if isinstance(kid, ParseResults):
+                steps.append((current_op, self.compile_node(kid)))
+            else:
+                current_op = operators[kid]
+
+        def operations(variables, functions):
+            """Fold the children"""
+            total = initial
+            for operation, kid in steps:
+                total = operation(total, kid(variables, functions))
+            return total
+        return operations
+
+
+_GRAMMAR = None
+_GRAMMAR_LOCK = threading.Lock()
+
+
+def algebra_grammar():
+    """
+    Return the pyparsing grammar of an algebraic expression, building it the
+    first time.
+
+    Parsing with it gives a tree with proper groupings to reflect parenthesis
+    and order of operations. It leaves all operators in the tree and doesn't
+    parse any strings of numbers into their float versions.
+    """
+    global _GRAMMAR  # pylint: disable=global-statement
+    if _GRAMMAR is not None:
+        return _GRAMMAR
+
+    with _GRAMMAR_LOCK:
+        if _GRAMMAR is not None:
+            return _GRAMMAR
+
         # 0.33 or 7 or .34 or 16.
         number_part = Word(nums)
         inner_number = (number_part + Optional("." + Optional(number_part))) | ("." + number_part)
@@ -333,11 +549,9 @@ class ParseAugmenter(object):
         # and may contain numbers afterward.
         inner_varname = Word(alphas + "_", alphanums + "_")
         varname = Group(inner_varname)("variable")
-        varname.setParseAction(self.variable_parse_action)
 
         # Same thing for functions.
         function = Group(inner_varname + Suppress("(") + expr + Suppress(")"))("function")
-        function.setParseAction(self.function_parse_action)
 
         atom = number | function | varname | "(" + expr + ")"
         atom = Group(atom)("atom")
@@ -357,7 +571,62 @@ class ParseAugmenter(object):
 
         # Finish the recursion.
         expr << sum_term  # pylint: disable=W0104
-        self.tree = (expr + stringEnd).parseString(self.math_expr)[0]
+        grammar = expr + stringEnd
+        grammar.streamline()
+        _GRAMMAR = grammar
+    return _GRAMMAR
+
+
+class ParseAugmenter(object):
+    """
+    Holds the data for a particular parse.
+
+    Retains the `math_expr` and `case_sensitive` so they needn't be passed
+    around method to method.
+    Eventually holds the parse tree and sets of variables as well.
+    """
+    def __init__(self, math_expr, case_sensitive=False):
+        """
+        Create the ParseAugmenter for a given math expression string.
+
+        Do the parsing later, when called like `OBJ.parse_algebra()`.
+        """
+        self.case_sensitive = case_sensitive
+        self.math_expr = math_expr
+        self.tree = None
+        self.variables_used = set()
+        self.functions_used = set()
+
+    def parse_algebra(self):
+        """
+        Parse an algebraic expression into a tree.
+
+        Store a `pyparsing.ParseResult` in `self.tree` with proper groupings to
+        reflect parenthesis and order of operations. Leave all operators in the
+        tree and do not parse any strings of numbers into their float versions.
+        Store the names of the variables and functions it uses in
+        `self.variables_used` and `self.functions_used`.
+
+        Adding the groups and result names makes the `repr()` of the result
+        really gross. For debugging, use something like
+          print OBJ.tree.asXML()
+        """
+        self.tree = algebra_grammar().parseString(self.math_expr)[0]
+
+        def find_names(node):
+            """
+            Add the variables and functions used in `node` to the sets.
+            """
+            node_name = node.getName()
+            if node_name == 'variable':
+                self.variables_used.add(node[0])
+            elif node_name == 'function':
+                self.functions_used.add(node[0])
+            for kid in node:
+                if isinstance(kid, ParseResults):
+                    find_names(kid)
+
+        find_names(self.tree)
 
     def reduce_tree(self, handle_actions, terminal_converter=None):
         """
@@ -5,6 +5,7 @@ Unit tests for calc.py
 import unittest
 import numpy
 import calc
+from mock import patch
 from pyparsing import ParseException
 
 # numpy's default behavior when it evaluates a function outside its domain
@@ -558,3 +559,141 @@ class EvaluatorTest(unittest.TestCase):
             calc.evaluator({'r1': 5}, {}, "r1+r2")
         with self.assertRaisesRegexp(calc.UndefinedVariable, 'r1 r3'):
             calc.evaluator(variables, {}, "r1*r3", case_sensitive=True)
+
+
+class CompiledExpressionTest(unittest.TestCase):
+    """
+    Test that expressions are parsed once and can then be evaluated many times
+    """
+    # Expressions from the EvaluatorTest cases above
+    EXPRESSIONS = [
+        '13', '-.618033989', '4.', '1.6e-19', '5.4k', '1+1', '4-1', '2*2', '1/2', '2^3',
+        '1||1||2', 'j||1', 'sin(x)', 'sec(x)', 'arcsinh(x)', 'sqrt(x)', 'fact(3)', 'abs(-x)',
+        'e^(j*pi)', '(x^2 + 1) * sin(2*pi*x) / (1 + exp(-x))', '-x^2 + 3*x - 1||x',
+        'R1*R2 + r3/(x+1)', 'f(x) + F(x^2)',
+    ]
+
+    def setUp(self):
+        self.variables = {'x': 0.5, 'R1': 2.0, 'R2': 3.0, 'r3': 4.0}
+        self.functions = {'f': lambda x: x, 'F': lambda x: x + 1}
+
+    def test_compile_is_cached(self):
+        compiled = calc.compile_expression('x^2 + 1')
+        self.assertIs(compiled, calc.compile_expression('x^2 + 1'))
+        self.assertIsNot(compiled, calc.compile_expression('x^2 + 1', case_sensitive=True))
+
+    def test_evaluate_with_other_variables(self):
+        compiled = calc.compile_expression('x^2 + 1')
+        self.assertEqual(compiled.variables_used, set(['x']))
+        self.assertEqual(compiled.evaluate({'x': 2}, {}), 5.0)
+        self.assertEqual(compiled.evaluate({'x': 3}, {}), 10.0)
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'x'):
+            compiled.evaluate({}, {})
+
+    def test_parse_errors_are_not_cached(self):
+        with self.assertRaises(ParseException):
+            calc.compile_expression('1+.')
+        with self.assertRaises(ParseException):
+            calc.compile_expression('1+.')
+
+    @patch.object(calc.calc, 'COMPILED_CACHE_SIZE', 3)
+    def test_cache_size(self):
+        first = calc.compile_expression('x+1')
+        for expr in ('x+2', 'x+3'):
+            calc.compile_expression(expr)
+        self.assertIs(first, calc.compile_expression('x+1'))
+        # Pushes out 'x+2', the least recently used
+        calc.compile_expression('x+4')
+        self.assertIs(first, calc.compile_expression('x+1'))
+        self.assertEqual(len(calc.calc._COMPILED_CACHE), 3)  # pylint: disable=protected-access
+
+    def test_same_values_as_tree(self):
+        for expr in self.EXPRESSIONS:
+            compiled = calc.compile_expression(expr, case_sensitive=True)
+            interpreter = calc.ParseAugmenter(expr, case_sensitive=True)
+            interpreter.parse_algebra()
+            self.assertEqual(compiled.variables_used, interpreter.variables_used)
+            self.assertEqual(compiled.functions_used, interpreter.functions_used)
+            self.assertEqual(
+                repr(calc.evaluator(self.variables, self.functions, expr, case_sensitive=True)),
+                repr(compiled.evaluate(self.variables, self.functions)),
+            )
+
+    def test_parsed_once(self):
+        parse_algebra = calc.ParseAugmenter.parse_algebra
+        with patch.dict(calc.calc._COMPILED_CACHE, clear=True):  # pylint: disable=protected-access
+            with patch.object(calc.ParseAugmenter, 'parse_algebra', autospec=True, side_effect=parse_algebra) as mock_parse:
+                for _ in xrange(10):
+                    for expr in self.EXPRESSIONS:
+                        calc.evaluator(self.variables, self.functions, expr, case_sensitive=True)
+        self.assertEqual(mock_parse.call_count, len(self.EXPRESSIONS))
+
+
+class EvaluatorSamplesTest(unittest.TestCase):
+    """
+    Test evaluating expressions for many samples at once
+    """
+    EXPRESSIONS = CompiledExpressionTest.EXPRESSIONS + [
+        'x||y', '0||x', 'fact(n)', 'arccot(x - y)', 'ln(x)', '1/(x-y)', 'f(x) + F(y)',
+    ]
+
+    def setUp(self):
+        # Python floats, like the samples FormulaResponse makes: with numpy
+        # floats, the scalar evaluator gives inf instead of raising
+        # ZeroDivisionError
+        self.samples = [
+            {'x': x, 'y': x - 1.0, 'n': float(n % 5), 'R1': 2.0, 'R2': x * 3, 'r3': 4.0}
+            for n, x in enumerate(float(x) for x in numpy.linspace(-2.0, 2.0, 50))
+        ]
+        self.functions = {'f': lambda x: x, 'F': lambda x: x + 1}
+
+    def assert_same_values(self, expr):
+        """
+        Check that evaluating `expr` for all samples gives what evaluating
+        it for each does.
+        """
+        expected = [
+            calc.evaluator(sample, self.functions, expr, case_sensitive=True)
+            for sample in self.samples
+        ]
+        values = calc.evaluator_samples(self.samples, self.functions, expr, case_sensitive=True)
+        self.assertEqual(len(expected), len(values))
+        for value, expected_value in zip(values, expected):
+            if numpy.isnan(expected_value):
+                self.assertTrue(numpy.isnan(value), msg=expr)
+            else:
+                self.assertAlmostEqual(expected_value, value, msg=expr)
+
+    def test_same_values(self):
+        for expr in self.EXPRESSIONS:
+            self.assert_same_values(expr)
+
+    def test_empty(self):
+        values = calc.evaluator_samples(self.samples, {}, '')
+        self.assertTrue(all(numpy.isnan(value) for value in values))
+
+    def test_errors(self):
+        with self.assertRaises(ZeroDivisionError):
+            calc.evaluator_samples(self.samples, {}, '1/(x-x)')
+        with self.assertRaisesRegexp(ValueError, 'factorial'):
+            calc.evaluator_samples(self.samples, {}, 'fact(x)')
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'z'):
+            calc.evaluator_samples(self.samples, {}, 'x+z')
+
+    def test_vectorized(self):
+        compiled = calc.compile_expression('sin(x)^2 + x||y')
+        with patch.object(compiled, 'evaluate') as mock_evaluate:
+            values = compiled.evaluate_arrays({'x': [1.0, 2.0], 'y': [3.0, 4.0]}, {}, 2)
+        self.assertFalse(mock_evaluate.called)
+        self.assertAlmostEqual(values[1], calc.evaluator({'x': 2.0, 'y': 4.0}, {}, 'sin(x)^2 + x||y'))
+
+    def test_different_variables(self):
+        samples = [{'x': 1.0}, {'x': 2.0, 'y': 3.0}]
+        self.assertEqual(calc.evaluator_samples(samples, {}, 'x+1'), [2.0, 3.0])
+
+    def test_samples_evaluated_together(self):
+        expr = '(x^2 + 1) * sin(2*pi*x) / (1 + exp(-y)) + x||r3'
+        with patch.object(calc.calc.CompiledExpression, 'evaluate') as mock_evaluate:
+            values = calc.evaluator_samples(self.samples, {}, expr)
+        self.assertFalse(mock_evaluate.called)
+        self.assertEqual(len(values), len(self.samples))
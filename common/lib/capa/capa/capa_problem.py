@@ -13,10 +13,13 @@ Main module which shows problems (of "capa" type).
 This is used by capa_module.
 '''
 
+from collections import OrderedDict
 from datetime import datetime
+import hashlib
 import logging
 import os.path
 import re
+import threading
 
 from lxml import etree
 from xml.sax.saxutils import unescape
@@ -32,6 +35,7 @@ import capa.xqueue_interface as xqueue_interface
 import capa.responsetypes as responsetypes
 from capa.safe_exec import safe_exec
 
+from dogapi import dog_stats_api
 from pytz import UTC
 
 # dict of tagname, Response Class -- this should come from auto-registering
@@ -63,6 +67,88 @@ html_problem_semantics = [
 
 log = logging.getLogger(__name__)
 
+
+class ProblemDataCache(object):
+    """
+    Cache of data computed for problems, e.g. the contexts resulting from
+    running their scripts.
+
+    The most recently used `size` values are kept in this process, and all
+    of them in the shared cache passed to `get` and `set`, if any.  Values
+    are copied in and out, since problems modify them.
+
+    `hits`, `shared_hits` and `misses` count the lookups found in this
+    process, found in the shared cache, and not found; they're also sent to
+    datadog as `metric`.
+    """
+    def __init__(self, metric, size=500):
+        self.metric = metric
+        self.size = size
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._values = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, shared_cache=None):
+        """
+        Return a copy of the value cached for `key`, or None.
+        """
+        with self._lock:
+            value = self._values.pop(key, None)
+            if value is not None:
+                self._values[key] = value
+
+        if value is not None:
+            self.hits += 1
+            dog_stats_api.increment(self.metric, tags=['result:hit'])
+        elif shared_cache:
+            value = shared_cache.get(key)
+            if value is not None:
+                self.shared_hits += 1
+                dog_stats_api.increment(self.metric, tags=['result:shared_hit'])
+                self._remember(key, value)
+
+        if value is None:
+            self.misses += 1
+            dog_stats_api.increment(self.metric, tags=['result:miss'])
+            return None
+        return deepcopy(value)
+
+    def set(self, key, value, shared_cache=None):
+        """
+        Cache a copy of `value` for `key`.
+        """
+        self._remember(key, deepcopy(value))
+        if shared_cache:
+            shared_cache.set(key, value)
+
+    def clear(self):
+        """
+        Forget the values kept in this process, and reset the counts.
+        """
+        with self._lock:
+            self._values.clear()
+        self.hits = self.shared_hits = self.misses = 0
+
+    def _remember(self, key, value):
+        """
+        Keep `value` in this process, forgetting the least recently used
+        values beyond `size`.
+        """
+        with self._lock:
+            self._values.pop(key, None)
+            self._values[key] = value
+            while len(self._values) > self.size:
+                self._values.popitem(last=False)
+
+
+# Contexts of the problems' scripts, by script, seed and python path.
+EXECUTED_CONTEXT_CACHE = ProblemDataCache('capa.executed_context_cache')
+
+# Parsed problem XML, with includes and IDs, by problem definition.
+PROBLEM_TEMPLATE_CACHE = ProblemDataCache('capa.problem_template_cache')
+
 #-----------------------------------------------------------------------------
 # main class for this module
 
@@ -113,22 +199,14 @@ class LoncapaProblem(object):
         self.done = state.get('done', False)
         self.input_state = state.get('input_state', {})
 
-        # Convert startouttext and endouttext to proper <text></text>
-        problem_text = re.sub(r"startouttext\s*/", "text", problem_text)
-        problem_text = re.sub(r"endouttext\s*/", "/text", problem_text)
-        self.problem_text = problem_text
-
-        # parse problem XML file into an element tree
-        self.tree = etree.XML(problem_text)
-
-        # handle any <include file="foo"> tags
-        self._process_includes()
+        # Parse the problem XML, with its includes and IDs, into an element tree
+        self.problem_text, self.tree = self._parse_problem(problem_text)
 
         # construct script processor context (eg for customresponse problems)
         self.context = self._extract_context(self.tree)
 
-        # Pre-parse the XML tree: modifies it to add ID's and perform some in-place
-        # transformations.  This also creates the dict (self.responders) of Response
+        # Pre-parse the XML tree: perform some in-place transformations.
+        # This also creates the dict (self.responders) of Response
         # instances for each question in the problem. The dict has keys = xml subtree of
         # Response, values = Response instance
         self._preprocess_problem(self.tree)
@@ -406,15 +484,77 @@ class LoncapaProblem(object):
 
     # ======= Private Methods Below ========
 
-    def _process_includes(self):
+    def _parse_problem(self, problem_text):
+        """
+        Return the problem text, with startouttext and endouttext converted, and
+        its XML tree, with its includes and IDs.
+
+        This doesn't depend on the seed, so it is done once per problem
+        definition in this process, and each problem gets its own copy.  The
+        copy is only used as long as the included files haven't changed.
+        """
+        md5er = hashlib.md5()
+        md5er.update(repr((
+            problem_text,
+            self.problem_id,
+            getattr(self.system.filestore, 'root_path', None),
+            bool(self.system.get('DEBUG')),
+        )))
+        cache_key = "capa.problem_template.%s" % md5er.hexdigest()
+
+        cached_template = PROBLEM_TEMPLATE_CACHE.get(cache_key)
+        if cached_template is not None:
+            cached_text, cached_tree, included = cached_template
+            if all(self._include_version(filename) == version for filename, version in included):
+                return cached_text, cached_tree
+
+        # Convert startouttext and endouttext to proper <text></text>
+        problem_text = re.sub(r"startouttext\s*/", "text", problem_text)
+        problem_text = re.sub(r"endouttext\s*/", "/text", problem_text)
+
+        # parse problem XML file into an element tree
+        tree = etree.XML(problem_text)
+
+        # handle any <include file="foo"> tags
+        included = self._process_includes(tree)
+
+        # add ID's to the responses, their inputs and the solutions
+        self._assign_ids(tree)
+
+        # Don't keep a tree missing an include: the file may be fixed
+        if included is not None:
+            PROBLEM_TEMPLATE_CACHE.set(cache_key, (problem_text, tree, included))
+        return problem_text, tree
+
+    def _include_version(self, filename):
+        """
+        Return the (size, modification time) of the included file `filename`,
+        which change when it does, or None if the filestore can't tell.
+        """
+        try:
+            info = self.system.filestore.getinfo(filename)
+        except Exception:  # pylint: disable=broad-except
+            return None
+        version = (info.get('size'), info.get('modified_time'))
+        if version == (None, None):
+            return None
+        return version
+
+    def _process_includes(self, tree):
         '''
         Handle any <include file="foo"> tags by reading in the specified file and inserting it
         into our XML tree.  Fail gracefully if debugging.
+
+        Return a list of the (filename, version) of the files included (see
+        _include_version), or None if one of them couldn't be, or has no version.
         '''
-        includes = self.tree.findall('.//include')
+        included = []
+        includes = tree.findall('.//include')
         for inc in includes:
             filename = inc.get('file')
             if filename is not None:
+                # before reading, so a change made meanwhile isn't missed
+                version = self._include_version(filename)
                 try:
                     # open using ModuleSystem OSFS filestore
                     ifp = self.system.filestore.open(filename)
@@ -434,10 +574,12 @@ class LoncapaProblem(object):
                     if not self.system.get('DEBUG'):
                         raise
                     else:
+                        included = None
                         continue
                 try:
                     # read in and convert to XML
-                    incxml = etree.XML(ifp.read())
+                    contents = ifp.read()
+                    incxml = etree.XML(contents)
                 except Exception as err:
                     log.warning(
                         'Error %s in problem xml include: %s' % (
@@ -450,6 +592,7 @@ class LoncapaProblem(object):
                     if not self.system.get('DEBUG'):
                         raise
                     else:
+                        included = None
                         continue
 
                 # insert new XML into tree in place of include
@@ -457,6 +600,11 @@ class LoncapaProblem(object):
                 parent.insert(parent.index(inc), incxml)
                 parent.remove(inc)
                 log.debug('Included %s into %s' % (filename, self.problem_id))
+                if included is not None and version is not None:
+                    included.append((filename, version))
+                else:
+                    included = None
+        return included
 
     def _extract_system_path(self, script):
         """
@@ -525,20 +673,34 @@ class LoncapaProblem(object):
             all_code += code
 
         if all_code:
-            try:
-                safe_exec(
-                    all_code,
-                    context,
-                    random_seed=self.seed,
-                    python_path=python_path,
-                    cache=self.system.cache,
-                    slug=self.problem_id,
-                    unsafely=self.system.can_execute_unsafe_code(),
-                )
-            except Exception as err:
-                log.exception("Error while execing script code: " + all_code)
-                msg = "Error while executing script code: %s" % str(err).replace('<', '&lt;')
-                raise responsetypes.LoncapaProblemError(msg)
+            unsafely = self.system.can_execute_unsafe_code()
+
+            # The resulting context only depends on the code, the seed (the
+            # only thing in the initial context) and where the code runs, so
+            # reuse it if it's been computed before.
+            md5er = hashlib.md5()
+            md5er.update(repr((all_code, self.seed, python_path, unsafely)))
+            cache_key = "capa.executed_context.%s" % md5er.hexdigest()
+
+            cached_context = EXECUTED_CONTEXT_CACHE.get(cache_key, self.system.cache)
+            if cached_context is not None:
+                context = cached_context
+            else:
+                try:
+                    safe_exec(
+                        all_code,
+                        context,
+                        random_seed=self.seed,
+                        python_path=python_path,
+                        cache=self.system.cache,
+                        slug=self.problem_id,
+                        unsafely=unsafely,
+                    )
+                except Exception as err:
+                    log.exception("Error while execing script code: " + all_code)
+                    msg = "Error while executing script code: %s" % str(err).replace('<', '&lt;')
+                    raise responsetypes.LoncapaProblemError(msg)
+                EXECUTED_CONTEXT_CACHE.set(cache_key, context, self.system.cache)
 
         # Store code source in context, along with the Python path needed to run it correctly.
         context['script_code'] = all_code
@@ -639,19 +801,13 @@ class LoncapaProblem(object):
 
         return tree
 
-    def _preprocess_problem(self, tree):  # private
+    def _assign_ids(self, tree):  # private
         '''
         Assign IDs to all the responses
         Assign sub-IDs to all entries (textline, schematic, etc.)
-        Annoted correctness and value
         In-place transformation
-
-        Also create capa Response instances for each responsetype and save as self.responders
-
-        Obtain all responder answers and save as self.responder_answers dict (key = response)
         '''
         response_id = 1
-        self.responders = {}
         for response in tree.xpath('//' + "|//".join(response_tag_dict)):
             response_id_str = self.problem_id + "_" + str(response_id)
             # create and save ID for this response
@@ -659,19 +815,38 @@ class LoncapaProblem(object):
             response_id += 1
 
             answer_id = 1
-            input_tags = inputtypes.registry.registered_tags()
-            inputfields = tree.xpath(
-                "|".join(['//' + response.tag + '[@id=$id]//' + x for x in (input_tags + solution_tags)]),
-                id=response_id_str
-            )
-
             # assign one answer_id for each input type or solution type
-            for entry in inputfields:
+            for entry in self._response_inputfields(tree, response):
                 entry.attrib['response_id'] = str(response_id)
                 entry.attrib['answer_id'] = str(answer_id)
                 entry.attrib['id'] = "%s_%i_%i" % (self.problem_id, response_id, answer_id)
                 answer_id = answer_id + 1
 
+    def _response_inputfields(self, tree, response):  # private
+        '''
+        Return the input and solution elements of `response`, found by its ID.
+        '''
+        input_tags = inputtypes.registry.registered_tags()
+        return tree.xpath(
+            "|".join(['//' + response.tag + '[@id=$id]//' + x for x in (input_tags + solution_tags)]),
+            id=response.get('id')
+        )
+
+    def _preprocess_problem(self, tree):  # private
+        '''
+        Annoted correctness and value
+        Assign IDs to the solutions
+        In-place transformation
+
+        Create capa Response instances for each responsetype (whose IDs were
+        assigned by `_assign_ids`) and save as self.responders
+
+        Obtain all responder answers and save as self.responder_answers dict (key = response)
+        '''
+        self.responders = {}
+        for response in tree.xpath('//' + "|//".join(response_tag_dict)):
+            inputfields = self._response_inputfields(tree, response)
+
             # instantiate capa Response
             responder = response_tag_dict[response.tag](response, inputfields,
                                                         self.context, self.system)
@@ -0,0 +1,310 @@
+"""
+A pool of pre-started sandboxed Python processes to run capa code in.
+
+Starting the sandboxed Python and importing numpy and scipy in it for every
+execution is most of what running a problem's code costs.  The processes of a
+`SandboxPool` are started once, with those modules already imported, and run
+each execution they're sent in a child process they fork for it (see
+`pool_worker`).  They're replaced after a number of executions, or when they
+use too much memory.
+
+The processes run with the sandboxed Python CodeJail is configured with, and
+are started by each server process the first time it needs them, so nothing
+but the local machine is involved.
+
+A process runs the code of many problems and students, all as the sandbox
+user, as CodeJail runs each execution.  What a process adds is long-lived
+state shared by those executions, which `pool_worker` keeps them from
+reaching (see its docstring).  The pool is only used when CODE_JAIL["pool"]
+is set (see the README).
+"""
+
+import json
+import logging
+import os
+import os.path
+import select
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
+from Queue import Queue
+
+from codejail import jail_code
+from codejail.safe_exec import SafeExecException, json_safe
+from dogapi import dog_stats_api
+
+from . import pool_worker
+
+log = logging.getLogger(__name__)
+
+# The workers are run with `python -c`, so read their code now.
+pool_worker_py_file = pool_worker.__file__
+if pool_worker_py_file.endswith("c"):
+    pool_worker_py_file = pool_worker_py_file[:-1]
+
+POOL_WORKER_PY = open(pool_worker_py_file).read()
+
+# How many seconds a new worker has to import its modules.
+STARTUP_TIMEOUT = 60
+
+
+class SandboxWorker(object):
+    """
+    One process of a `SandboxPool`.
+    """
+    def __init__(self, cmdline, preloads, user=None):
+        self.process = subprocess.Popen(
+            cmdline + ["-E", "-B", "-c", POOL_WORKER_PY] + list(preloads),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=-1,
+            close_fds=True,
+            cwd=tempfile.gettempdir(),
+            env={},
+        )
+        # The user the worker runs as, if it's another one: its job
+        # processes can then only be killed as that user, with sudo.
+        self.user = user
+        # Number of jobs run, and the maximum resident set size (in kilobytes)
+        # after the last one.
+        self.jobs = 0
+        self.maxrss = 0
+        self.ready = False
+        # The pid of the process running the current job, which is also the
+        # id of its process group.
+        self.job_pid = None
+
+    def run(self, job, timeout=None):
+        """
+        Run `job` (see `pool_worker`) and return its result.
+
+        Raise a `SafeExecException` if the worker died or didn't answer
+        within `timeout` seconds, and kill it and the job's processes in the
+        latter case.
+        """
+        if not self.ready:
+            # The first job waits for the modules to be imported.
+            self.read_line(STARTUP_TIMEOUT)
+            self.ready = True
+
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except IOError:
+            raise SafeExecException("Couldn't execute jailed code: the sandbox process died")
+
+        self.job_pid = json.loads(self.read_line(timeout))["pid"]
+        result = json.loads(self.read_line(timeout))
+        self.job_pid = None
+        self.jobs += 1
+        self.maxrss = result["maxrss"]
+        return result
+
+    def read_line(self, timeout):
+        """
+        Return the next line the worker writes, waiting `timeout` seconds at most.
+        """
+        if timeout:
+            readable, _, _ = select.select([self.process.stdout], [], [], timeout)
+            if not readable:
+                self.kill()
+                raise SafeExecException("Couldn't execute jailed code: the sandbox process timed out")
+
+        line = self.process.stdout.readline()
+        if not line:
+            self.kill()
+            raise SafeExecException("Couldn't execute jailed code: the sandbox process died")
+        return line
+
+    def is_alive(self):
+        """
+        Return whether the worker is still running.
+        """
+        return self.process.poll() is None
+
+    def close(self):
+        """
+        Stop the worker once it's done with any job it's running.
+        """
+        self.process.stdin.close()
+        self.process.stdout.close()
+
+    def kill(self):
+        """
+        Stop the worker and the processes of the job it's running now.
+        """
+        if self.job_pid:
+            self.kill_job()
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+        self.close()
+        self.process.wait()
+
+    def kill_job(self):
+        """
+        Kill the process group of the job the worker is running.
+        """
+        log.warning("Killing the process group %d of a sandbox pool job", self.job_pid)
+        if self.user:
+            # The job runs as the sandbox user (see the README).  The pid
+            # comes from the worker, so never kill as anyone else.
+            subprocess.call(["sudo", "-u", self.user, "pkill", "-9", "-g", str(self.job_pid)])
+        else:
+            try:
+                os.killpg(self.job_pid, signal.SIGKILL)
+            except OSError:
+                pass
+        self.job_pid = None
+
+
+class SandboxPool(object):
+    """
+    A pool of `size` pre-started sandboxed Python processes.
+
+    Each process is replaced after running `max_jobs` jobs, or once its
+    resident set size exceeds `max_memory` bytes.
+
+    `cmdline` is the command starting the Python to use, by default the
+    sandboxed Python CodeJail is configured with.  `preloads` are the names of
+    the modules the processes import when they start.
+    """
+    def __init__(self, size, max_jobs=100, max_memory=None, cmdline=None, preloads=()):
+        self.size = size
+        self.max_jobs = max_jobs
+        self.max_memory = max_memory
+        self.cmdline = cmdline
+        self.preloads = preloads
+
+        self._idle = Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def safe_exec(self, code, globals_dict, python_path=None, slug=None):
+        """
+        Execute `code` with `globals_dict` in one of the pool's processes,
+        like `codejail.safe_exec.safe_exec` does in a new one.
+        """
+        tmpdir = tempfile.mkdtemp(prefix="codejail-")
+        try:
+            # The sandbox can only read from its temporary directory, so copy
+            # the Python path there.
+            os.chmod(tmpdir, 0775)
+            job_python_path = []
+            for pydir in python_path or ():
+                pybase = os.path.basename(pydir)
+                shutil.copytree(pydir, os.path.join(tmpdir, pybase))
+                job_python_path.append(pybase)
+
+            job = {
+                "code": code,
+                "globals": json_safe(globals_dict),
+                "tmpdir": tmpdir,
+                "python_path": job_python_path,
+                "limits": dict(jail_code.LIMITS),
+            }
+            realtime = jail_code.LIMITS.get("REALTIME")
+            # The worker enforces the limits itself; this is in case it can't.
+            timeout = realtime + 1 if realtime else None
+
+            worker = self._checkout()
+            start = time.time()
+            try:
+                result = worker.run(job, timeout)
+            finally:
+                dog_stats_api.histogram('capa.safe_exec.pool.exec_time', time.time() - start)
+                self._checkin(worker)
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+        if result["emsg"]:
+            log.debug("Error executing %s in the sandbox pool: %s", slug, result["emsg"])
+            raise SafeExecException("Couldn't execute jailed code: %s" % result["emsg"])
+        globals_dict.update(result["globals"])
+
+    def _checkout(self):
+        """
+        Return an idle worker, waiting for one if they're all busy.
+        """
+        self._ensure_started()
+        start = time.time()
+        worker = self._idle.get()
+        dog_stats_api.histogram('capa.safe_exec.pool.queue_wait', time.time() - start)
+        if worker is None:
+            # It couldn't be started before: try again.
+            try:
+                worker = self._start_worker()
+            except Exception:
+                self._idle.put(None)
+                raise
+        return worker
+
+    def _checkin(self, worker):
+        """
+        Make `worker` idle again, or replace it if it's time to.
+        """
+        if self._pid != os.getpid():
+            # The pool was restarted in a forked process meanwhile.
+            return
+
+        if not worker.is_alive():
+            reason = "died"
+        elif worker.jobs >= self.max_jobs:
+            reason = "jobs"
+        elif self.max_memory and worker.maxrss * 1024 > self.max_memory:
+            reason = "memory"
+        else:
+            reason = None
+
+        if reason:
+            dog_stats_api.increment('capa.safe_exec.pool.recycled', tags=['reason:{}'.format(reason)])
+            worker.close()
+            worker = self._try_start_worker()
+        self._idle.put(worker)
+
+    def _ensure_started(self):
+        """
+        Start the workers if they aren't running in this process (the
+        workers of a parent process can't be shared after forking, e.g. into
+        server workers).
+        """
+        if self._pid == os.getpid():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._idle = Queue()
+            for _ in xrange(self.size):
+                self._idle.put(self._try_start_worker())
+            self._pid = os.getpid()
+
+    def _try_start_worker(self):
+        """
+        Start a worker process, or return None if it can't be started (it
+        will be tried again when it's needed).
+        """
+        try:
+            return self._start_worker()
+        except Exception:  # pylint: disable=broad-except
+            log.exception("Couldn't start a sandbox pool process")
+            return None
+
+    def _start_worker(self):
+        """
+        Start a worker process.
+        """
+        cmdline = self.cmdline
+        user = None
+        if cmdline is None:
+            python = jail_code.COMMANDS["python"]
+            cmdline = list(python["cmdline_start"])
+            user = python.get("user")
+            if user:
+                cmdline = ["sudo", "-u", user] + cmdline
+        dog_stats_api.increment('capa.safe_exec.pool.started')
+        return SandboxWorker(cmdline, self.preloads, user)
@@ -0,0 +1,263 @@
+"""
+The code run by each process of a `SandboxPool`, in the sandboxed Python.
+
+It's run with `python -c`, so it can't import anything from capa: the
+sandboxed Python may only have the sandbox packages.  The names of the
+modules to import ahead of the jobs are its arguments.
+
+Once they're imported, the worker writes `{"ready": true}` to stdout.  It then
+reads jobs from stdin and writes to stdout, one JSON object per line, the pid
+of the process running each job as `{"pid": <pid>}`, then its result.  Each
+job is run in a child process forked for it, so that jobs can't see or change
+each other's state, but don't pay for starting Python and importing the modules
+again.  The child is the leader of a new session, and can't start processes of
+its own; in case it does anyway, its whole process group is killed once it's
+done or out of time.
+
+The jobs of every course run as the same user as the worker, so the worker
+makes itself non-dumpable before running any: jobs can then neither trace it
+nor reach its memory or file descriptors (e.g. the results stream) through
+/proc.  The worker doesn't start if it can't.
+
+A job is::
+
+    {
+        "code": <Python code to run>,
+        "globals": <JSON-safe globals to run it with>,
+        "tmpdir": <directory to run it in>,
+        "python_path": [<directories of tmpdir to add to sys.path>],
+        "limits": {"CPU": <seconds>, "REALTIME": <seconds>, "VMEM": <bytes>, "FSIZE": <bytes>},
+    }
+
+and its result::
+
+    {
+        "emsg": <error message, or null if the code ran fine>,
+        "globals": <JSON-safe globals after running the code>,
+        "maxrss": <maximum resident set size of the worker, in kilobytes>,
+    }
+
+"""
+
+import json
+import os
+import resource
+import select
+import signal
+import sys
+import time
+import traceback
+
+
+# Types of the globals that can be sent back, if they serialize.
+OK_TYPES = (type(None), int, long, float, str, unicode, list, tuple, dict)
+BAD_KEYS = ("__builtins__",)
+
+# Upper bound of the file descriptors a job's child process closes.
+try:
+    MAXFD = os.sysconf("SC_OPEN_MAX")
+except (AttributeError, ValueError):
+    MAXFD = 256
+
+# How often, in seconds, to check whether a job's process exited while other
+# processes may keep its output pipe open.
+POLL_INTERVAL = 0.1
+
+# From <linux/prctl.h>
+PR_SET_DUMPABLE = 4
+
+
+def json_safe(globals_dict):
+    """
+    Return the items of `globals_dict` which can be sent back as JSON.
+    """
+    safe = {}
+    for key, value in globals_dict.iteritems():
+        if key in BAD_KEYS or not isinstance(value, OK_TYPES):
+            continue
+        try:
+            json.dumps(value)
+        except Exception:  # pylint: disable=broad-except
+            continue
+        safe[key] = value
+    return safe
+
+
+def make_undumpable():
+    """
+    Make this process, and the processes it forks, non-dumpable, so that other
+    processes of the same user can't ptrace them or open their /proc files.
+    """
+    import ctypes
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.prctl(PR_SET_DUMPABLE, 0, 0, 0, 0) != 0:
+        errno = ctypes.get_errno()
+        raise OSError(errno, "prctl(PR_SET_DUMPABLE): {}".format(os.strerror(errno)))
+
+
+def vm_size():
+    """
+    Return the size of this process' address space, in bytes.
+    """
+    with open("/proc/self/statm") as statm:
+        return int(statm.read().split()[0]) * resource.getpagesize()
+
+
+def set_limits(limits):
+    """
+    Apply the job's resource limits to this (child) process.
+
+    Memory is limited to `VMEM` bytes more than the worker already uses, since
+    the child starts with the worker's imported modules.  The worker enforces
+    `REALTIME` (see `wait_job`).
+    """
+    # No subprocesses.
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+    # Size of written files: by default, nothing can be written.
+    fsize = limits.get("FSIZE", 0)
+    resource.setrlimit(resource.RLIMIT_FSIZE, (fsize, fsize))
+    if limits.get("CPU"):
+        cpu = int(sum(os.times()[:2])) + limits["CPU"]
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu))
+    if limits.get("VMEM"):
+        vmem = vm_size() + limits["VMEM"]
+        resource.setrlimit(resource.RLIMIT_AS, (vmem, vmem))
+
+
+def run_job(job):
+    """
+    Run the job's code, and return its result.
+    """
+    globals_dict = job["globals"]
+    try:
+        os.chdir(job["tmpdir"])
+        sys.path.extend(os.path.join(job["tmpdir"], path) for path in job["python_path"])
+        set_limits(job.get("limits", {}))
+        code = compile(job["code"], "jailed_code", "exec", 0, True)
+        exec code in globals_dict  # pylint: disable=exec-used
+    except BaseException:  # pylint: disable=broad-except
+        return {"emsg": traceback.format_exc(), "globals": {}}
+    return {"emsg": None, "globals": json_safe(globals_dict)}
+
+
+def fork_job(job):
+    """
+    Start running the job in a child process.  Return the child's pid, and the
+    file descriptor to read the job's result from.
+    """
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # The child: run the job in its own process group, so that anything
+        # it starts can be killed with it, and send its result to the worker.
+        # Close everything else, so that the code can't write to the worker's
+        # results stream, and send its stderr to /dev/null (which stdin is,
+        # see `main`) rather than the server's.
+        os.setsid()
+        os.dup2(0, 2)
+        os.closerange(3, write_fd)
+        os.closerange(write_fd + 1, MAXFD)
+        status = 1
+        try:
+            result = json.dumps(run_job(job))
+            with os.fdopen(write_fd, "w") as output:
+                output.write(result)
+            status = 0
+        finally:
+            os._exit(status)  # pylint: disable=protected-access
+
+    os.close(write_fd)
+    return pid, read_fd
+
+
+def wait_job(pid, read_fd, timeout):
+    """
+    Return the result of the job run by child process `pid`, which writes it
+    to `read_fd`.
+
+    The child is killed if it's still running after `timeout` seconds.  Any
+    process it started is killed once it's done.
+    """
+    deadline = time.time() + timeout if timeout else None
+    output = []
+    status = None
+    reading = True
+    delay = 0.001
+    while status is None:
+        if deadline is not None and time.time() > deadline:
+            break
+        if reading:
+            readable, _, _ = select.select([read_fd], [], [], POLL_INTERVAL)
+            if readable:
+                chunk = os.read(read_fd, 65536)
+                if chunk:
+                    output.append(chunk)
+                    continue
+                reading = False
+        else:
+            time.sleep(delay)
+            delay = min(delay * 2, POLL_INTERVAL)
+        exited, exit_status = os.waitpid(pid, os.WNOHANG)
+        if exited:
+            status = exit_status
+
+    # Processes the job started may still hold the pipe open: only take what
+    # has been written, then kill them.
+    while reading and select.select([read_fd], [], [], 0)[0]:
+        chunk = os.read(read_fd, 65536)
+        if not chunk:
+            break
+        output.append(chunk)
+    os.close(read_fd)
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    if status is None:
+        _, status = os.waitpid(pid, 0)
+
+    output = "".join(output)
+    if status == 0 and output:
+        return json.loads(output)
+    if os.WIFSIGNALED(status):
+        reason = "killed by signal {}".format(os.WTERMSIG(status))
+    else:
+        reason = "exited with status {}".format(os.WEXITSTATUS(status))
+    return {"emsg": "Jailed code {}".format(reason), "globals": {}}
+
+
+def main(preloads):
+    """
+    Import `preloads`, then run the jobs from stdin until it's closed.
+    """
+    make_undumpable()
+
+    # Keep the protocol streams for ourselves, so that the code's prints
+    # and reads can't mess with them.
+    jobs = os.fdopen(os.dup(0))
+    results = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    for modname in preloads:
+        try:
+            __import__(modname)
+        except ImportError:
+            pass
+    results.write(json.dumps({"ready": True}) + "\n")
+    results.flush()
+
+    for line in iter(jobs.readline, ""):
+        job = json.loads(line)
+        pid, read_fd = fork_job(job)
+        results.write(json.dumps({"pid": pid}) + "\n")
+        results.flush()
+        result = wait_job(pid, read_fd, job.get("limits", {}).get("REALTIME"))
+        result["maxrss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results.write(json.dumps(result) + "\n")
+        results.flush()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -3,7 +3,9 @@
 from codejail.safe_exec import safe_exec as codejail_safe_exec
 from codejail.safe_exec import not_safe_exec as codejail_not_safe_exec
 from codejail.safe_exec import json_safe, SafeExecException
+from codejail.jail_code import is_configured
 from . import lazymod
+from .pool import SandboxPool
 from dogapi import dog_stats_api
 
 import hashlib
@@ -46,6 +48,29 @@ for name, modname in ASSUMED_IMPORTS:
 
 LAZY_IMPORTS = "".join(LAZY_IMPORTS)
 
+# The pool of sandboxed processes to run code in, once `configure_pool` is called.
+SANDBOX_POOL = None
+
+
+def configure_pool(size, max_jobs=100, max_memory=None):
+    """
+    Run sandboxed code in a pool of `size` pre-started sandboxed processes,
+    which have already imported the modules in ASSUMED_IMPORTS, instead of
+    starting a new one each time.
+
+    Each process is replaced after running `max_jobs` executions, or once it
+    uses more than `max_memory` bytes of memory.  A `size` of 0 stops using
+    the pool.
+    """
+    global SANDBOX_POOL  # pylint: disable=global-statement
+    if size:
+        SANDBOX_POOL = SandboxPool(
+            size, max_jobs=max_jobs, max_memory=max_memory,
+            preloads=[modname for _, modname in ASSUMED_IMPORTS],
+        )
+    else:
+        SANDBOX_POOL = None
+
 
 def update_hash(hasher, obj):
     """
@@ -116,6 +141,8 @@ def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None
     # Decide which code executor to use.
     if unsafely:
         exec_fn = codejail_not_safe_exec
+    elif SANDBOX_POOL is not None and is_configured("python"):
+        exec_fn = SANDBOX_POOL.safe_exec
     else:
         exec_fn = codejail_safe_exec
 
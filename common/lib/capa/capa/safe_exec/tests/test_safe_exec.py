@@ -4,12 +4,17 @@ import hashlib
 import os
 import os.path
 import random
+import sys
 import textwrap
+import time
 import unittest
 
 from nose.plugins.skip import SkipTest
 
+from mock import patch
+
 from capa.safe_exec import safe_exec, update_hash
+from capa.safe_exec.pool import SandboxPool, SandboxWorker
 from codejail.safe_exec import SafeExecException
 from codejail.jail_code import is_configured
 
@@ -235,6 +240,136 @@ class TestUpdateHash(unittest.TestCase):
         self.assertEqual(h1, h2)
 
 
+class TestSandboxPool(unittest.TestCase):
+    """
+    Test the pool of pre-started processes, run with this (unsandboxed)
+    Python so that the tests don't need CodeJail configured.
+    """
+    def setUp(self):
+        self.pool = SandboxPool(2, max_jobs=3, cmdline=[sys.executable], preloads=["math"])
+        patcher = patch.dict("codejail.jail_code.LIMITS", {"CPU": 1, "REALTIME": 2, "VMEM": 0})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def worker_pid(self):
+        """Return the pid of the worker running a job"""
+        g = {}
+        self.pool.safe_exec("import os; pid = os.getppid()", g)
+        return g['pid']
+
+    def test_set_values(self):
+        g = {'a': 17}
+        self.pool.safe_exec("b = a + 1", g)
+        self.assertEqual(g, {'a': 17, 'b': 18})
+
+    def test_python_path(self):
+        pylib = os.path.dirname(__file__) + "/test_files/pylib"
+        g = {}
+        self.pool.safe_exec("import constant; a = constant.THE_CONST", g, python_path=[pylib])
+        self.assertEqual(g['a'], 23)
+
+    def test_raising_exceptions(self):
+        g = {}
+        with self.assertRaises(SafeExecException) as cm:
+            self.pool.safe_exec("1/0", g)
+        self.assertIn("ZeroDivisionError", cm.exception.message)
+        self.assertEqual(g, {})
+
+    def test_jobs_dont_share_state(self):
+        g = {}
+        self.pool.safe_exec("import math; math.leak = 1", g)
+        self.pool.safe_exec("import math; leaked = hasattr(math, 'leak')", g)
+        self.assertFalse(g['leaked'])
+
+    def test_cpu_limit(self):
+        with self.assertRaises(SafeExecException) as cm:
+            self.pool.safe_exec("while True: pass", {})
+        self.assertIn("killed", cm.exception.message)
+        # The worker is still there for the next job
+        g = {}
+        self.pool.safe_exec("a = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_no_subprocesses(self):
+        g = {}
+        self.pool.safe_exec(textwrap.dedent("""\
+            import os, time
+            try:
+                pid = os.fork()
+            except OSError:
+                pid = None
+            if pid == 0:
+                # Keep the job's output pipe open
+                time.sleep(60)
+                os._exit(0)
+            """), g)
+        if os.getuid() != 0:
+            # Root isn't held to RLIMIT_NPROC
+            self.assertIsNone(g['pid'])
+        if g['pid']:
+            # The forked process was killed with the job, rather than
+            # keeping the worker waiting for the job's output
+            for _ in xrange(20):
+                if not self.is_running(g['pid']):
+                    break
+                time.sleep(.05)
+            self.assertFalse(self.is_running(g['pid']))
+
+    def test_worker_out_of_reach(self):
+        g = {}
+        self.pool.safe_exec(textwrap.dedent("""\
+            import ctypes, os
+            dumpable = ctypes.CDLL(None).prctl(3, 0, 0, 0, 0)  # PR_GET_DUMPABLE
+            reached = []
+            for path in ["/proc/%d/mem" % os.getppid(), "/proc/%d/fd/0" % os.getppid()]:
+                try:
+                    open(path).close()
+                    reached.append(path)
+                except IOError:
+                    pass
+            """), g)
+        self.assertEqual(g['dumpable'], 0)
+        if os.getuid() != 0:
+            # Root can trace any process
+            self.assertEqual(g['reached'], [])
+
+    def test_kill_as_sandbox_user(self):
+        worker = SandboxWorker([sys.executable], [], user="sandbox")
+        self.addCleanup(worker.kill)
+        worker.job_pid = 12345
+        with patch("capa.safe_exec.pool.subprocess.call") as mock_call:
+            worker.kill_job()
+        mock_call.assert_called_once_with(["sudo", "-u", "sandbox", "pkill", "-9", "-g", "12345"])
+
+    def is_running(self, pid):
+        """Return whether process `pid` exists and isn't a zombie"""
+        try:
+            with open("/proc/{}/stat".format(pid)) as stat:
+                return stat.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except IOError:
+            return False
+
+    def test_recycling(self):
+        self.pool.size = 1
+        pids = [self.worker_pid() for _ in xrange(4)]
+        self.assertEqual(len(set(pids[:3])), 1)
+        self.assertNotEqual(pids[0], pids[3])
+
+    def test_memory_recycling(self):
+        self.pool.size = 1
+        self.pool.max_memory = 1
+        self.assertNotEqual(self.worker_pid(), self.worker_pid())
+
+    def test_metrics(self):
+        with patch("capa.safe_exec.pool.dog_stats_api") as mock_stats:
+            self.pool.safe_exec("a = 1", {})
+        metrics = [call[0][0] for call in mock_stats.histogram.call_args_list]
+        self.assertEqual(
+            sorted(metrics),
+            ['capa.safe_exec.pool.exec_time', 'capa.safe_exec.pool.queue_wait']
+        )
+
+
 class TestRealProblems(unittest.TestCase):
     def test_802x(self):
         code = textwrap.dedent("""\
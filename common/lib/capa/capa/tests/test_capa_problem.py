@@ -0,0 +1,170 @@
+"""
+Tests of capa_problem.LoncapaProblem
+"""
+import textwrap
+import unittest
+
+from lxml import etree
+from mock import patch
+
+from capa.capa_problem import EXECUTED_CONTEXT_CACHE, PROBLEM_TEMPLATE_CACHE, LoncapaProblem
+from capa.tests import new_loncapa_problem, test_system
+from capa.tests.response_xml_factory import StringResponseXMLFactory
+
+
+class DictCache(object):
+    """A cache implementation over a simple dict, for testing."""
+
+    def __init__(self, d):
+        self.cache = d
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache[key] = value
+
+
+class ExecutedContextCacheTest(unittest.TestCase):
+    """
+    Test that the contexts resulting from the problems' scripts are cached
+    """
+    PROBLEM_XML = textwrap.dedent("""
+        <problem>
+            <script type="loncapa/python">
+        values = [random.randint(0, 1000) for _ in range(5)]
+        total = sum(values)
+            </script>
+            <p>What is the sum of $values?</p>
+        </problem>
+    """)
+
+    def setUp(self):
+        EXECUTED_CONTEXT_CACHE.clear()
+        self.addCleanup(EXECUTED_CONTEXT_CACHE.clear)
+
+    def test_context_reused_for_same_seed(self):
+        problem = new_loncapa_problem(self.PROBLEM_XML)
+        with patch('capa.capa_problem.safe_exec') as mock_safe_exec:
+            other_problem = new_loncapa_problem(self.PROBLEM_XML)
+        self.assertFalse(mock_safe_exec.called)
+        self.assertEqual(problem.context, other_problem.context)
+        self.assertEqual(problem.context['total'], sum(problem.context['values']))
+        self.assertEqual((EXECUTED_CONTEXT_CACHE.hits, EXECUTED_CONTEXT_CACHE.misses), (1, 1))
+
+        # Each problem gets its own copy
+        other_problem.context['values'].append(1)
+        self.assertNotEqual(problem.context['values'], other_problem.context['values'])
+
+    def test_context_depends_on_seed_and_code(self):
+        new_loncapa_problem(self.PROBLEM_XML)
+        with patch('capa.capa_problem.safe_exec') as mock_safe_exec:
+            LoncapaProblem(self.PROBLEM_XML, id='1', seed=1, system=test_system())
+            new_loncapa_problem(self.PROBLEM_XML.replace('range(5)', 'range(6)'))
+        self.assertEqual(mock_safe_exec.call_count, 2)
+        self.assertEqual(EXECUTED_CONTEXT_CACHE.misses, 3)
+
+    def test_shared_cache(self):
+        shared = {}
+        system = test_system()
+        system.cache = DictCache(shared)
+        problem = new_loncapa_problem(self.PROBLEM_XML, system=system)
+        self.assertTrue(any(key.startswith('capa.executed_context.') for key in shared))
+
+        # Another process only has the shared cache
+        EXECUTED_CONTEXT_CACHE.clear()
+        with patch('capa.capa_problem.safe_exec') as mock_safe_exec:
+            other_problem = new_loncapa_problem(self.PROBLEM_XML, system=system)
+        self.assertFalse(mock_safe_exec.called)
+        self.assertEqual(EXECUTED_CONTEXT_CACHE.shared_hits, 1)
+        self.assertEqual(problem.context, other_problem.context)
+
+    def test_cache_size(self):
+        with patch.object(EXECUTED_CONTEXT_CACHE, 'size', 1):
+            new_loncapa_problem(self.PROBLEM_XML)
+            new_loncapa_problem(self.PROBLEM_XML.replace('range(5)', 'range(6)'))
+            new_loncapa_problem(self.PROBLEM_XML)
+        self.assertEqual(EXECUTED_CONTEXT_CACHE.misses, 3)
+
+
+class ProblemTemplateCacheTest(unittest.TestCase):
+    """
+    Test that problems are parsed once per problem definition
+    """
+    def setUp(self):
+        PROBLEM_TEMPLATE_CACHE.clear()
+        self.addCleanup(PROBLEM_TEMPLATE_CACHE.clear)
+        self.xml = StringResponseXMLFactory().build_xml(answer="Michigan", hints=[])
+
+    def test_parsed_once(self):
+        assign_ids = LoncapaProblem._assign_ids
+        with patch.object(LoncapaProblem, '_assign_ids', autospec=True, side_effect=assign_ids) as mock_assign_ids:
+            problem = new_loncapa_problem(self.xml)
+            other_problem = new_loncapa_problem(self.xml)
+        self.assertEqual(mock_assign_ids.call_count, 1)
+        self.assertEqual((PROBLEM_TEMPLATE_CACHE.hits, PROBLEM_TEMPLATE_CACHE.misses), (1, 1))
+
+        self.assertEqual(etree.tostring(problem.tree), etree.tostring(other_problem.tree))
+        self.assertEqual(problem.get_html(), other_problem.get_html())
+        self.assertEqual(problem.problem_text, other_problem.problem_text)
+
+    def test_trees_are_copies(self):
+        problem = new_loncapa_problem(self.xml)
+        problem.tree.set('changed', 'true')
+        other_problem = new_loncapa_problem(self.xml)
+        self.assertIsNot(problem.tree, other_problem.tree)
+        self.assertIsNone(other_problem.tree.get('changed'))
+        self.assertIsNot(problem.responders.keys()[0], other_problem.responders.keys()[0])
+
+    def test_ids_depend_on_problem_id(self):
+        problem = new_loncapa_problem(self.xml)
+        other_problem = LoncapaProblem(self.xml, id='2', seed=723, system=test_system())
+        self.assertEqual(problem.responders.keys()[0].get('id'), '1_1')
+        self.assertEqual(other_problem.responders.keys()[0].get('id'), '2_1')
+        self.assertEqual(PROBLEM_TEMPLATE_CACHE.misses, 2)
+
+    def test_includes_are_checked(self):
+        system = test_system()
+        self._create_include(system, '<p>First version</p>')
+        xml = '<problem><include file="test_include.xml"/></problem>'
+
+        problem = new_loncapa_problem(xml, system=system)
+        self.assertEqual(new_loncapa_problem(xml, system=system).tree.find('p').text, 'First version')
+
+        # The course was reloaded with a new version of the included file
+        self._create_include(system, '<p>Second version</p>')
+        other_problem = new_loncapa_problem(xml, system=system)
+        self.assertEqual(problem.tree.find('p').text, 'First version')
+        self.assertEqual(other_problem.tree.find('p').text, 'Second version')
+
+    def test_includes_not_read_when_cached(self):
+        system = test_system()
+        self._create_include(system, '<p>Included</p>')
+        xml = '<problem><include file="test_include.xml"/></problem>'
+        new_loncapa_problem(xml, system=system)
+
+        with patch.object(system.filestore, 'open', wraps=system.filestore.open) as mock_open:
+            problem = new_loncapa_problem(xml, system=system)
+        self.assertFalse(mock_open.called)
+        self.assertEqual(problem.tree.find('p').text, 'Included')
+
+    def test_failed_includes_not_cached(self):
+        system = test_system()
+        xml = '<problem><include file="test_include.xml"/><p>Text</p></problem>'
+
+        # The test system is in debug mode, where the missing file is skipped
+        new_loncapa_problem(xml, system=system)
+        self._create_include(system, '<p>Included</p>')
+        problem = new_loncapa_problem(xml, system=system)
+        self.assertEqual([p.text for p in problem.tree.findall('p')], ['Included', 'Text'])
+        self.assertEqual(PROBLEM_TEMPLATE_CACHE.hits, 0)
+
+    def _create_include(self, system, content):
+        """
+        Write `content` to test_include.xml in the filestore of `system`
+        """
+        if not system.filestore.exists('test_include.xml'):
+            self.addCleanup(system.filestore.remove, 'test_include.xml')
+        include_file = system.filestore.open('test_include.xml', 'w')
+        include_file.write(content)
+        include_file.close()
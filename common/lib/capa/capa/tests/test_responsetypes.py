@@ -497,6 +497,33 @@ class FormulaResponseTest(ResponseTest):
         self.assertTrue(problem.responders.values()[0].validate_answer('14*x'))
         self.assertFalse(problem.responders.values()[0].validate_answer('3*y+2*x'))
 
+    def test_grade_parallel(self):
+        """
+        Test formulas using the || operator, which are evaluated for all
+        samples at once.
+        """
+        sample_dict = {'x': (1, 2), 'y': (1, 2)}
+        problem = self.build_problem(sample_dict=sample_dict,
+                                     num_samples=10,
+                                     tolerance=0.01,
+                                     answer="x||y")
+        self.assert_grade(problem, "x*y/(x+y)", "correct")
+        self.assert_grade(problem, "x*y/(x-y)", "incorrect")
+
+    def test_factorial_outside_domain(self):
+        """
+        Test that factorial, which can't be applied to all samples at once,
+        still raises an error on non-integer samples.
+        """
+        sample_dict = {'x': (1, 2)}
+        problem = self.build_problem(sample_dict=sample_dict,
+                                     num_samples=10,
+                                     tolerance="1%",
+                                     answer="x")
+        input_dict = {'1_2_1': 'fact(x)'}
+        with self.assertRaisesRegexp(StudentInputError, 'factorial function not permitted'):
+            problem.grade_answers(input_dict)
+
 
 class StringResponseTest(ResponseTest):
     from capa.tests.response_xml_factory import StringResponseXMLFactory
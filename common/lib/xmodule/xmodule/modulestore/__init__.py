@@ -485,6 +485,14 @@ class ModuleStoreReadBase(ModuleStoreRead):
                 return c
         return None
 
+    def get_course_version(self, course_id):
+        """
+        Return a token that changes whenever the content of the course
+        changes, so that data derived from the course's structure can be
+        cached under it. Returns None if the store can't tell.
+        """
+        return None
+
 
 class ModuleStoreWriteBase(ModuleStoreReadBase, ModuleStoreWrite):
     '''
@@ -88,6 +88,60 @@ def inherit_metadata(descriptor, inherited_data):
         pass
 
 
+class InheritedSettings(object):
+    """
+    A read-only, dict-like view of the inheritable settings a module receives
+    from its ancestors. Rather than a merged copy, it holds the settings
+    explicitly set on each ancestor, nearest first, and looks values up
+    through them.
+
+    Like inherited_settings dicts, values are json reprs.
+    """
+    def __init__(self, ancestor_settings=()):
+        self._ancestor_settings = list(ancestor_settings)
+
+    def __getitem__(self, field_name):
+        for settings in self._ancestor_settings:
+            if field_name in settings:
+                return settings[field_name]
+        raise KeyError(field_name)
+
+    def __contains__(self, field_name):
+        return any(field_name in settings for settings in self._ancestor_settings)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, InheritedSettings):
+            other = other.copy()
+        return self.copy() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def get(self, field_name, default=None):
+        """Return the inherited value of `field_name`, or `default`"""
+        try:
+            return self[field_name]
+        except KeyError:
+            return default
+
+    def keys(self):
+        """The names of all the inherited fields"""
+        return list(set().union(*self._ancestor_settings))
+
+    def copy(self):
+        """Return the inherited settings merged into a plain dict"""
+        merged = {}
+        for settings in reversed(self._ancestor_settings):
+            merged.update(settings)
+        return merged
+
+
 def own_metadata(module):
     """
     Return a dictionary that contains only non-inherited field keys,
@@ -136,6 +136,12 @@ class MixedModuleStore(ModuleStoreWriteBase):
         """
         return self._get_modulestore_for_courseid(course_id).get_parent_locations(location, course_id)
 
+    def get_course_version(self, course_id):
+        """
+        returns the version token of the course, from the modulestore serving it
+        """
+        return self._get_modulestore_for_courseid(course_id).get_course_version(course_id)
+
     def get_modulestore_type(self, course_id):
         """
         Returns a type which identifies which modulestore is servicing the given course_id.
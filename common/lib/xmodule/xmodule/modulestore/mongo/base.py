@@ -15,12 +15,16 @@ structure:
 import pymongo
 import sys
 import logging
-import copy
+import threading
+import time
 
+from bson import BSON
 from bson.son import SON
+from collections import OrderedDict
 from fs.osfs import OSFS
 from itertools import repeat
 from path import path
+from uuid import uuid4
 
 from importlib import import_module
 from xmodule.errortracker import null_error_tracker, exc_info_to_str
@@ -33,7 +37,9 @@ from xblock.fields import Scope, ScopeIds
 
 from xmodule.modulestore import ModuleStoreWriteBase, Location, MONGO_MODULESTORE_TYPE
 from xmodule.modulestore.exceptions import ItemNotFoundError
-from xmodule.modulestore.inheritance import own_metadata, InheritanceMixin, inherit_metadata, InheritanceKeyValueStore
+from xmodule.modulestore.inheritance import (
+    own_metadata, InheritanceMixin, inherit_metadata, InheritanceKeyValueStore, InheritedSettings
+)
 
 log = logging.getLogger(__name__)
 
@@ -198,9 +204,9 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
                     # so when we do the lookup, we should do so with a non-draft location
                     non_draft_loc = location.replace(revision=None)
 
-                    # Convert the serialized fields values in self.cached_metadata
-                    # to python values
-                    metadata_to_inherit = self.cached_metadata.get(non_draft_loc.url(), {})
+                    # The inherited settings are read straight out of self.cached_metadata,
+                    # as serialized field values, without copying them
+                    metadata_to_inherit = inherited_settings_from_tree(self.cached_metadata, non_draft_loc.url())
                     inherit_metadata(module, metadata_to_inherit)
                 # decache any computed pending field settings
                 module.save()
@@ -245,9 +251,104 @@ def location_to_query(location, wildcard=True):
     return query
 
 
-def metadata_cache_key(location):
-    """Turn a `Location` into a useful cache key."""
-    return u"{0.org}/{0.course}".format(location)
+# The categories of module that can have children, and so the only ones whose
+# settings can be inherited by other modules. Note that when we add new
+# categories of containers, we have to add them here
+INHERITANCE_CONTAINER_CATEGORIES = [
+    'course', 'chapter', 'sequential', 'vertical', 'videosequence',
+    'wrapper', 'problemset', 'conditional', 'randomize'
+]
+
+
+# Bump this whenever the format of the metadata inheritance tree changes, so
+# that trees cached in the old format aren't read
+METADATA_INHERITANCE_TREE_VERSION = 2
+
+
+def metadata_cache_key(location, version=None):
+    """
+    Turn a `Location` into a useful cache key. `version` is the count of
+    writes to the course that the cached tree reflects (see
+    MongoModuleStore._metadata_inheritance_tree_version).
+    """
+    key = u"{0.org}/{0.course}/v{1}".format(location, METADATA_INHERITANCE_TREE_VERSION)
+    if version is not None:
+        key = u"{0}/{1}".format(key, version)
+    return key
+
+
+def metadata_version_key(location):
+    """
+    Key under which the writes to `location`'s course are counted in the
+    metadata inheritance cache subsystem
+    """
+    return u"metadata_inheritance_version/{0.org}/{0.course}".format(location)
+
+
+def inherited_settings_from_tree(tree, location_url):
+    """
+    Return an InheritedSettings with the values that the module at
+    `location_url` inherits, according to the metadata inheritance `tree`
+    (see MongoModuleStore.compute_metadata_inheritance_tree).
+    """
+    entry = tree.get(location_url)
+    parent_url = entry[0] if isinstance(entry, tuple) else entry
+
+    ancestor_settings = []
+    seen = set()
+    while parent_url is not None and parent_url not in seen:
+        seen.add(parent_url)
+        parent_entry = tree.get(parent_url)
+        if not isinstance(parent_entry, tuple):
+            break
+        parent_url, settings = parent_entry
+        ancestor_settings.append(settings)
+
+    return InheritedSettings(ancestor_settings)
+
+
+def course_structure_version_key(location):
+    """
+    Key under which the version token of `location`'s course structure is
+    kept in the metadata inheritance cache subsystem
+    """
+    return u"course_structure_version/{0.org}/{0.course}".format(location)
+
+
+class CourseStructureCache(object):
+    """
+    A bounded, least-recently-used map of org/course -> (version, structure),
+    shared by all the requests served by a process.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the entry stored for key (marking it as recently used), or None
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        """
+        Store entry for key, evicting the least recently used entries if the
+        cache is full
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
 
 
 class MongoModuleStore(ModuleStoreWriteBase):
@@ -261,9 +362,14 @@ class MongoModuleStore(ModuleStoreWriteBase):
     def __init__(self, doc_store_config, fs_root, render_template,
                  default_class=None,
                  error_tracker=null_error_tracker,
+                 course_structure_cache_size=0,
                  **kwargs):
         """
         :param doc_store_config: must have a host, db, and collection entries. Other common entries: port, tz_aware.
+        :param course_structure_cache_size: how many course structures (see `_get_course_structure`)
+            to keep in process memory between requests. 0 disables the cache. The cached structures
+            are validated against a version token kept in the metadata_inheritance_cache_subsystem,
+            so they are only kept if that subsystem is configured.
         """
 
         super(MongoModuleStore, self).__init__(**kwargs)
@@ -284,6 +390,7 @@ class MongoModuleStore(ModuleStoreWriteBase):
                 db
             )
             self.collection = self.database[collection]
+            self.tz_aware = tz_aware
 
             if user is not None and password is not None:
                 self.database.authenticate(user, password)
@@ -309,19 +416,52 @@ class MongoModuleStore(ModuleStoreWriteBase):
         self.error_tracker = error_tracker
         self.render_template = render_template
         self.ignore_write_events_on_courses = []
+        if course_structure_cache_size:
+            self.course_structure_cache = CourseStructureCache(course_structure_cache_size)
+        else:
+            self.course_structure_cache = None
 
     def compute_metadata_inheritance_tree(self, location):
         '''
+        Return the metadata inheritance tree of the course `location` is in.
+
+        The tree maps the url of every container to a (parent url, settings)
+        tuple, where settings holds only the inheritable fields explicitly set
+        on that container, and the url of every leaf to the url of its parent.
+        Use `inherited_settings_from_tree` to find what a module inherits.
+
         TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
         '''
 
         # get all collections in the course, this query should not return any leaf nodes
-        # note this is a bit ugly as when we add new categories of containers, we have to add it here
         query = {'_id.org': location.org,
                  '_id.course': location.course,
-                 '_id.category': {'$in': ['course', 'chapter', 'sequential', 'vertical', 'videosequence',
-                                          'wrapper', 'problemset', 'conditional', 'randomize']}
+                 '_id.category': {'$in': INHERITANCE_CONTAINER_CATEGORIES}
                  }
+        results_by_url = self._query_inheritance_containers(query)
+
+        tree = {}
+        for url, result in results_by_url.iteritems():
+            for child in result.get('definition', {}).get('children', []):
+                # this is likely a leaf node, so let's record who it inherits from
+                tree[child] = url
+
+        for url, result in results_by_url.iteritems():
+            # check for presence of metadata key. Note that a given module may not yet be fully formed.
+            # example: update_item -> update_children -> update_metadata sequence on new item create
+            # if we get called here without update_metadata called first then 'metadata' hasn't been set
+            # as we're not fully transactional at the DB layer.
+            parent_url = tree.get(url)
+            tree[url] = (parent_url, result.get('metadata', {}))
+
+        return tree
+
+    def _query_inheritance_containers(self, query):
+        """
+        Run `query`, which should only match containers, and return a dict
+        mapping the non-draft location url of each result to a record holding
+        its children and inheritable metadata.
+        """
         # we just want the Location, children, and inheritable metadata
         record_filter = {'_id': 1, 'definition.children': 1}
 
@@ -334,7 +474,6 @@ class MongoModuleStore(ModuleStoreWriteBase):
         resultset = self.collection.find(query, record_filter)
 
         results_by_url = {}
-        root = None
 
         # now go through the results and order them by the location url
         for result in resultset:
@@ -349,87 +488,195 @@ class MongoModuleStore(ModuleStoreWriteBase):
                 total_children = existing_children + additional_children
                 results_by_url[location_url].setdefault('definition', {})['children'] = total_children
             results_by_url[location.url()] = result
-            if location.category == 'course':
-                root = location.url()
 
-        # now traverse the tree and compute down the inherited metadata
-        metadata_to_inherit = {}
+        return results_by_url
 
-        def _compute_inherited_metadata(url):
-            """
-            Helper method for computing inherited metadata for a specific location url
-            """
-            # check for presence of metadata key. Note that a given module may not yet be fully formed.
-            # example: update_item -> update_children -> update_metadata sequence on new item create
-            # if we get called here without update_metadata called first then 'metadata' hasn't been set
-            # as we're not fully transactional at the DB layer. Same comment applies to below key name
-            # check
-            my_metadata = results_by_url[url].get('metadata', {})
-
-            # go through all the children and recurse, but only if we have
-            # in the result set. Remember results will not contain leaf nodes
-            for child in results_by_url[url].get('definition', {}).get('children', []):
-                if child in results_by_url:
-                    new_child_metadata = copy.deepcopy(my_metadata)
-                    new_child_metadata.update(results_by_url[child].get('metadata', {}))
-                    results_by_url[child]['metadata'] = new_child_metadata
-                    metadata_to_inherit[child] = new_child_metadata
-                    _compute_inherited_metadata(child)
-                else:
-                    # this is likely a leaf node, so let's record what metadata we need to inherit
-                    metadata_to_inherit[child] = my_metadata
-
-        if root is not None:
-            _compute_inherited_metadata(root)
-
-        return metadata_to_inherit
+    def update_metadata_inheritance_tree(self, tree, location):
+        """
+        Patch `tree`, a metadata inheritance tree as computed by
+        compute_metadata_inheritance_tree, so that what `location` and its
+        descendants inherit reflects what is currently in the DB.
+
+        As the tree only holds the settings set on each container, this just
+        means re-reading `location` itself and repointing its children at it.
+        Returns False if the tree couldn't be patched (e.g. because the change
+        was to the course itself), in which case it has to be recomputed in full.
+        """
+        location = Location(location).replace(revision=None)
+        url = location.url()
 
-    def get_cached_metadata_inheritance_tree(self, location, force_refresh=False):
-        '''
-        TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
-        '''
-        key = metadata_cache_key(location)
-        tree = {}
+        # the settings of leaf nodes are not inherited by anything
+        if location.category not in INHERITANCE_CONTAINER_CATEGORIES:
+            return True
 
-        if not force_refresh:
-            # see if we are first in the request cache (if present)
-            if self.request_cache is not None and key in self.request_cache.data.get('metadata_inheritance', {}):
-                return self.request_cache.data['metadata_inheritance'][key]
+        # imports and clones ask for a refresh of the whole course this way
+        if location.category == 'course':
+            return False
+
+        containers = self._query_inheritance_containers({
+            '_id.tag': location.tag,
+            '_id.org': location.org,
+            '_id.course': location.course,
+            '_id.category': location.category,
+            '_id.name': location.name,
+        })
+        if url not in containers:
+            # deleted, so nothing will inherit from it
+            return True
 
-            # then look in any caching subsystem (e.g. memcached)
-            if self.metadata_inheritance_cache_subsystem is not None:
-                tree = self.metadata_inheritance_cache_subsystem.get(key, {})
+        entry = tree.get(url)
+        if isinstance(entry, tuple):
+            parent_url = entry[0]
+        elif entry is not None:
+            # we had only seen it in its parent's list of children so far
+            parent_url = entry
+        else:
+            parent_url = None
+            parents = self.collection.find(
+                {
+                    '_id.tag': location.tag,
+                    '_id.org': location.org,
+                    '_id.course': location.course,
+                    'definition.children': url,
+                },
+                {'_id': 1},
+            )
+            for parent in parents:
+                parent_url = Location(parent['_id']).replace(revision=None).url()
+                if parent_url not in tree:
+                    # the tree doesn't match what is in the DB, so don't guess
+                    return False
+            # if there was no parent, it's an orphan (e.g. a module that was
+            # just created), so nothing in the course inherits from it yet
+
+        tree[url] = (parent_url, containers[url].get('metadata', {}))
+
+        for child in containers[url].get('definition', {}).get('children', []):
+            child_entry = tree.get(child)
+            if isinstance(child_entry, tuple):
+                tree[child] = (url, child_entry[1])
+            elif Location(child).category in INHERITANCE_CONTAINER_CATEGORIES:
+                # a container we don't know about yet
+                tree[child] = url
+                if not self.update_metadata_inheritance_tree(tree, child):
+                    return False
             else:
-                logging.warning('Running MongoModuleStore without a metadata_inheritance_cache_subsystem. This is OK in localdev and testing environment. Not OK in production.')
+                tree[child] = url
 
-        if not tree:
-            # if not in subsystem, or we are on force refresh, then we have to compute
-            tree = self.compute_metadata_inheritance_tree(location)
+        return True
 
-            # now write out computed tree to caching subsystem (e.g. memcached), if available
-            if self.metadata_inheritance_cache_subsystem is not None:
-                self.metadata_inheritance_cache_subsystem.set(key, tree)
+    def _metadata_inheritance_tree_version(self, location, bump=False):
+        """
+        Return the count of writes made to `location`'s course, which versions
+        the trees cached for it in the caching subsystem. If `bump`, count one
+        more write first, which must only be done after the write to the
+        collection.
 
-        # now populate a request_cache, if available. NOTE, we are outside of the
-        # scope of the above if: statement so that after a memcache hit, it'll get
-        # put into the request_cache
+        Returns None if there is no caching subsystem, or it lost the count.
+        """
+        cache = self.metadata_inheritance_cache_subsystem
+        if cache is None:
+            return None
+        key = metadata_version_key(location)
+        # start the count at the current time rather than 0, so that a count
+        # which was evicted doesn't restart at a version that is still cached
+        cache.add(key, int(time.time() * 1000))
+        if bump:
+            try:
+                return cache.incr(key)
+            except ValueError:
+                # evicted since the add
+                return None
+        return cache.get(key)
+
+    def _get_metadata_inheritance_tree_from_request_cache(self, location):
+        """
+        Return the metadata inheritance tree for `location`'s course from the
+        request cache (if present), or None if it isn't there.
+        """
+        if self.request_cache is None:
+            return None
+        return self.request_cache.data.get('metadata_inheritance', {}).get(metadata_cache_key(location))
+
+    def _cache_metadata_inheritance_tree(self, location, tree, version=None):
+        """
+        Store `tree` as the metadata inheritance tree for `location`'s course
+        in the request cache and, if `version` is given, in the caching
+        subsystem as the tree reflecting the first `version` writes.
+        """
+        # write out the tree to caching subsystem (e.g. memcached). Trees are
+        # never overwritten with another version, so concurrent writers can't
+        # lose each other's updates.
+        if version is not None:
+            self.metadata_inheritance_cache_subsystem.set(metadata_cache_key(location, version), tree)
+
+        # now populate a request_cache, if available
         if self.request_cache is not None:
             # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
             # defined
             if 'metadata_inheritance' not in self.request_cache.data:
                 self.request_cache.data['metadata_inheritance'] = {}
-            self.request_cache.data['metadata_inheritance'][key] = tree
+            self.request_cache.data['metadata_inheritance'][metadata_cache_key(location)] = tree
 
+    def get_cached_metadata_inheritance_tree(self, location, force_refresh=False):
+        '''
+        TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
+        '''
+        tree = None
+
+        # see if we are first in the request cache (if present)
+        if not force_refresh:
+            tree = self._get_metadata_inheritance_tree_from_request_cache(location)
+            if tree:
+                return tree
+
+        if self.metadata_inheritance_cache_subsystem is None:
+            logging.warning('Running MongoModuleStore without a metadata_inheritance_cache_subsystem. This is OK in localdev and testing environment. Not OK in production.')
+
+        # read the version before querying, so that the tree we compute
+        # reflects at least that many writes
+        version = self._metadata_inheritance_tree_version(location)
+
+        # then look in any caching subsystem (e.g. memcached)
+        if not force_refresh and version is not None:
+            tree = self.metadata_inheritance_cache_subsystem.get(metadata_cache_key(location, version))
+
+        # if not in subsystem, or we are on force refresh, then we have to compute
+        if not tree:
+            tree = self.compute_metadata_inheritance_tree(location)
+            self._cache_metadata_inheritance_tree(location, tree, version)
+        else:
+            # after a memcache hit, it'll get put into the request_cache
+            self._cache_metadata_inheritance_tree(location, tree)
         return tree
 
     def refresh_cached_metadata_inheritance_tree(self, location):
         """
         Refresh the cached metadata inheritance tree for the org/course combination
-        for location
+        for location.
+
+        If the tree for the previous write is cached, only the entries for
+        `location` and its children are updated; otherwise (e.g. because a
+        concurrent write hasn't been cached yet, or the change was to the
+        course itself) the whole tree is recomputed.
         """
         pseudo_course_id = '/'.join([location.org, location.course])
         if pseudo_course_id not in self.ignore_write_events_on_courses:
-            self.get_cached_metadata_inheritance_tree(location, force_refresh=True)
+            self._course_structure_changed(location)
+            if self.metadata_inheritance_cache_subsystem is None:
+                tree = self._get_metadata_inheritance_tree_from_request_cache(location)
+                version = None
+            else:
+                # never patch the request cache's copy: it may be older than
+                # what other processes have cached since
+                tree = None
+                version = self._metadata_inheritance_tree_version(location, bump=True)
+                if version is not None:
+                    tree = self.metadata_inheritance_cache_subsystem.get(metadata_cache_key(location, version - 1))
+            if tree and self.update_metadata_inheritance_tree(tree, location):
+                self._cache_metadata_inheritance_tree(location, tree, version)
+            else:
+                self.get_cached_metadata_inheritance_tree(location, force_refresh=True)
 
     def _clean_item_data(self, item):
         """
@@ -445,14 +692,125 @@ class MongoModuleStore(ModuleStoreWriteBase):
         }
         return list(self.collection.find(query))
 
+    def _course_structure_version(self, location):
+        """
+        Return the token identifying the current version of `location`'s
+        course structure, or None if there is no caching subsystem to share it
+        between processes.
+        """
+        if self.metadata_inheritance_cache_subsystem is None:
+            return None
+        key = course_structure_version_key(location)
+        # add (rather than set) so that concurrent readers agree on one token
+        self.metadata_inheritance_cache_subsystem.add(key, uuid4().hex)
+        return self.metadata_inheritance_cache_subsystem.get(key)
+
+    def get_course_version(self, course_id):
+        """
+        Return the version token of the course's structure (see
+        `_course_structure_version`), or None without a caching subsystem.
+        """
+        org, course, _ = course_id.split('/')
+        return self._course_structure_version(Location('i4x', org, course, None, None))
+
+    def _course_structure_changed(self, location):
+        """
+        Invalidate every process' cached structure of `location`'s course.
+        Must be called after the write to the collection.
+        """
+        if self.metadata_inheritance_cache_subsystem is not None:
+            self.metadata_inheritance_cache_subsystem.set(course_structure_version_key(location), uuid4().hex)
+
+    def _get_course_structure(self, location):
+        """
+        Return a dict mapping the (non-draft) url of every module in
+        `location`'s course to a dict of revision -> BSON encoded document,
+        fetched from the collection in a single query.
+
+        The documents are kept encoded so that a structure can be shared
+        between requests: every caller decodes its own copy.
+        """
+        cache_key = get_course_id_no_run(location)
+        version = None
+        if self.course_structure_cache is not None:
+            # read the version before querying, so a concurrent write can only
+            # make the stored structure look older than it is
+            version = self._course_structure_version(location)
+            if version is not None:
+                entry = self.course_structure_cache.get(cache_key)
+                if entry is not None and entry[0] == version:
+                    return entry[1]
+
+        structure = {}
+        query = {'_id.tag': 'i4x', '_id.org': location.org, '_id.course': location.course}
+        for doc in self.collection.find(query):
+            doc_location = Location(doc['_id'])
+            url = doc_location.replace(revision=None).url()
+            structure.setdefault(url, {})[doc_location.revision] = BSON.encode(doc)
+
+        if version is not None:
+            self.course_structure_cache.set(cache_key, (version, structure))
+        return structure
+
+    def _select_from_course_structure(self, revisions):
+        """
+        Return the document to use out of the BSON encoded `revisions` of
+        a module in a course structure, or None if there isn't one.
+        """
+        return revisions.get(None)
+
+    def _use_course_structure(self, items):
+        """
+        Whether the descendants of items should be read from their course
+        structure rather than queried level by level: only if they all belong
+        to the same course, and either include the course itself (so the whole
+        structure is needed anyway) or the structure is already in memory.
+        """
+        courses = set((item['_id']['org'], item['_id']['course']) for item in items)
+        if len(courses) != 1:
+            return False
+        if any(item['_id']['category'] == 'course' for item in items):
+            return True
+        return (
+            self.course_structure_cache is not None and
+            self.course_structure_cache.get('/'.join(courses.pop())) is not None
+        )
+
+    def _cache_children_from_course_structure(self, items):
+        """
+        Returns the same dictionary as `_cache_children(items, depth=None)`,
+        but resolves all the descendants in memory from the course structure.
+        """
+        structure = self._get_course_structure(Location(items[0]['_id']))
+        data = {}
+        to_process = list(items)
+        while to_process:
+            children = []
+            for item in to_process:
+                self._clean_item_data(item)
+                children.extend(item.get('definition', {}).get('children', []))
+                data[Location(item['location'])] = item
+
+            to_process = []
+            for child in children:
+                encoded = self._select_from_course_structure(structure.get(Location(child).url(), {}))
+                if encoded is not None:
+                    to_process.append(BSON(encoded).decode(tz_aware=self.tz_aware))
+
+        return data
+
     def _cache_children(self, items, depth=0):
         """
         Returns a dictionary mapping Location -> item data, populated with json data
         for all descendents of items up to the specified depth.
         (0 = no descendents, 1 = children, 2 = grandchildren, etc)
         If depth is None, will load all the children.
-        This will make a number of queries that is linear in the depth.
+        This will make a number of queries that is linear in the depth, unless
+        depth is None and the course structure can be used, in which case it
+        makes at most one.
         """
+        if depth is None and items and self._use_course_structure(items):
+            return self._cache_children_from_course_structure(items)
 
         data = {}
         to_process = list(items)
@@ -771,6 +1129,9 @@ class MongoModuleStore(ModuleStoreWriteBase):
         except ItemNotFoundError:
             if not allow_not_found:
                 raise
+        location = Location(location)
+        if get_course_id_no_run(location) not in self.ignore_write_events_on_courses:
+            self._course_structure_changed(location)
 
     def update_children(self, location, children):
         """
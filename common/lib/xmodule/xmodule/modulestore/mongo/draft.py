@@ -265,6 +265,15 @@ class DraftModuleStore(MongoModuleStore):
         self.convert_to_draft(location)
         super(DraftModuleStore, self).delete_item(location)
 
+    def _select_from_course_structure(self, revisions):
+        """
+        Return the draft if one exists, mirroring `_query_children_for_cache_children`:
+        a draft is only returned if its non-draft exists too.
+        """
+        if None not in revisions:
+            return None
+        return revisions.get(DRAFT, revisions[None])
+
     def _query_children_for_cache_children(self, items):
         # first get non-draft in a round-trip
         to_process_non_drafts = super(DraftModuleStore, self)._query_children_for_cache_children(items)
@@ -4,8 +4,10 @@ from nose.tools import assert_equals, assert_raises, \
     assert_not_equals, assert_false
 from itertools import ifilter
 # pylint: enable=E0611
+import mock
 import pymongo
 import logging
+import pickle
 from uuid import uuid4
 
 from xblock.fields import Scope
@@ -15,6 +17,7 @@ from xblock.exceptions import InvalidScopeError
 from xmodule.tests import DATA_DIR
 from xmodule.modulestore import Location, MONGO_MODULESTORE_TYPE
 from xmodule.modulestore.mongo import MongoModuleStore, MongoKeyValueStore
+from xmodule.modulestore.mongo.base import inherited_settings_from_tree, CourseStructureCache
 from xmodule.modulestore.draft import DraftModuleStore
 from xmodule.modulestore.xml_importer import import_from_xml, perform_xlint
 from xmodule.contentstore.mongo import MongoContentStore
@@ -347,3 +350,257 @@ class TestMongoKeyValueStore(object):
         for scope in (Scope.preferences, Scope.user_info, Scope.user_state, Scope.parent):
             with assert_raises(InvalidScopeError):
                 self.kvs.delete(KeyValueStore.Key(scope, None, None, 'foo'))
+
+
+class TestMetadataInheritanceRefresh(object):
+    """
+    Compare patching the metadata inheritance tree below a changed location
+    with recomputing it in full, on a synthetic course of about 5,000 blocks.
+    """
+    # chapters per course, sequentials per chapter, verticals per sequential,
+    # problems per vertical: 1 + 10 + 100 + 500 + 4500 blocks
+    SHAPE = (('chapter', 10), ('sequential', 10), ('vertical', 5), ('problem', 9))
+
+    @classmethod
+    def setupClass(cls):
+        cls.db = 'test_mongo_inheritance_%s' % uuid4().hex[:5]
+        cls.connection = pymongo.MongoClient(host=HOST, port=PORT, tz_aware=True)
+        cls.connection.drop_database(cls.db)
+        doc_store_config = {
+            'host': HOST,
+            'db': cls.db,
+            'collection': COLLECTION,
+        }
+        cls.doc_store_config = doc_store_config
+        cls.store = MongoModuleStore(doc_store_config, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS)
+        cls.course_location = Location('i4x', 'InheritX', 'Synthetic', 'course', 'run')
+        cls.locations_by_category = cls._create_synthetic_course()
+
+    @classmethod
+    def teardownClass(cls):
+        if cls.connection:
+            cls.connection.drop_database(cls.db)
+
+    @classmethod
+    def _create_synthetic_course(cls):
+        """
+        Insert the course's documents straight into the collection, and return
+        a dict mapping each category to the locations created for it.
+        """
+        documents = []
+        locations_by_category = {'course': [cls.course_location]}
+
+        def add_block(location, metadata, depth):
+            children = []
+            if depth < len(cls.SHAPE):
+                category, count = cls.SHAPE[depth]
+                for index in range(count):
+                    child = location.replace(category=category, name='{0}_{1}'.format(location.name, index))
+                    locations_by_category.setdefault(category, []).append(child)
+                    child_metadata = {'due': '2013-09-{0:02d}T00:00:00Z'.format(index + 1)} if category == 'sequential' else {}
+                    add_block(child, child_metadata, depth + 1)
+                    children.append(child.url())
+            documents.append({
+                '_id': location.dict(),
+                'metadata': metadata,
+                'definition': {'data': {}, 'children': children},
+            })
+
+        add_block(cls.course_location, {'showanswer': 'always', 'rerandomize': 'per_student'}, 0)
+        cls.store.collection.insert(documents)
+        return locations_by_category
+
+    def _set_metadata(self, location, metadata):
+        """Change `location`'s metadata directly in the DB"""
+        self.store.collection.update({'_id': location.dict()}, {'$set': {'metadata': metadata}})
+
+    def test_leaf_change_leaves_tree_alone(self):
+        tree = self.store.compute_metadata_inheritance_tree(self.course_location)
+        problem = self.locations_by_category['problem'][0]
+        assert self.store.update_metadata_inheritance_tree(tree, problem)
+        assert_equals(tree, self.store.compute_metadata_inheritance_tree(self.course_location))
+
+    def test_course_change_needs_full_refresh(self):
+        tree = self.store.compute_metadata_inheritance_tree(self.course_location)
+        assert_false(self.store.update_metadata_inheritance_tree(tree, self.course_location))
+
+    def test_inherited_settings_follow_ancestors(self):
+        tree = self.store.compute_metadata_inheritance_tree(self.course_location)
+        vertical = self.course_location.replace(category='vertical', name='run_0_7_2')
+        problem = self.course_location.replace(category='problem', name='run_0_7_2_4')
+
+        # leaves only point at their parent
+        assert_equals(tree[problem.url()], vertical.url())
+
+        settings = inherited_settings_from_tree(tree, problem.url())
+        assert_equals(settings['due'], '2013-09-08T00:00:00Z')
+        assert_equals(settings['showanswer'], 'always')
+        assert_false('graceperiod' in settings)
+        assert_equals(
+            settings.copy(),
+            {'due': '2013-09-08T00:00:00Z', 'showanswer': 'always', 'rerandomize': 'per_student'}
+        )
+
+    def test_incremental_refresh_matches_full_refresh(self):
+        sequential = self.locations_by_category['sequential'][42]
+        tree = self.store.compute_metadata_inheritance_tree(self.course_location)
+
+        self._set_metadata(sequential, {'due': '2014-01-01T00:00:00Z', 'showanswer': 'never'})
+        assert self.store.update_metadata_inheritance_tree(tree, sequential)
+        assert_equals(tree, self.store.compute_metadata_inheritance_tree(self.course_location))
+
+    def _caching_store(self, cache):
+        """Return a store over the synthetic course which caches trees in `cache`"""
+        return MongoModuleStore(
+            self.doc_store_config, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS,
+            metadata_inheritance_cache_subsystem=cache,
+        )
+
+    def test_old_format_tree_is_ignored(self):
+        cache = DictCache()
+        store = self._caching_store(cache)
+        # version 1 cached the fully inherited metadata of every module under the course's key
+        problem = self.locations_by_category['problem'][0]
+        cache.set(u'InheritX/Synthetic', {problem.url(): {'showanswer': 'never'}})
+
+        tree = store.get_cached_metadata_inheritance_tree(self.course_location)
+        assert_equals(tree, store.compute_metadata_inheritance_tree(self.course_location))
+        assert_equals(inherited_settings_from_tree(tree, problem.url())['showanswer'], 'always')
+
+    def test_concurrent_refreshes_keep_both_writes(self):
+        store = self._caching_store(DictCache())
+        first, second = self.locations_by_category['sequential'][1:3]
+        store.get_cached_metadata_inheritance_tree(self.course_location)
+        update_metadata_inheritance_tree = store.update_metadata_inheritance_tree
+
+        def interleaved_update(tree, location):
+            """Make another write and refresh while the first refresh patches its tree"""
+            if location == first:
+                self._set_metadata(second, {'due': '2014-02-02T00:00:00Z'})
+                store.refresh_cached_metadata_inheritance_tree(second)
+            return update_metadata_inheritance_tree(tree, location)
+
+        self._set_metadata(first, {'due': '2014-01-01T00:00:00Z'})
+        with mock.patch.object(store, 'update_metadata_inheritance_tree', side_effect=interleaved_update):
+            store.refresh_cached_metadata_inheritance_tree(first)
+
+        assert_equals(
+            store.get_cached_metadata_inheritance_tree(self.course_location),
+            store.compute_metadata_inheritance_tree(self.course_location)
+        )
+
+    def test_refresh_only_queries_changed_container(self):
+        tree = self.store.compute_metadata_inheritance_tree(self.course_location)
+        for location in (self.locations_by_category['chapter'][3], self.locations_by_category['vertical'][123]):
+            with mock.patch.object(self.store.collection, 'find', wraps=self.store.collection.find) as find:
+                assert self.store.update_metadata_inheritance_tree(tree, location)
+            assert_equals(find.call_count, 1)
+        assert_equals(tree, self.store.compute_metadata_inheritance_tree(self.course_location))
+
+
+class DictCache(object):
+    """
+    The subset of the django cache api used by the MongoModuleStore, over a
+    dict. Values are pickled, as memcached does, so callers get copies.
+    """
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        return pickle.loads(self.data[key])
+
+    def set(self, key, value):
+        self.data[key] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    def add(self, key, value):
+        if key not in self.data:
+            self.set(key, value)
+
+    def incr(self, key):
+        if key not in self.data:
+            raise ValueError("Key '%s' not found" % key)
+        self.set(key, self.get(key) + 1)
+        return self.get(key)
+
+
+class TestCourseStructureLoading(object):
+    """
+    Check that loading a whole course from its structure gives the same
+    modules as querying it one level at a time.
+    """
+    @classmethod
+    def setupClass(cls):
+        cls.db = 'test_mongo_structure_%s' % uuid4().hex[:5]
+        cls.connection = pymongo.MongoClient(host=HOST, port=PORT, tz_aware=True)
+        cls.connection.drop_database(cls.db)
+        doc_store_config = {
+            'host': HOST,
+            'db': cls.db,
+            'collection': COLLECTION,
+        }
+        cls.store = MongoModuleStore(
+            doc_store_config, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS,
+            metadata_inheritance_cache_subsystem=DictCache(),
+            course_structure_cache_size=2,
+        )
+        cls.draft_store = DraftModuleStore(doc_store_config, FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS)
+        import_from_xml(cls.store, DATA_DIR, ['toy', 'simple_with_draft'], draft_store=cls.draft_store)
+
+    @classmethod
+    def teardownClass(cls):
+        if cls.connection:
+            cls.connection.drop_database(cls.db)
+
+    def _descendants(self, store, location, use_structure):
+        """
+        Return the item data of `location` and all its descendants, read from
+        the course structure or queried level by level
+        """
+        course = store.collection.find_one({'_id': Location(location).dict()})
+        if use_structure:
+            return store._cache_children([course], depth=None)
+        # a depth deeper than any course forces one query per level
+        return store._cache_children([course], depth=100)
+
+    def test_structure_matches_level_by_level(self):
+        for course_id in ('edX/toy/2012_Fall', 'edX/simple_with_draft/2012_Fall'):
+            location = Location('i4x', *course_id.split('/')[:2] + ['course', course_id.split('/')[2]])
+            for store in (self.store, self.draft_store):
+                assert_equals(
+                    self._descendants(store, location, True),
+                    self._descendants(store, location, False),
+                )
+
+    def test_get_item_with_structure(self):
+        course = self.store.get_item(Location('i4x', 'edX', 'toy', 'course', '2012_Fall'), depth=None)
+        assert_equals(len(course.get_children()), len(course.children))
+
+    def test_structure_is_cached_until_changed(self):
+        location = Location('i4x', 'edX', 'toy', 'course', '2012_Fall')
+        structure = self.store._get_course_structure(location)
+        assert self.store._get_course_structure(location) is structure
+
+        html = Location('i4x', 'edX', 'toy', 'html', 'toyhtml')
+        self.store.update_item(html, self.store.get_item(html).data)
+        assert self.store._get_course_structure(location) is not structure
+
+    def test_course_version_changes_with_course(self):
+        version = self.store.get_course_version('edX/toy/2012_Fall')
+        assert version is not None
+        assert_equals(self.store.get_course_version('edX/toy/2012_Fall'), version)
+
+        html = Location('i4x', 'edX', 'toy', 'html', 'toyhtml')
+        self.store.update_item(html, self.store.get_item(html).data)
+        assert self.store.get_course_version('edX/toy/2012_Fall') != version
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = CourseStructureCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        assert_equals(cache.get('a'), 1)
+        cache.set('c', 3)
+        assert_equals(cache.get('b'), None)
+        assert_equals(cache.get('a'), 1)
+        assert_equals(cache.get('c'), 3)
@@ -1,10 +1,15 @@
 import os.path
+import shutil
+
+from mock import patch
+from path import path
+from tempfile import mkdtemp
 
 from nose.tools import assert_raises, assert_equals  # pylint: disable=E0611
 
 from xmodule.course_module import CourseDescriptor
 from xmodule.modulestore.xml import XMLModuleStore
-from xmodule.modulestore import XML_MODULESTORE_TYPE
+from xmodule.modulestore import Location, XML_MODULESTORE_TYPE
 
 from .test_modulestore import check_path_to_location
 from xmodule.tests import DATA_DIR
@@ -42,3 +47,151 @@ class TestXMLModuleStore(object):
         location = CourseDescriptor.id_to_location("edX/toy/2012_Fall")
         errors = modulestore.get_item_errors(location)
         assert errors == []
+
+
+def assert_same_store(first, second):
+    """
+    Assert that two XMLModuleStores loaded the same courses, modules, parents and errors
+    """
+    assert_equals(
+        sorted((course_dir, course.id) for course_dir, course in first.courses.items()),
+        sorted((course_dir, course.id) for course_dir, course in second.courses.items()),
+    )
+    assert_equals(first.get_errored_courses(), second.get_errored_courses())
+    for course in first.get_courses():
+        assert_equals(first.get_item_errors(course.location), second.get_item_errors(course.location))
+
+    assert_equals(sorted(first.modules.keys()), sorted(second.modules.keys()))
+    for course_id, modules in first.modules.iteritems():
+        second_modules = second.modules[course_id]
+        assert_equals(sorted(modules.keys()), sorted(second_modules.keys()))
+        for location, module in modules.iteritems():
+            second_module = second_modules[location]
+            assert_equals(module.__class__, second_module.__class__)
+            assert_equals(module.data_dir, second_module.data_dir)
+            for field in module.fields.values():
+                assert_equals(field.read_from(module), field.read_from(second_module))
+            if first.parent_trackers[course_id].is_known(location):
+                assert_equals(
+                    sorted(first.get_parent_locations(location, course_id)),
+                    sorted(second.get_parent_locations(location, course_id)),
+                )
+
+
+class TestParallelCourseLoading(object):
+    """
+    Check that loading courses in worker processes gives the same store as
+    loading them serially.
+    """
+    COURSE_DIRS = ['toy', 'simple', 'simple_with_draft', 'test_unicode', 'two_toys', 'conditional']
+
+    @classmethod
+    def setupClass(cls):
+        cls.serial = XMLModuleStore(DATA_DIR, course_dirs=cls.COURSE_DIRS)
+        cls.parallel = XMLModuleStore(DATA_DIR, course_dirs=cls.COURSE_DIRS, course_load_processes=2)
+
+    def test_same_store(self):
+        assert_same_store(self.serial, self.parallel)
+
+
+class TestCourseSnapshots(object):
+    """
+    Check that courses restored from snapshots match the parsed courses, and
+    that snapshots are only used while the course directory is unchanged.
+    """
+    def setUp(self):
+        self.temp_dir = path(mkdtemp())
+        self.data_dir = self.temp_dir / 'data'
+        self.snapshot_dir = self.temp_dir / 'snapshots'
+        for course_dir in ('toy', 'simple'):
+            shutil.copytree(path(DATA_DIR) / course_dir, self.data_dir / course_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _store(self, **kwargs):
+        """An XMLModuleStore of the copied courses, snapshotting them"""
+        return XMLModuleStore(self.data_dir, course_dirs=['toy', 'simple'], snapshot_dir=self.snapshot_dir, **kwargs)
+
+    def test_restored_store_matches_parsed_store(self):
+        parsed = self._store()
+        assert_equals(len(self.snapshot_dir.files('*.snapshot')), 2)
+
+        with patch.object(XMLModuleStore, 'load_course') as load_course:
+            restored = self._store()
+        assert not load_course.called
+        assert_same_store(parsed, restored)
+
+    def test_changed_course_is_parsed(self):
+        self._store()
+        with open(self.data_dir / 'toy' / 'html' / 'toyhtml.html', 'a') as html_file:
+            html_file.write('<p>changed</p>')
+
+        with patch.object(XMLModuleStore, 'load_course', autospec=True, side_effect=XMLModuleStore.load_course) as load_course:
+            self._store()
+        assert_equals([call[0][1] for call in load_course.call_args_list], ['toy'])
+        # the snapshot of the old contents was replaced
+        assert_equals(len(self.snapshot_dir.files('toy.*.snapshot')), 1)
+
+    def test_snapshot_of_other_code_is_ignored(self):
+        self._store()
+        with patch('xmodule.modulestore.xml.snapshot_code_version', return_value='other'):
+            with patch.object(XMLModuleStore, 'load_course', autospec=True, side_effect=XMLModuleStore.load_course) as load_course:
+                self._store()
+        assert_equals(sorted(call[0][1] for call in load_course.call_args_list), ['simple', 'toy'])
+
+    def test_unreadable_snapshot_is_ignored(self):
+        parsed = self._store()
+        for snapshot in self.snapshot_dir.files('*.snapshot'):
+            snapshot.write_bytes('garbage')
+        assert_same_store(parsed, self._store())
+
+
+class TestXMLModuleStoreGetItems(object):
+    """
+    Check get_items against a linear scan of every module, over all the test courses.
+    """
+    @classmethod
+    def setupClass(cls):
+        cls.store = XMLModuleStore(DATA_DIR)
+        cls.queries = [
+            Location(None, None, None, 'problem', None),
+            Location(None, None, None, 'vertical', None),
+            Location('i4x', 'edX', 'toy', 'html', None),
+            Location(None, None, None, None, 'toylab'),
+            Location('i4x', 'edX', 'toy', 'chapter', 'Overview'),
+            Location(None, None, None, 'nonexistent_category', None),
+            Location(None, None, None, None, None),
+        ]
+
+    def _scan(self, location, course_id=None):
+        """The matches for location, found by comparing it to every module"""
+        course_ids = self.store.modules.keys() if course_id is None else [course_id]
+        return [
+            module
+            for cid in course_ids
+            for mod_loc, module in self.store.modules[cid].iteritems()
+            if all(goal is None or goal == value for goal, value in zip(location, mod_loc))
+        ]
+
+    def test_get_items_matches_scan(self):
+        for location in self.queries:
+            assert_equals(
+                sorted(module.location.url() for module in self.store.get_items(location)),
+                sorted(module.location.url() for module in self._scan(location)),
+            )
+            assert_equals(
+                sorted(module.location.url() for module in self.store.get_items(location, course_id='edX/toy/2012_Fall')),
+                sorted(module.location.url() for module in self._scan(location, course_id='edX/toy/2012_Fall')),
+            )
+
+    def test_get_items_only_examines_candidates(self):
+        location = Location(None, None, None, 'problem', None)
+        examined = []
+        for course_id in self.store.modules:
+            examined.extend(self.store._module_index(course_id).candidates(location))  # pylint: disable=protected-access
+        # every module examined matches, rather than every module in the store
+        assert_equals(
+            sorted(candidate.url() for candidate in examined),
+            sorted(module.location.url() for module in self._scan(location)),
+        )
@@ -1,6 +1,8 @@
 import hashlib
 import json
 import logging
+import cPickle as pickle
+import multiprocessing
 import os
 import re
 import sys
@@ -12,7 +14,10 @@ from fs.osfs import OSFS
 from importlib import import_module
 from lxml import etree
 from path import path
+from uuid import uuid4
 
+import xblock
+import xmodule
 from xmodule.error_module import ErrorDescriptor
 from xmodule.errortracker import make_error_tracker, exc_info_to_str
 from xmodule.course_module import CourseDescriptor
@@ -23,11 +28,12 @@ from xmodule.html_module import HtmlDescriptor
 from xblock.core import XBlock
 from xblock.fields import ScopeIds
 from xblock.field_data import DictFieldData
+from xblock.runtime import DbModel
 
 from . import ModuleStoreReadBase, Location, XML_MODULESTORE_TYPE
 
 from .exceptions import ItemNotFoundError
-from .inheritance import compute_inherited_metadata
+from .inheritance import compute_inherited_metadata, InheritanceKeyValueStore
 
 edx_xml_parser = etree.XMLParser(dtd_validation=False, load_dtd=False,
                                  remove_comments=True, remove_blank_text=True)
@@ -292,11 +298,202 @@ class ParentTracker(object):
         return list(self._parents[child])
 
 
+class ModuleIndex(object):
+    """
+    Secondary indexes over the locations of one course's modules, so that
+    wildcard Locations can be resolved without scanning every module.
+    """
+    def __init__(self, modules):
+        """
+        modules: dict of location -> XBlock for a single course
+        """
+        self.size = len(modules)
+        self.by_category = defaultdict(list)
+        self.by_name = defaultdict(list)
+        self.by_category_and_name = defaultdict(list)
+        for location in modules:
+            self.by_category[location.category].append(location)
+            self.by_name[location.name].append(location)
+            self.by_category_and_name[(location.category, location.name)].append(location)
+        self.all = list(modules)
+
+    def candidates(self, location):
+        """
+        Return the locations that may match `location`, using the most
+        selective index that its non-wildcard fields allow.
+        """
+        if location.category is not None and location.name is not None:
+            return self.by_category_and_name.get((location.category, location.name), [])
+        if location.category is not None:
+            return self.by_category.get(location.category, [])
+        if location.name is not None:
+            return self.by_name.get(location.name, [])
+        return self.all
+
+
+# The packages whose code determines what is in a course snapshot
+SNAPSHOT_CODE_PACKAGES = (xmodule, xblock)
+
+_snapshot_code_version = None
+
+
+def snapshot_code_version():
+    """
+    Return a hash of the python source of SNAPSHOT_CODE_PACKAGES, so that
+    snapshots taken by other versions of the loading code or the descriptors
+    aren't restored. Computed once per process.
+    """
+    global _snapshot_code_version  # pylint: disable=global-statement
+    if _snapshot_code_version is None:
+        code_hash = hashlib.sha1()
+        for package in SNAPSHOT_CODE_PACKAGES:
+            package_dir = os.path.dirname(package.__file__)
+            for dirpath, dirnames, filenames in os.walk(package_dir):
+                dirnames.sort()
+                for filename in sorted(filenames):
+                    if filename.endswith('.py'):
+                        filepath = os.path.join(dirpath, filename)
+                        code_hash.update(os.path.relpath(filepath, package_dir))
+                        with open(filepath, 'rb') as source:
+                            code_hash.update(source.read())
+        _snapshot_code_version = code_hash.hexdigest()
+    return _snapshot_code_version
+
+
+class CourseSnapshot(object):
+    """
+    A picklable copy of everything an XMLModuleStore keeps about one course
+    directory: the field data of its modules, its parent pointers, and the
+    errors encountered loading it. Descriptors hold their runtime, which can't
+    be pickled, so they are reconstructed by `restore`.
+    """
+    def __init__(self, course_dir, course_location, errors, modules, parents):
+        self.course_dir = course_dir
+        self.course_location = course_location  # None if the course failed to load
+        self.errors = errors
+        self.modules = modules  # course_id -> list of module states, see `_module_state`
+        self.parents = parents  # course_id -> dict(location -> set(parent locations))
+
+    @staticmethod
+    def _module_state(descriptor):
+        """
+        Return a picklable tuple from which `descriptor` can be reconstructed
+        """
+        field_data = descriptor._field_data  # pylint: disable=protected-access
+        if isinstance(field_data, DictFieldData):
+            fields, inherited_settings = field_data._data, None  # pylint: disable=protected-access
+        elif isinstance(descriptor.xblock_kvs, InheritanceKeyValueStore):
+            fields, inherited_settings = descriptor.xblock_kvs._fields, descriptor.xblock_kvs.inherited_settings  # pylint: disable=protected-access
+        else:
+            raise TypeError("Can't snapshot the field data of {0}".format(descriptor.location))
+        return (
+            getattr(descriptor, 'unmixed_class', descriptor.__class__),
+            descriptor.location,
+            fields,
+            inherited_settings,
+            getattr(descriptor, 'data_dir', None),
+        )
+
+    @classmethod
+    def from_store(cls, store, course_dir, course_ids=None):
+        """
+        Snapshot course_dir from `store`. course_ids are the ids of the courses
+        whose modules were loaded from course_dir; by default, all of the
+        store's courses, i.e. course_dir must be the only course `store` loaded.
+        """
+        if course_ids is None:
+            course_ids = store.modules.keys()
+        if course_dir in store.courses:
+            course_location = store.courses[course_dir].location
+            errors = store._location_errors[course_location].errors  # pylint: disable=protected-access
+        else:
+            course_location = None
+            errors = store.errored_courses[course_dir].errors
+        modules = dict(
+            (course_id, [cls._module_state(descriptor) for descriptor in store.modules[course_id].itervalues()])
+            for course_id in course_ids
+        )
+        parents = dict(
+            (course_id, store.parent_trackers[course_id]._parents)  # pylint: disable=protected-access
+            for course_id in course_ids
+        )
+        return cls(course_dir, course_location, errors, modules, parents)
+
+    def restore(self, store):
+        """
+        Add the snapshotted course to `store`, as if it had loaded it itself
+        """
+        errorlog = make_error_tracker()
+        errorlog.errors.extend(self.errors)
+        for course_id, module_states in self.modules.iteritems():
+            parent_tracker = store.parent_trackers[course_id]
+            for child, parents in self.parents.get(course_id, {}).iteritems():
+                for parent in parents:
+                    parent_tracker.add_parent(child, parent)
+
+            # the policy has already been applied to the snapshotted field data
+            system = ImportSystem(
+                xmlstore=store,
+                course_id=course_id,
+                course_dir=self.course_dir,
+                error_tracker=errorlog.tracker,
+                parent_tracker=parent_tracker,
+                load_error_modules=store.load_error_modules,
+                policy={},
+                mixins=store.xblock_mixins,
+            )
+            for block_class, location, fields, inherited_settings, data_dir in module_states:
+                if inherited_settings is None:
+                    field_data = DictFieldData(fields)
+                else:
+                    field_data = DbModel(InheritanceKeyValueStore(fields, inherited_settings))
+                descriptor = system.construct_xblock_from_class(
+                    system.mixologist.mix(block_class),
+                    ScopeIds(None, location.category, location, location),
+                    field_data,
+                )
+                descriptor.data_dir = data_dir
+                store.modules[course_id][location] = descriptor
+            store.module_indexes[course_id] = ModuleIndex(store.modules[course_id])
+
+        if self.course_location is not None:
+            course_id = CourseDescriptor.location_to_id(self.course_location)
+            course_descriptor = store.modules[course_id][self.course_location]
+            store.courses[self.course_dir] = course_descriptor
+            store._location_errors[course_descriptor.location] = errorlog  # pylint: disable=protected-access
+            store.parent_trackers[course_id].make_known(course_descriptor.location)
+        else:
+            store.errored_courses[self.course_dir] = errorlog
+
+
+def _load_course_snapshot(args):
+    """
+    Load a single course directory into a new XMLModuleStore, and return its
+    pickled CourseSnapshot, or None if it can't be snapshotted. Run in the
+    worker processes of `XMLModuleStore.load_courses_in_parallel`.
+    """
+    data_dir, course_dir, default_class, load_error_modules, snapshot_dir, xblock_mixins = args
+    try:
+        store = XMLModuleStore(
+            data_dir, course_dirs=[], load_error_modules=load_error_modules,
+            snapshot_dir=snapshot_dir, xblock_mixins=xblock_mixins
+        )
+        store.default_class = default_class
+        store.try_load_course(course_dir)
+        # pickle here, rather than returning the snapshot, so that a failure
+        # to pickle is reported instead of breaking the pool
+        return pickle.dumps(CourseSnapshot.from_store(store, course_dir), pickle.HIGHEST_PROTOCOL)
+    except Exception:  # pylint: disable=broad-except
+        log.exception("Couldn't load course '%s' in a worker process", course_dir)
+        return None
+
+
 class XMLModuleStore(ModuleStoreReadBase):
     """
     An XML backed ModuleStore
     """
-    def __init__(self, data_dir, default_class=None, course_dirs=None, load_error_modules=True, **kwargs):
+    def __init__(self, data_dir, default_class=None, course_dirs=None, load_error_modules=True,
+                 course_load_processes=None, snapshot_dir=None, **kwargs):
         """
         Initialize an XMLModuleStore from data_dir
 
@@ -307,15 +504,27 @@ class XMLModuleStore(ModuleStoreReadBase):
 
         course_dirs: If specified, the list of course_dirs to load. Otherwise,
             load all course dirs
+
+        course_load_processes: If more than 1, load the courses in a pool of
+            that many processes (see load_courses_in_parallel). Otherwise, load
+            them one after the other in this process.
+
+        snapshot_dir: If specified, a directory in which to keep a snapshot of
+            each loaded course. A course whose directory's contents haven't
+            changed since its snapshot was taken is restored from the snapshot
+            instead of being parsed.
         """
         super(XMLModuleStore, self).__init__(**kwargs)
 
         self.data_dir = path(data_dir)
         self.modules = defaultdict(dict)  # course_id -> dict(location -> XBlock)
+        self.module_indexes = {}  # course_id -> ModuleIndex over self.modules[course_id]
+        self._course_versions = {}  # course_id -> (course descriptor, version token)
         self.courses = {}  # course_dir -> XBlock for the course
         self.errored_courses = {}  # course_dir -> errorlog, for dirs that failed to load
 
         self.load_error_modules = load_error_modules
+        self.snapshot_dir = path(snapshot_dir) if snapshot_dir is not None else None
 
         if default_class is None:
             self.default_class = None
@@ -334,13 +543,52 @@ class XMLModuleStore(ModuleStoreReadBase):
         if course_dirs is None:
             course_dirs = sorted([d for d in os.listdir(self.data_dir) if
                                   os.path.exists(self.data_dir / d / "course.xml")])
-        for course_dir in course_dirs:
-            self.try_load_course(course_dir)
+        if course_load_processes > 1 and len(course_dirs) > 1:
+            self.load_courses_in_parallel(course_dirs, course_load_processes)
+        else:
+            for course_dir in course_dirs:
+                self.try_load_course(course_dir)
+
+    def load_courses_in_parallel(self, course_dirs, processes):
+        """
+        Parse course_dirs in a pool of `processes` worker processes, and merge
+        the loaded courses into this store in the order of course_dirs.
+
+        The workers send back CourseSnapshots, from which the descriptors are
+        rebuilt here without reparsing any xml. Courses that can't be
+        snapshotted are loaded in this process instead.
+        """
+        args = [
+            (
+                self.data_dir, course_dir, self.default_class, self.load_error_modules,
+                self.snapshot_dir, self.xblock_mixins
+            )
+            for course_dir in course_dirs
+        ]
+        pool = multiprocessing.Pool(processes)
+        try:
+            snapshots = pool.map(_load_course_snapshot, args, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+        for course_dir, snapshot in zip(course_dirs, snapshots):
+            if snapshot is None:
+                self.try_load_course(course_dir)
+            else:
+                pickle.loads(snapshot).restore(self)
 
     def try_load_course(self, course_dir):
         '''
         Load a course, keeping track of errors as we go along.
         '''
+        snapshot_path = None
+        if self.snapshot_dir is not None:
+            snapshot_path = self._snapshot_path(course_dir)
+            if self._restore_snapshot(snapshot_path):
+                return
+        loaded_course_ids = set(self.modules.keys())
+
         # Special-case code here, since we don't have a location for the
         # course before it loads.
         # So, make a tracker to track load-time errors, then put in the right
@@ -359,10 +607,78 @@ class XMLModuleStore(ModuleStoreReadBase):
             self.courses[course_dir] = course_descriptor
             self._location_errors[course_descriptor.location] = errorlog
             self.parent_trackers[course_descriptor.id].make_known(course_descriptor.location)
+            # only snapshot courses that have their modules to themselves
+            if snapshot_path is not None and course_descriptor.id not in loaded_course_ids:
+                self._save_snapshot(snapshot_path, course_dir, course_descriptor.id)
         else:
             # Didn't load course.  Instead, save the errors elsewhere.
             self.errored_courses[course_dir] = errorlog
 
+    def _snapshot_path(self, course_dir):
+        """
+        Return the path of the snapshot of course_dir's current contents.
+
+        The name hashes the name, size and modification time of every file in
+        the course directory together with the version of the loading code and
+        the options that affect loading, so a change to any of them makes
+        earlier snapshots unreachable.
+        """
+        content_hash = hashlib.sha1()
+        content_hash.update(repr((
+            snapshot_code_version(),
+            self.load_error_modules,
+            self.default_class,
+            self.xblock_mixins,
+        )))
+        course_path = self.data_dir / course_dir
+        for dirpath, dirnames, filenames in os.walk(course_path):
+            # skip hidden directories, such as .git
+            dirnames[:] = sorted(dirname for dirname in dirnames if not dirname.startswith('.'))
+            for filename in sorted(filenames):
+                filepath = os.path.join(dirpath, filename)
+                stat = os.stat(filepath)
+                content_hash.update(repr((os.path.relpath(filepath, course_path), stat.st_size, stat.st_mtime)))
+        return self.snapshot_dir / '{0}.{1}.snapshot'.format(course_dir, content_hash.hexdigest())
+
+    def _restore_snapshot(self, snapshot_path):
+        """
+        Restore the course snapshotted at snapshot_path into this store.
+        Returns False if there is no usable snapshot there.
+        """
+        if not snapshot_path.isfile():
+            return False
+        try:
+            with open(snapshot_path, 'rb') as snapshot_file:
+                snapshot = pickle.load(snapshot_file)
+        except Exception:  # pylint: disable=broad-except
+            log.warning("Ignoring unreadable course snapshot %s", snapshot_path, exc_info=True)
+            return False
+        snapshot.restore(self)
+        return True
+
+    def _save_snapshot(self, snapshot_path, course_dir, course_id):
+        """
+        Save a snapshot of course_dir, which loaded course_id, at snapshot_path,
+        replacing the snapshots of its earlier contents
+        """
+        try:
+            data = pickle.dumps(CourseSnapshot.from_store(self, course_dir, [course_id]), pickle.HIGHEST_PROTOCOL)
+            if not os.path.isdir(self.snapshot_dir):
+                os.makedirs(self.snapshot_dir)
+            for stale in glob.glob(self.snapshot_dir / '{0}.*.snapshot'.format(course_dir)):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    # another process got there first
+                    pass
+            # write then rename, so other processes never read a partial snapshot
+            temp_path = snapshot_path + '.{0}.tmp'.format(os.getpid())
+            with open(temp_path, 'wb') as snapshot_file:
+                snapshot_file.write(data)
+            os.rename(temp_path, snapshot_path)
+        except Exception:  # pylint: disable=broad-except
+            log.warning("Couldn't save a snapshot of course '%s'", course_dir, exc_info=True)
+
     def __unicode__(self):
         '''
         String representation - for debugging
@@ -486,6 +802,8 @@ class XMLModuleStore(ModuleStoreReadBase):
 
             self.load_extra_content(system, course_descriptor, 'about', self.data_dir / course_dir / 'about', course_dir, url_name)
 
+            self.module_indexes[course_id] = ModuleIndex(self.modules[course_id])
+
             log.debug('========> Done with course import from {0}'.format(course_dir))
             return course_descriptor
 
@@ -574,21 +892,34 @@ class XMLModuleStore(ModuleStoreReadBase):
         raise NotImplementedError("XMLModuleStores can't guarantee that definitions"
                                   " are unique. Use get_instance.")
 
+    def _module_index(self, course_id):
+        """
+        Return the ModuleIndex for course_id, (re)building it if the course's
+        modules changed since it was built (e.g. a course that failed to load)
+        """
+        modules = self.modules[course_id]
+        index = self.module_indexes.get(course_id)
+        if index is None or index.size != len(modules):
+            index = self.module_indexes[course_id] = ModuleIndex(modules)
+        return index
+
     def get_items(self, location, course_id=None, depth=0):
+        location = Location(location)
         items = []
 
-        def _add_get_items(self, location, modules):
-            for mod_loc, module in modules.iteritems():
+        def _add_get_items(course_id):
+            modules = self.modules[course_id]
+            for mod_loc in self._module_index(course_id).candidates(location):
                 # Locations match if each value in `location` is None or if the value from `location`
                 # matches the value from `mod_loc`
                 if all(goal is None or goal == value for goal, value in zip(location, mod_loc)):
-                    items.append(module)
+                    items.append(modules[mod_loc])
 
         if course_id is None:
-            for _, modules in self.modules.iteritems():
-                _add_get_items(self, location, modules)
+            for course_id in self.modules.keys():
+                _add_get_items(course_id)
         else:
-            _add_get_items(self, location, self.modules[course_id])
+            _add_get_items(course_id)
 
         return items
 
@@ -599,6 +930,19 @@ class XMLModuleStore(ModuleStoreReadBase):
         """
         return self.courses.values()
 
+    def get_course_version(self, course_id):
+        """
+        Return a token identifying the currently loaded copy of the course:
+        the xml isn't reread, so the course only changes if it's reloaded.
+        """
+        course = self.modules.get(course_id, {}).get(CourseDescriptor.id_to_location(course_id))
+        if course is None:
+            return None
+        known = self._course_versions.get(course_id)
+        if known is None or known[0] is not course:
+            known = self._course_versions[course_id] = (course, uuid4().hex)
+        return known[1]
+
     def get_errored_courses(self):
         """
         Return a dictionary of course_dir -> [(msg, exception_str)], for each
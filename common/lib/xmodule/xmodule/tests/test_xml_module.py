@@ -11,7 +11,7 @@ from xblock.fields import Scope, String, Dict, Boolean, Integer, Float, Any, Lis
 from xblock.runtime import DbModel
 
 from xmodule.fields import Date, Timedelta, RelativeTime
-from xmodule.modulestore.inheritance import InheritanceKeyValueStore, InheritanceMixin
+from xmodule.modulestore.inheritance import InheritanceKeyValueStore, InheritanceMixin, InheritedSettings
 from xmodule.xml_module import XmlDescriptor, serialize_field, deserialize_field
 from xmodule.course_module import CourseDescriptor
 from xmodule.seq_module import SequenceDescriptor
@@ -121,6 +121,16 @@ class EditableMetadataFieldsTest(unittest.TestCase):
             explicitly_set=True, value='explicit', default_value='inheritable value'
         )
 
+    def test_chained_inherited_field(self):
+        # the nearest ancestor that sets a field wins
+        inherited_settings = InheritedSettings([{'showanswer': 'from parent'}, {'showanswer': 'from course'}])
+        kvs = InheritanceKeyValueStore(initial_values={}, inherited_settings=inherited_settings)
+        descriptor = self.get_descriptor(DbModel(kvs))
+        self.assert_field_values(
+            descriptor.editable_metadata_fields, 'showanswer', InheritanceMixin.showanswer,
+            explicitly_set=False, value='from parent', default_value='from parent'
+        )
+
     def test_type_and_options(self):
         # test_display_name_field verifies that a String field is of type "Generic".
         # test_integer_field verifies that a Integer field is of type "Integer".
@@ -760,7 +760,6 @@ class XModuleDescriptor(XModuleMixin, HTMLSnippet, ResourceTemplates, XBlock):
         already supports all of the attributes needed by xmodules
         """
         assert self.xmodule_runtime is not None
-        assert self.xmodule_runtime.error_descriptor_class is not None
         if self.xmodule_runtime.xmodule_instance is None:
             try:
                 self.xmodule_runtime.construct_xblock_from_class(
@@ -775,6 +774,8 @@ class XModuleDescriptor(XModuleMixin, HTMLSnippet, ResourceTemplates, XBlock):
                 # we need to clean it out so that we can set up the ErrorModule instead
                 self.xmodule_runtime.xmodule_instance = None
 
+                # Only read now: runtimes may compute it on first use
+                assert self.xmodule_runtime.error_descriptor_class is not None
                 if isinstance(self, self.xmodule_runtime.error_descriptor_class):
                     log.exception('Error creating an ErrorModule from an ErrorDescriptor')
                     raise
@@ -172,7 +172,7 @@ class XQueueCertInterface(object):
             self.request.user = student
             self.request.session = {}
 
-            grade = grades.grade(student, self.request, course)
+            grade = grades.cached_grade(student, self.request, course)
             is_whitelisted = self.whitelist.filter(
                 user=student, course_id=course_id, whitelist=True).exists()
             enrollment_mode = CourseEnrollment.enrollment_mode_for_user(student, course_id)
@@ -20,11 +20,16 @@ from django.utils.timezone import UTC
 from student.models import CourseEnrollment
 from courseware.roles import (
     GlobalStaff, CourseStaffRole, CourseInstructorRole,
-    OrgStaffRole, OrgInstructorRole, CourseBetaTesterRole
+    OrgStaffRole, OrgInstructorRole, CourseBetaTesterRole, OrgRole,
+    ACCESS_DECISIONS_CACHE
 )
+from request_cache.middleware import RequestCache
 
 DEBUG_ACCESS = False
 
+# Name of the request cache dict of role objects, which are costly to build
+ROLES_CACHE = 'courseware.access.roles'
+
 log = logging.getLogger(__name__)
 
 
@@ -61,6 +66,9 @@ def has_access(user, obj, action, course_context=None):
 
     Returns a bool.  It is up to the caller to actually deny access in a way
     that makes sense in context.
+
+    Within a request, decisions are remembered in the request cache, and
+    forgotten when role memberships change.
     """
     # Just in case user is passed in as None, make them anonymous
     if not user:
@@ -69,23 +77,38 @@ def has_access(user, obj, action, course_context=None):
     # delegate the work to type-specific functions.
     # (start with more specific types, then get more general)
     if isinstance(obj, CourseDescriptor):
-        return _has_access_course_desc(user, obj, action)
+        return _cached_decision(
+            user, ('course', obj.location.url()), action, course_context,
+            partial(_has_access_course_desc, user, obj, action)
+        )
 
     if isinstance(obj, ErrorDescriptor):
-        return _has_access_error_desc(user, obj, action, course_context)
+        return _cached_decision(
+            user, ('error', obj.location.url()), action, course_context,
+            partial(_has_access_error_desc, user, obj, action, course_context)
+        )
 
     # NOTE: any descriptor access checkers need to go above this
     if isinstance(obj, XModuleDescriptor):
-        return _has_access_descriptor(user, obj, action, course_context)
+        return _cached_decision(
+            user, ('descriptor', obj.location.url()), action, course_context,
+            partial(_has_access_descriptor, user, obj, action, course_context)
+        )
 
     if isinstance(obj, XModule):
         return _has_access_xmodule(user, obj, action, course_context)
 
     if isinstance(obj, Location):
-        return _has_access_location(user, obj, action, course_context)
+        return _cached_decision(
+            user, ('location', obj.url()), action, course_context,
+            partial(_has_access_location, user, obj, action, course_context)
+        )
 
     if isinstance(obj, basestring):
-        return _has_access_string(user, obj, action, course_context)
+        return _cached_decision(
+            user, ('string', obj), action, course_context,
+            partial(_has_access_string, user, obj, action, course_context)
+        )
 
     # Passing an unknown object here is a coding error, so rather than
     # returning a default, complain.
@@ -327,6 +350,50 @@ def _has_access_string(user, perm, action, course_context):
 
 #####  Internal helper methods below
 
+def _cached_decision(user, obj_key, action, course_context, decide):
+    """
+    Return decide(), remembering it for the rest of the request under
+    the user, obj_key, action and course_context.
+
+    Masquerading as a student changes the decisions for staff mid-request,
+    so it is part of the key.
+    """
+    decisions = RequestCache.get_request_cache_dict(ACCESS_DECISIONS_CACHE)
+    if decisions is None:
+        return decide()
+
+    key = (user.id, is_masquerading_as_student(user), obj_key, action, course_context)
+    if key not in decisions:
+        decisions[key] = decide()
+    return decisions[key]
+
+
+def _role(role_class, location, course_context=None):
+    """
+    Return role_class for the course of location, reusing the one built
+    earlier in the request if any: building course roles may query the
+    loc_mapper.
+    """
+    if issubclass(role_class, OrgRole):
+        args = (location,)
+        key = (role_class, location.org)
+    else:
+        args = (location, course_context)
+        # the group names of a role only depend on these
+        key = (
+            role_class, location.org, location.course,
+            location.name if location.category == 'course' else None,
+            course_context,
+        )
+
+    roles = RequestCache.get_request_cache_dict(ROLES_CACHE)
+    if roles is None:
+        return role_class(*args)
+    if key not in roles:
+        roles[key] = role_class(*args)
+    return roles[key]
+
+
 def _dispatch(table, action, user, obj):
     """
     Helper: call table[action], raising a nice pretty error if there is no such key.
@@ -373,7 +440,7 @@ def _adjust_start_date_for_beta_testers(user, descriptor, course_context=None):
         # bail early if no beta testing is set up
         return descriptor.start
 
-    if CourseBetaTesterRole(descriptor.location, course_context=course_context).has_user(user):
+    if _role(CourseBetaTesterRole, descriptor.location, course_context).filter_users([user]):
         debug("Adjust start time: user in beta role for %s", descriptor)
         delta = timedelta(descriptor.days_early_for_beta)
         effective = descriptor.start - delta
@@ -409,38 +476,48 @@ def _has_access_to_location(user, location, access_level, course_context):
         debug("Deny: no user or anon user")
         return False
 
-    if is_masquerading_as_student(user):
-        return False
+    return bool(_users_with_access_to_location([user], location, access_level, course_context))
 
-    if GlobalStaff().has_user(user):
-        debug("Allow: user.is_staff")
-        return True
 
+def _users_with_access_to_location(users, location, access_level, course_context):
+    """
+    Return those of `users`, authenticated django users, that have
+    access_level access to location (see _has_access_to_location), in order.
+
+    Each role is asked about all the users at once, so this takes at most a
+    query per role, however many users there are.
+    """
     if access_level not in ('staff', 'instructor'):
         log.debug("Error in access._has_access_to_location access_level=%s unknown", access_level)
         debug("Deny: unknown access level")
-        return False
-
-    staff_access = (
-        CourseStaffRole(location, course_context).has_user(user) or
-        OrgStaffRole(location).has_user(user)
-    )
-
-    if staff_access and access_level == 'staff':
-        debug("Allow: user has course staff access")
-        return True
-
-    instructor_access = (
-        CourseInstructorRole(location, course_context).has_user(user) or
-        OrgInstructorRole(location).has_user(user)
-    )
-
-    if instructor_access and access_level in ('staff', 'instructor'):
-        debug("Allow: user has course instructor access")
-        return True
-
-    debug("Deny: user did not have correct access")
-    return False
+        return []
+
+    users = [user for user in users if not is_masquerading_as_student(user)]
+    roles = [
+        GlobalStaff(),
+        _role(CourseInstructorRole, location, course_context),
+        _role(OrgInstructorRole, location),
+    ]
+    if access_level == 'staff':
+        roles[1:1] = [_role(CourseStaffRole, location, course_context), _role(OrgStaffRole, location)]
+
+    allowed_ids = set()
+    for role in roles:
+        remaining = [user for user in users if user.id not in allowed_ids]
+        if not remaining:
+            break
+        allowed_ids.update(user.id for user in role.filter_users(remaining))
+    return [user for user in users if user.id in allowed_ids]
+
+
+def users_with_staff_access(users, course):
+    """
+    Return those of the django `users` that have staff access to `course`,
+    as has_access(user, course, 'staff') would decide for each, in order,
+    with at most a query per role.
+    """
+    users = [user for user in users if user is not None and user.is_authenticated()]
+    return _users_with_access_to_location(users, course.location, 'staff', None)
 
 
 def _has_staff_access_to_course_id(user, course_id):
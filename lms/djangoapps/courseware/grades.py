@@ -1,31 +1,110 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 from collections import defaultdict
+import hashlib
 import json
 import random
 import logging
 
 from contextlib import contextmanager
+from datetime import timedelta
 from collections import defaultdict
+from itertools import islice
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import transaction
 from django.test.client import RequestFactory
+from django.utils import timezone
 
 from dogapi import dog_stats_api
 
 from courseware import courses
+from courseware.access import has_access
 from courseware.model_data import FieldDataCache
 from xblock.fields import Scope
 from xmodule import graders
 from xmodule.graders import Score
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
-from .models import StudentModule
+from .models import StudentModule, OfflineComputedGrade
 from .module_render import get_module, get_module_for_descriptor
 
 log = logging.getLogger("edx.courseware")
 
+# How long a stored gradeset is used at most, in case something else it
+# depends on (e.g. the student's groups) changed
+CACHED_GRADE_MAX_AGE = timedelta(days=1)
+
+
+class ScoresCache(object):
+    """
+    The grade and max_grade of every StudentModule a student has in a course.
+
+    All of the rows are loaded with a single query when the cache is built, so
+    that `get_score` and the "has the student seen anything in this section"
+    check in `_grade` can be answered from memory instead of issuing one query
+    per problem (and one more per section).
+    """
+    def __init__(self, course_id, student, scores=None):
+        """
+        course_id: the course the scores are for
+        student: the User whose scores are cached
+        scores: an already loaded dict of { module_state_key : (grade, max_grade) }
+            for this student. If None, the scores are queried for.
+        """
+        self.course_id = course_id
+        # dict: { module_state_key : (grade, max_grade) }
+        self._scores = {}
+
+        if scores is not None:
+            self._scores = scores
+        elif student.is_authenticated():
+            rows = StudentModule.objects.filter(
+                student=student,
+                course_id=course_id
+            ).values_list('module_state_key', 'grade', 'max_grade')
+            for module_state_key, grade, max_grade in rows.iterator():
+                self._scores[module_state_key] = (grade, max_grade)
+
+    @classmethod
+    def for_students(cls, course_id, students, max_scores=None):
+        """
+        Return a dict mapping student id to a ScoresCache for each of `students`,
+        loading the scores of all of them with a single query.
+
+        If a `max_scores` dict is passed, it is filled in with the max_grade
+        seen for each module_state_key, so that problems a student hasn't
+        been graded on don't have to be instantiated just to find their max score.
+        """
+        scores_by_student = dict((student.id, {}) for student in students)
+        if scores_by_student:
+            rows = StudentModule.objects.filter(
+                student__in=scores_by_student.keys(),
+                course_id=course_id
+            ).values_list('student_id', 'module_state_key', 'grade', 'max_grade')
+            for student_id, module_state_key, grade, max_grade in rows.iterator():
+                scores_by_student[student_id][module_state_key] = (grade, max_grade)
+                if max_scores is not None and max_grade is not None:
+                    max_scores.setdefault(module_state_key, max_grade)
+
+        return dict(
+            (student.id, cls(course_id, student, scores_by_student[student.id]))
+            for student in students
+        )
+
+    def get(self, location):
+        """
+        Return the (grade, max_grade) tuple stored for `location`, or None if
+        the student has no StudentModule for it.
+        """
+        return self._scores.get(location.url())
+
+    def has_state_for(self, locations):
+        """
+        Return True if the student has a StudentModule for any of `locations`.
+        """
+        return any(location.url() in self._scores for location in locations)
+
 
 def yield_dynamic_descriptor_descendents(descriptor, module_creator):
     """
@@ -50,7 +129,46 @@ def yield_dynamic_descriptor_descendents(descriptor, module_creator):
         yield next_descriptor
 
 
-def answer_distributions(course_id):
+def student_answers_from_state(state):
+    """
+    Return the "student_answers" dict of a capa problem's json `state`.
+    Raises ValueError if the state can't be parsed.
+    """
+    if not state:
+        return {}
+    # decode the whole state: a "student_answers" key can also appear nested
+    # in other values (e.g. input state), or inside a student's answer
+    answers = json.loads(state).get("student_answers", {})
+    if not isinstance(answers, dict):
+        raise ValueError("student_answers is not a dict")
+    return answers
+
+
+def submitted_problem_chunks(course_id, chunk_size):
+    """
+    Yield the (id, student_id, module_state_key, state) of every submitted
+    problem in the course, in lists of at most `chunk_size` rows ordered by id.
+
+    Each chunk is fetched with its own query, starting after the last id of
+    the previous chunk, so neither the database nor this process has to hold
+    the rows of the whole course at once.
+    """
+    queryset = StudentModule.all_submitted_problems_read_only(course_id).order_by('id')
+    last_id = 0
+    while True:
+        chunk = list(
+            queryset.filter(id__gt=last_id).values_list(
+                'id', 'student_id', 'module_state_key', 'state'
+            )[:chunk_size]
+        )
+        if chunk:
+            yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_id = chunk[-1][0]
+
+
+def answer_distributions(course_id, chunk_size=None, progress_callback=None):
     """
     Given a course_id, return answer distributions in the form of a dictionary
     mapping:
@@ -78,7 +196,16 @@ def answer_distributions(course_id):
     generate the report.
 
     This method will try to use a read-replica database if one is available.
+
+    The records are read `chunk_size` (default: settings.ANSWER_DISTRIBUTION_CHUNK_SIZE)
+    at a time, and folded into the counts chunk by chunk, so memory use is
+    bounded by the number of distinct answers rather than of submissions. If
+    given, `progress_callback` is called with the number of records processed
+    after each chunk.
     """
+    if chunk_size is None:
+        chunk_size = settings.ANSWER_DISTRIBUTION_CHUNK_SIZE
+
     # dict: { module.module_state_key : (url_name, display_name) }
     state_keys_to_problem_info = {}  # For caching, used by url_and_display_name
 
@@ -106,43 +233,48 @@ def answer_distributions(course_id):
 
         return state_keys_to_problem_info[module_state_key]
 
-    # Iterate through all problems submitted for this course in no particular
-    # order, and build up our answer_counts dict that we will eventually return
+    # Iterate through all problems submitted for this course in id order, and
+    # build up our answer_counts dict that we will eventually return
     answer_counts = defaultdict(lambda: defaultdict(int))
-    for module in StudentModule.all_submitted_problems_read_only(course_id):
-        try:
-            state_dict = json.loads(module.state) if module.state else {}
-            raw_answers = state_dict.get("student_answers", {})
-        except ValueError:
-            log.error(
-                "Answer Distribution: Could not parse module state for " +
-                "StudentModule id={}, course={}".format(module.id, course_id)
-            )
-            continue
-
-        # Each problem part has an ID that is derived from the
-        # module.module_state_key (with some suffix appended)
-        for problem_part_id, raw_answer in raw_answers.items():
-            # Convert whatever raw answers we have (numbers, unicode, None, etc.)
-            # to be unicode values. Note that if we get a string, it's always
-            # unicode and not str -- state comes from the json decoder, and that
-            # always returns unicode for strings.
-            answer = unicode(raw_answer)
-
+    num_processed = 0
+    for chunk in submitted_problem_chunks(course_id, chunk_size):
+        for module_id, student_id, module_state_key, state in chunk:
             try:
-                url, display_name = url_and_display_name(module.module_state_key)
-            except ItemNotFoundError:
-                msg = "Answer Distribution: Item {} referenced in StudentModule {} " + \
-                      "for user {} in course {} not found; " + \
-                      "This can happen if a student answered a question that " + \
-                      "was later deleted from the course. This answer will be " + \
-                      "omitted from the answer distribution CSV."
-                log.warning(
-                    msg.format(module.module_state_key, module.id, module.student_id, course_id)
+                raw_answers = student_answers_from_state(state)
+            except ValueError:
+                log.error(
+                    "Answer Distribution: Could not parse module state for " +
+                    "StudentModule id={}, course={}".format(module_id, course_id)
                 )
                 continue
 
-            answer_counts[(url, display_name, problem_part_id)][answer] += 1
+            # Each problem part has an ID that is derived from the
+            # module_state_key (with some suffix appended)
+            for problem_part_id, raw_answer in raw_answers.items():
+                # Convert whatever raw answers we have (numbers, unicode, None, etc.)
+                # to be unicode values. Note that if we get a string, it's always
+                # unicode and not str -- state comes from the json decoder, and that
+                # always returns unicode for strings.
+                answer = unicode(raw_answer)
+
+                try:
+                    url, display_name = url_and_display_name(module_state_key)
+                except ItemNotFoundError:
+                    msg = "Answer Distribution: Item {} referenced in StudentModule {} " + \
+                          "for user {} in course {} not found; " + \
+                          "This can happen if a student answered a question that " + \
+                          "was later deleted from the course. This answer will be " + \
+                          "omitted from the answer distribution CSV."
+                    log.warning(
+                        msg.format(module_state_key, module_id, student_id, course_id)
+                    )
+                    continue
+
+                answer_counts[(url, display_name, problem_part_id)][answer] += 1
+
+        num_processed += len(chunk)
+        if progress_callback is not None:
+            progress_callback(num_processed)
 
     return answer_counts
 
@@ -180,6 +312,9 @@ def _grade(student, request, course, keep_raw_scores):
     grading_context = course.grading_context
     raw_scores = []
 
+    with manual_transaction():
+        scores_cache = ScoresCache(course.id, student)
+
     totaled_scores = {}
     # This next complicated loop is just to collect the totaled_scores, which is
     # passed to the grader
@@ -198,13 +333,9 @@ def _grade(student, request, course, keep_raw_scores):
 
             # If we haven't seen a single problem in the section, we don't have to grade it at all! We can assume 0%
             if not should_grade_section:
-                with manual_transaction():
-                    should_grade_section = StudentModule.objects.filter(
-                        student=student,
-                        module_state_key__in=[
-                            descriptor.location for descriptor in section['xmoduledescriptors']
-                        ]
-                    ).exists()
+                should_grade_section = scores_cache.has_state_for(
+                    descriptor.location for descriptor in section['xmoduledescriptors']
+                )
 
             if should_grade_section:
                 scores = []
@@ -219,7 +350,9 @@ def _grade(student, request, course, keep_raw_scores):
 
                 for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
 
-                    (correct, total) = get_score(course.id, student, module_descriptor, create_module)
+                    (correct, total) = get_score(
+                        course.id, student, module_descriptor, create_module, scores_cache
+                    )
                     if correct is None and total is None:
                         continue
 
@@ -251,6 +384,15 @@ def _grade(student, request, course, keep_raw_scores):
 
         totaled_scores[section_format] = format_scores
 
+    return _summarize_grade(course, totaled_scores, raw_scores, keep_raw_scores)
+
+
+def _summarize_grade(course, totaled_scores, raw_scores, keep_raw_scores):
+    """
+    Run the course grader over `totaled_scores` (a dict of section format to
+    the list of graded section totals) and return the grade summary described
+    in `_grade`.
+    """
     grade_summary = course.grader.grade(totaled_scores, generate_random_scores=settings.GENERATE_PROFILE_SCORES)
 
     # We round the grade here, to make sure that the grade is an whole percentage and
@@ -266,6 +408,125 @@ def _grade(student, request, course, keep_raw_scores):
     return grade_summary
 
 
+def _release_state(descriptor, now):
+    """
+    Return whether `descriptor` has been released by `now`, to students and to
+    beta testers.
+    """
+    if descriptor.start is None:
+        return [True, True]
+    released = descriptor.start <= now
+    if descriptor.days_early_for_beta is None:
+        return [released, released]
+    return [released, descriptor.start - timedelta(descriptor.days_early_for_beta) <= now]
+
+
+def grading_version(course):
+    """
+    Return a fingerprint of everything about `course` that a student's grade
+    depends on besides their scores: the grader, the grade cutoffs, which
+    problems (with what weights and content) make up each graded section, and
+    which of those have been released yet. Stored grades computed against a
+    different fingerprint are out of date.
+    """
+    now = timezone.now()
+    structure = []
+    for section_format, sections in sorted(course.grading_context['graded_sections'].items()):
+        for section in sections:
+            section_descriptor = section['section_descriptor']
+            structure.append([
+                section_format,
+                section_descriptor.location.url(),
+                _release_state(section_descriptor, now),
+                [
+                    [
+                        descriptor.location.url(),
+                        descriptor.weight,
+                        descriptor.graded,
+                        _release_state(descriptor, now),
+                        # The max score of problems nobody answered comes
+                        # from their content
+                        hashlib.md5(unicode(getattr(descriptor, 'data', '')).encode('utf-8')).hexdigest(),
+                    ]
+                    for descriptor in section['xmoduledescriptors']
+                ],
+            ])
+
+    fingerprint = json.dumps([course.raw_grader, course.grade_cutoffs, structure], sort_keys=True)
+    return hashlib.md5(fingerprint).hexdigest()
+
+
+def cached_grade(student, request, course):
+    """
+    Return the same summary as `grade`, but read it from the student's stored
+    OfflineComputedGrade if that is still current, and store a freshly computed
+    one otherwise.
+
+    A stored gradeset stops being current when one of the student's scores is
+    published (see `OfflineComputedGrade.invalidate`), when the course's
+    grading policy, graded content or released sections change (see
+    `grading_version`), or after CACHED_GRADE_MAX_AGE. Courses with problems
+    that always recalculate their grades are never cached.
+    """
+    grading_context = course.grading_context
+    if not student.is_authenticated() or any(
+        descriptor.always_recalculate_grades for descriptor in grading_context['all_descriptors']
+    ):
+        return grade(student, request, course)
+
+    version = grading_version(course)
+    try:
+        stored = OfflineComputedGrade.objects.get(user=student, course_id=course.id)
+    except OfflineComputedGrade.DoesNotExist:
+        # The row is created before grading, so that scores published
+        # meanwhile invalidate it (see `store_gradeset`)
+        stored, _ = OfflineComputedGrade.objects.get_or_create(user=student, course_id=course.id)
+    else:
+        if (stored.gradeset is not None and stored.grading_version == version and
+                stored.updated > timezone.now() - CACHED_GRADE_MAX_AGE):
+            return load_gradeset(stored.gradeset)
+
+    gradeset = grade(student, request, course, keep_raw_scores=True)
+    store_gradeset(student, course.id, gradeset, version, stored.generation)
+    return gradeset
+
+
+def store_gradeset(student, course_id, gradeset, version, generation):
+    """
+    Save `gradeset` (as returned by `grade`) as the student's OfflineComputedGrade
+    for `course_id`, computed against grading version `version`.
+
+    `generation` is the generation of the student's OfflineComputedGrade row,
+    read before grading. If the row has been invalidated since, a score was
+    published that `gradeset` may not include, so it isn't stored. Return
+    whether it was.
+    """
+    # Score namedtuples are serialized as lists, load_gradeset turns them back
+    updated = OfflineComputedGrade.objects.filter(
+        user=student, course_id=course_id, generation=generation
+    ).update(gradeset=json.dumps(gradeset), grading_version=version, updated=timezone.now())
+    return updated > 0
+
+
+def load_gradeset(gradeset_json):
+    """
+    Inverse of the serialization done by `store_gradeset`.
+    """
+    def load_score(score):
+        """Older gradesets stored each Score as a dict rather than a list"""
+        if isinstance(score, dict):
+            return Score(**score)
+        return Score(*score)
+
+    gradeset = json.loads(gradeset_json)
+    gradeset['totaled_scores'] = dict(
+        (section_format, [load_score(score) for score in scores])
+        for section_format, scores in gradeset.get('totaled_scores', {}).iteritems()
+    )
+    gradeset['raw_scores'] = [load_score(score) for score in gradeset.get('raw_scores', [])]
+    return gradeset
+
+
 def grade_for_percentage(grade_cutoffs, percentage):
     """
     Returns a letter grade as defined in grading_policy (e.g. 'A' 'B' 'C' for 6.002x) or None.
@@ -333,6 +594,8 @@ def _progress_summary(student, request, course):
             # This student must not have access to the course.
             return None
 
+        scores_cache = ScoresCache(course.id, student)
+
     chapters = []
     # Don't include chapters that aren't displayable (e.g. due to error)
     for chapter_module in course_module.get_display_items():
@@ -355,7 +618,9 @@ def _progress_summary(student, request, course):
 
                 for module_descriptor in yield_dynamic_descriptor_descendents(section_module, module_creator):
                     course_id = course.id
-                    (correct, total) = get_score(course_id, student, module_descriptor, module_creator)
+                    (correct, total) = get_score(
+                        course_id, student, module_descriptor, module_creator, scores_cache
+                    )
                     if correct is None and total is None:
                         continue
 
@@ -385,7 +650,7 @@ def _progress_summary(student, request, course):
 
     return chapters
 
-def get_score(course_id, user, problem_descriptor, module_creator):
+def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=None, max_scores=None):
     """
     Return the score for a user on a problem, as a tuple (correct, total).
     e.g. (5,7) if you got 5 out of 7 points.
@@ -397,7 +662,13 @@ def get_score(course_id, user, problem_descriptor, module_creator):
     problem_descriptor: an XModuleDescriptor
     module_creator: a function that takes a descriptor, and returns the corresponding XModule for this user.
            Can return None if user doesn't have access, or if something else went wrong.
-    cache: A FieldDataCache
+    scores_cache: An optional ScoresCache for this user and course. If given, the
+           stored score is read from it instead of querying the StudentModule table.
+    max_scores: An optional dict of { module_state_key : max score } shared
+           between students. When the user has no stored score for the problem,
+           its max score is looked up here (and recorded here) so the problem
+           only has to be instantiated once for everybody. The user's access to
+           the problem is still checked, as module_creator would.
     """
     if not user.is_authenticated():
         return (None, None)
@@ -418,28 +689,43 @@ def get_score(course_id, user, problem_descriptor, module_creator):
         # These are not problems, and do not have a score
         return (None, None)
 
-    try:
-        student_module = StudentModule.objects.get(
-            student=user,
-            course_id=course_id,
-            module_state_key=problem_descriptor.location
-        )
-    except StudentModule.DoesNotExist:
-        student_module = None
+    if scores_cache is not None:
+        stored_score = scores_cache.get(problem_descriptor.location)
+    else:
+        try:
+            student_module = StudentModule.objects.get(
+                student=user,
+                course_id=course_id,
+                module_state_key=problem_descriptor.location
+            )
+            stored_score = (student_module.grade, student_module.max_grade)
+        except StudentModule.DoesNotExist:
+            stored_score = None
 
-    if student_module is not None and student_module.max_grade is not None:
-        correct = student_module.grade if student_module.grade is not None else 0
-        total = student_module.max_grade
+    if stored_score is not None and stored_score[1] is not None:
+        stored_grade, total = stored_score
+        correct = stored_grade if stored_grade is not None else 0
     else:
         # If the problem was not in the cache, or hasn't been graded yet,
         # we need to instantiate the problem.
         # Otherwise, the max score (cached in student_module) won't be available
-        problem = module_creator(problem_descriptor)
-        if problem is None:
-            return (None, None)
+        module_state_key = problem_descriptor.location.url()
+        if max_scores is not None and module_state_key in max_scores:
+            # Problems the user can't load yet (e.g. not released) are left
+            # out, as module_creator leaves them out
+            if not has_access(user, problem_descriptor, 'load', course_id):
+                return (None, None)
+            total = max_scores[module_state_key]
+        else:
+            problem = module_creator(problem_descriptor)
+            if problem is None:
+                return (None, None)
+
+            total = problem.max_score()
+            if max_scores is not None:
+                max_scores[module_state_key] = total
 
         correct = 0.0
-        total = problem.max_score()
 
         # Problem may be an error module (if something in the problem builder failed)
         # In which case total might be None
@@ -450,7 +736,7 @@ def get_score(course_id, user, problem_descriptor, module_creator):
     weight = problem_descriptor.weight
     if weight is not None:
         if total == 0:
-            log.exception("Cannot reweight a problem with zero total points. Problem: " + str(student_module))
+            log.exception("Cannot reweight a problem with zero total points. Problem: " + str(problem_descriptor.location))
             return (correct, total)
         correct = correct * weight / total
         total = weight
@@ -471,7 +757,7 @@ def manual_transaction():
         transaction.commit()
 
 
-def iterate_grades_for(course_id, students):
+def iterate_grades_for(course_id, students, batch_size=None):
     """Given a course_id and an iterable of students (User), yield a tuple of:
 
     (student, gradeset, err_msg) for every student enrolled in the course.
@@ -488,6 +774,11 @@ def iterate_grades_for(course_id, students):
     - grade_breakdown : A breakdown of the major components that
         make up the final grade. (For display)
     - raw_scores: contains scores for every graded module
+
+    If `batch_size` is given, students are graded in blocks of that many (see
+    `_iterate_batched_grades`), which is much faster for large courses. Courses
+    with dynamic children (e.g. randomized content) are still graded one
+    student at a time, since the problems a student sees depend on the student.
     """
     course = courses.get_course_by_id(course_id)
 
@@ -496,6 +787,11 @@ def iterate_grades_for(course_id, students):
     # grading that student.
     request = RequestFactory().get('/')
 
+    if batch_size and not _has_dynamic_children(course):
+        for result in _iterate_batched_grades(course, students, batch_size, request):
+            yield result
+        return
+
     for student in students:
         with dog_stats_api.timer('lms.grades.iterate_grades_for', tags=['action:{}'.format(course_id)]):
             try:
@@ -518,3 +814,114 @@ def iterate_grades_for(course_id, students):
                     exc.message
                 )
                 yield student, {}, exc.message
+
+
+def _has_dynamic_children(course):
+    """
+    Return True if any descriptor that can affect grading in `course` picks
+    its children per student.
+    """
+    return any(
+        descriptor.has_dynamic_children()
+        for descriptor in course.grading_context['all_descriptors']
+    )
+
+
+def _iterate_batched_grades(course, students, batch_size, request):
+    """
+    Grade `students` in blocks of `batch_size`, yielding the same
+    (student, gradeset, err_msg) tuples as `iterate_grades_for`.
+
+    The stored scores of a whole block are loaded with one query, and each
+    student is then graded from the course's `grading_context` alone. XModules
+    are only instantiated for descriptors that always recalculate their grades,
+    and, once per report, for problems that nobody has a max_grade for yet.
+    """
+    # dict: { module_state_key : max score }, shared by every block
+    max_scores = {}
+
+    students = iter(students)
+    while True:
+        block = list(islice(students, batch_size))
+        if not block:
+            break
+
+        with manual_transaction():
+            scores_caches = ScoresCache.for_students(course.id, block, max_scores)
+
+        for student in block:
+            with dog_stats_api.timer('lms.grades.iterate_grades_for', tags=['action:{}'.format(course.id)]):
+                try:
+                    request.user = student
+                    request.session = {}
+                    gradeset = _grade_from_scores(
+                        student, request, course, scores_caches[student.id], max_scores
+                    )
+                    yield student, gradeset, ""
+                except Exception as exc:  # pylint: disable=broad-except
+                    log.exception(
+                        'Cannot grade student %s (%s) in course %s because of exception: %s',
+                        student.username,
+                        student.id,
+                        course.id,
+                        exc.message
+                    )
+                    yield student, {}, exc.message
+
+
+@transaction.commit_manually
+def _grade_from_scores(student, request, course, scores_cache, max_scores):
+    """
+    Grade `student` from the descriptors in the course's `grading_context` and
+    the scores already loaded into `scores_cache`, without walking the module
+    tree. Returns the same summary as `grade` with keep_raw_scores=True.
+    """
+    with manual_transaction():
+        raw_scores = []
+        totaled_scores = {}
+
+        def create_module(descriptor):
+            """creates an XModule instance given a descriptor"""
+            field_data_cache = FieldDataCache([descriptor], course.id, student)
+            return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
+
+        for section_format, sections in course.grading_context['graded_sections'].iteritems():
+            format_scores = []
+            for section in sections:
+                section_descriptor = section['section_descriptor']
+                section_name = section_descriptor.display_name_with_default
+                descriptors = section['xmoduledescriptors']
+
+                should_grade_section = any(
+                    descriptor.always_recalculate_grades for descriptor in descriptors
+                ) or scores_cache.has_state_for(descriptor.location for descriptor in descriptors)
+
+                if should_grade_section:
+                    scores = []
+                    for descriptor in descriptors:
+                        (correct, total) = get_score(
+                            course.id, student, descriptor, create_module, scores_cache, max_scores
+                        )
+                        if correct is None and total is None:
+                            continue
+
+                        graded = descriptor.graded
+                        if not total > 0:
+                            graded = False
+
+                        scores.append(Score(correct, total, graded, descriptor.display_name_with_default))
+
+                    _, graded_total = graders.aggregate_scores(scores, section_name)
+                    raw_scores += scores
+                else:
+                    graded_total = Score(0.0, 1.0, True, section_name)
+
+                if graded_total.possible > 0:
+                    format_scores.append(graded_total)
+                else:
+                    log.exception("Unable to grade a section with a total possible score of zero. " +
+                                  str(section_descriptor.location))
+
+            totaled_scores[section_format] = format_scores
+
+        return _summarize_grade(course, totaled_scores, raw_scores, keep_raw_scores=True)
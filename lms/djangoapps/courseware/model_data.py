@@ -4,6 +4,8 @@ Classes to provide the LMS runtime data storage to XBlocks
 
 import json
 from collections import defaultdict
+from copy import deepcopy
+from contextlib import contextmanager
 from itertools import chain
 from .models import (
     StudentModule,
@@ -16,6 +18,8 @@ import logging
 from django.db import DatabaseError
 from django.contrib.auth.models import User
 
+from xmodule.modulestore.django import modulestore
+
 from xblock.runtime import KeyValueStore
 from xblock.exceptions import KeyValueMultiSaveError, InvalidScopeError
 from xblock.fields import Scope, UserScope
@@ -38,12 +42,46 @@ def chunks(items, chunk_size):
     return (items[i:i + chunk_size] for i in xrange(0, len(items), chunk_size))
 
 
+class CacheTargets(object):
+    """
+    What a FieldDataCache has to load for a list of descriptors: for each
+    scope, the names of the fields in that scope, and the usage ids and module
+    types of the descriptors that have any of them.
+
+    Unlike the descriptors, it can be kept and reused across requests.
+    """
+    def __init__(self, descriptors):
+        self.field_names = defaultdict(set)  # scope -> field names
+        self.usage_ids = defaultdict(set)  # scope -> location urls
+        self.module_types = defaultdict(set)  # scope -> module class names
+        for descriptor in descriptors:
+            for field in descriptor.fields.values():
+                self.field_names[field.scope].add(field.name)
+                self.usage_ids[field.scope].add(descriptor.location.url())
+                self.module_types[field.scope].add(descriptor.module_class.__name__)
+
+
+class DecodedState(object):
+    """
+    The state of a StudentModule, decoded from its json, and whether it was
+    changed since
+    """
+    def __init__(self, student_module):
+        self.student_module = student_module
+        self.fields = json.loads(student_module.state)
+        self.dirty = False
+
+
+# course_id -> (course version, { location url : CacheTargets of the location and its descendants })
+_SECTION_CACHE_TARGETS = {}
+
+
 class FieldDataCache(object):
     """
     A cache of django model objects needed to supply the data
     for a module and its decendants
     """
-    def __init__(self, descriptors, course_id, user, select_for_update=False):
+    def __init__(self, descriptors, course_id, user, select_for_update=False, targets=None):
         '''
         Find any courseware.models objects that are needed by any descriptor
         in descriptors. Attempts to minimize the number of queries to the database.
@@ -55,6 +93,7 @@ class FieldDataCache(object):
         course_id: The id of the current course
         user: The user for which to cache data
         select_for_update: True if rows should be locked until end of transaction
+        targets: The CacheTargets of descriptors, if already known
         '''
         self.cache = {}
         self.descriptors = descriptors
@@ -62,9 +101,21 @@ class FieldDataCache(object):
         self.course_id = course_id
         self.user = user
 
+        # Field objects to save (and callbacks to run after saving them) when
+        # the current `deferred_writes` block exits
+        self._deferring_writes = False
+        self._pending_writes = []
+        self._after_writes = []
+        # Number of rows written through `save`
+        self.writes = 0
+        # Cache key of a StudentModule -> its DecodedState
+        self._states = {}
+
         if user.is_authenticated():
-            for scope, fields in self._fields_to_cache().items():
-                for field_object in self._retrieve_fields(scope, fields):
+            if targets is None:
+                targets = CacheTargets(descriptors)
+            for scope in targets.field_names:
+                for field_object in self._retrieve_fields(scope, targets):
                     self.cache[self._cache_key_from_field_object(scope, field_object)] = field_object
 
     @classmethod
@@ -109,6 +160,40 @@ class FieldDataCache(object):
 
         return FieldDataCache(descriptors, course_id, user, select_for_update)
 
+    @classmethod
+    def cache_for_section(cls, course_id, user, section_descriptor):
+        """
+        Return the same FieldDataCache as
+        cache_for_descriptor_descendents(course_id, user, section_descriptor, depth=None),
+        but only walk the section's descendants once per version of the course:
+        the CacheTargets found are kept in this process, so later requests for
+        the section go straight to the (one per scope) queries.
+
+        The section's descendants must already be loaded (e.g. by fetching
+        it with depth=None), since the modules built from this cache need them.
+        """
+        version = modulestore().get_course_version(course_id)
+        if version is None:
+            return cls.cache_for_descriptor_descendents(course_id, user, section_descriptor, depth=None)
+
+        course_version, section_targets = _SECTION_CACHE_TARGETS.get(course_id, (None, {}))
+        if course_version != version:
+            section_targets = {}
+            _SECTION_CACHE_TARGETS[course_id] = (version, section_targets)
+
+        section_url = section_descriptor.location.url()
+        targets = section_targets.get(section_url)
+        if targets is None:
+            descriptors = []
+            stack = [section_descriptor]
+            while stack:
+                descriptor = stack.pop()
+                descriptors.append(descriptor)
+                stack.extend(descriptor.get_children() + descriptor.get_required_module_descriptors())
+            targets = section_targets[section_url] = CacheTargets(descriptors)
+
+        return FieldDataCache([section_descriptor], course_id, user, targets=targets)
+
     def _query(self, model_class, **kwargs):
         """
         Queries model_class with **kwargs, optionally adding select_for_update if
@@ -134,7 +219,7 @@ class FieldDataCache(object):
         )
         return res
 
-    def _retrieve_fields(self, scope, fields):
+    def _retrieve_fields(self, scope, targets):
         """
         Queries the database for all of the fields in the specified scope
         """
@@ -142,7 +227,7 @@ class FieldDataCache(object):
             return self._chunked_query(
                 StudentModule,
                 'module_state_key__in',
-                (descriptor.location.url() for descriptor in self.descriptors),
+                targets.usage_ids[scope],
                 course_id=self.course_id,
                 student=self.user.pk,
             )
@@ -150,36 +235,26 @@ class FieldDataCache(object):
             return self._chunked_query(
                 XModuleUserStateSummaryField,
                 'usage_id__in',
-                (descriptor.location.url() for descriptor in self.descriptors),
-                field_name__in=set(field.name for field in fields),
+                targets.usage_ids[scope],
+                field_name__in=targets.field_names[scope],
             )
         elif scope == Scope.preferences:
             return self._chunked_query(
                 XModuleStudentPrefsField,
                 'module_type__in',
-                set(descriptor.module_class.__name__ for descriptor in self.descriptors),
+                targets.module_types[scope],
                 student=self.user.pk,
-                field_name__in=set(field.name for field in fields),
+                field_name__in=targets.field_names[scope],
             )
         elif scope == Scope.user_info:
             return self._query(
                 XModuleStudentInfoField,
                 student=self.user.pk,
-                field_name__in=set(field.name for field in fields),
+                field_name__in=targets.field_names[scope],
             )
         else:
             return []
 
-    def _fields_to_cache(self):
-        """
-        Returns a map of scopes to fields in that scope that should be cached
-        """
-        scope_map = defaultdict(set)
-        for descriptor in self.descriptors:
-            for field in descriptor.fields.values():
-                scope_map[field.scope].add(field)
-        return scope_map
-
     def _cache_key_from_kvs_key(self, key):
         """
         Return the key used in the FieldDataCache for the specified KeyValueStore key
@@ -263,6 +338,101 @@ class FieldDataCache(object):
         self.cache[cache_key] = field_object
         return field_object
 
+    def evict(self, key):
+        """
+        Forget the model data object for key, e.g. after it was deleted
+        """
+        cache_key = self._cache_key_from_kvs_key(key)
+        self.cache.pop(cache_key, None)
+        self._states.pop(cache_key, None)
+
+    def state(self, student_module):
+        """
+        Return the DecodedState of `student_module`. Its json is only parsed
+        the first time; changes made to the decoded fields are encoded again
+        when the module is written, if marked dirty.
+        """
+        cache_key = self._cache_key_from_field_object(Scope.user_state, student_module)
+        decoded = self._states.get(cache_key)
+        if decoded is None or decoded.student_module is not student_module:
+            decoded = self._states[cache_key] = DecodedState(student_module)
+        return decoded
+
+    @contextmanager
+    def deferred_writes(self):
+        """
+        Context manager making this cache a unit of work: the field objects
+        passed to `save` inside the block are written when it exits (even if
+        it raised), once each however many times they were saved.
+
+        Used around a module's handler, so that the grade a problem publishes
+        and the fields it saves afterwards end up in a single UPDATE.
+        """
+        if self._deferring_writes:
+            yield
+            return
+
+        self._deferring_writes = True
+        try:
+            yield
+        finally:
+            self._deferring_writes = False
+            self.flush()
+
+    def save(self, field_object):
+        """
+        Write `field_object` to the database, or queue it to be written at the
+        end of the current `deferred_writes` block.
+        """
+        if self._deferring_writes:
+            if not any(pending is field_object for pending in self._pending_writes):
+                self._pending_writes.append(field_object)
+        else:
+            self._write(field_object)
+
+    def after_write(self, callback):
+        """
+        Call `callback` once the writes queued so far have been made: at the
+        end of the current `deferred_writes` block, or right away outside one.
+        """
+        if self._deferring_writes:
+            self._after_writes.append(callback)
+        else:
+            callback()
+
+    def flush(self):
+        """
+        Write all the queued field objects, then run the after_write callbacks
+        """
+        pending_writes, self._pending_writes = self._pending_writes, []
+        after_writes, self._after_writes = self._after_writes, []
+        for field_object in pending_writes:
+            self._write(field_object)
+        for callback in after_writes:
+            callback()
+
+    def _write(self, field_object):
+        """
+        Save field_object. Objects loaded or created through this cache exist
+        in the database, so they are UPDATEd without checking for them first,
+        unless they turn out to have been deleted since.
+        """
+        if isinstance(field_object, StudentModule):
+            decoded = self._states.get(self._cache_key_from_field_object(Scope.user_state, field_object))
+            if decoded is not None and decoded.dirty and decoded.student_module is field_object:
+                field_object.state = json.dumps(decoded.fields)
+                decoded.dirty = False
+        if field_object.pk is None:
+            field_object.save()
+        else:
+            try:
+                field_object.save(force_update=True)
+            except DatabaseError:
+                # the row was deleted concurrently (e.g. a reset of the
+                # student's attempts), so the update affected nothing
+                field_object.save()
+        self.writes += 1
+
 
 class DjangoKeyValueStore(KeyValueStore):
     """
@@ -302,7 +472,8 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            return json.loads(field_object.state)[key.field_name]
+            # Copied, as the decoded fields are shared by all reads of the module
+            return deepcopy(self._field_data_cache.state(field_object).fields[key.field_name])
         else:
             return json.loads(field_object.value)
 
@@ -323,6 +494,8 @@ class DjangoKeyValueStore(KeyValueStore):
         saved_fields = []
         # field_objects maps a field_object to a list of associated fields
         field_objects = dict()
+        # user_state maps a StudentModule to the user_state fields to set in it
+        user_state = defaultdict(dict)
         for field in kv_dict:
             # Check field for validity
             if field.scope not in self._allowed_scopes:
@@ -337,18 +510,23 @@ class DjangoKeyValueStore(KeyValueStore):
 
             # Special case when scope is for the user state, because this scope saves fields in a single row
             if field.scope == Scope.user_state:
-                state = json.loads(field_object.state)
-                state[field.field_name] = kv_dict[field]
-                field_object.state = json.dumps(state)
+                user_state[field_object][field.field_name] = kv_dict[field]
             else:
             # The remaining scopes save fields on different rows, so
             # we don't have to worry about conflicts
                 field_object.value = json.dumps(kv_dict[field])
 
+        # The decoded state is encoded again when the StudentModule is written,
+        # so the values are copied in case the caller changes them before that
+        for field_object, fields in user_state.iteritems():
+            decoded = self._field_data_cache.state(field_object)
+            decoded.fields.update(deepcopy(fields))
+            decoded.dirty = True
+
         for field_object in field_objects:
             try:
                 # Save the field object that we made above
-                field_object.save()
+                self._field_data_cache.save(field_object)
                 # If save is successful on this scope, add the saved fields to
                 # the list of successful saves
                 saved_fields.extend([field.field_name for field in field_objects[field_object]])
@@ -365,12 +543,13 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            state = json.loads(field_object.state)
-            del state[key.field_name]
-            field_object.state = json.dumps(state)
-            field_object.save()
+            decoded = self._field_data_cache.state(field_object)
+            del decoded.fields[key.field_name]
+            decoded.dirty = True
+            self._field_data_cache.save(field_object)
         else:
             field_object.delete()
+            self._field_data_cache.evict(key)
 
     def has(self, key):
         if key.scope not in self._allowed_scopes:
@@ -381,6 +560,6 @@ class DjangoKeyValueStore(KeyValueStore):
             return False
 
         if key.scope == Scope.user_state:
-            return key.field_name in json.loads(field_object.state)
+            return key.field_name in self._field_data_cache.state(field_object).fields
         else:
             return True
@@ -15,7 +15,8 @@ ASSUMPTIONS: modules have unique IDs, even across different module_types
 from django.contrib.auth.models import User
 from django.conf import settings
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
 
@@ -226,13 +227,40 @@ class OfflineComputedGrade(models.Model):
 
     gradeset = models.TextField(null=True, blank=True)		# grades, stored as JSON
 
+    # Fingerprint of the course's grading policy and graded structure that the
+    # gradeset was computed against (see courseware.grades.grading_version)
+    grading_version = models.CharField(max_length=32, null=True, blank=True)
+
+    # Incremented each time the gradeset is invalidated, so that a gradeset
+    # computed from scores read before that isn't stored over it
+    generation = models.IntegerField(default=0)
+
     class Meta:
         unique_together = (('user', 'course_id'), )
 
+    @classmethod
+    def invalidate(cls, user_id, course_id):
+        """
+        Mark the stored gradeset for this user and course as out of date, so
+        that it is recomputed the next time it is asked for.
+        """
+        cls.objects.filter(user=user_id, course_id=course_id).update(
+            gradeset=None, generation=F('generation') + 1
+        )
+
     def __unicode__(self):
         return "[OfflineComputedGrade] %s: %s (%s) = %s" % (self.user, self.course_id, self.created, self.gradeset)
 
 
+@receiver(post_delete, sender=StudentModule)
+def invalidate_offline_grade(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Deleting a student's state (e.g. when an instructor resets it) can change
+    their grade, so drop any stored gradeset for that course.
+    """
+    OfflineComputedGrade.invalidate(instance.student_id, instance.course_id)
+
+
 class OfflineComputedGradeLog(models.Model):
     """
     Log of when offline grades are computed.
@@ -4,6 +4,7 @@ import logging
 import static_replace
 
 from functools import partial
+from lazy import lazy
 from requests.auth import HTTPBasicAuth
 from dogapi import dog_stats_api
 
@@ -20,10 +21,12 @@ from capa.xqueue_interface import XQueueInterface
 from courseware.access import has_access
 from courseware.masquerade import setup_masquerade
 from courseware.model_data import FieldDataCache, DjangoKeyValueStore
+from courseware.models import OfflineComputedGrade
 from lms.lib.xblock.field_data import LmsFieldData
-from lms.lib.xblock.runtime import LmsModuleSystem, handler_prefix, unquote_slashes
+from lms.lib.xblock.runtime import LmsModuleSystem, LazyValue, handler_prefix, unquote_slashes
 from edxmako.shortcuts import render_to_string
 from psychometrics.psychoanalyze import make_psychometrics_data_update_handler
+from request_cache.middleware import RequestCache
 from student.models import anonymous_id_for_user, user_by_anonymous_id
 from util.json_request import JsonResponse
 from util.sandboxing import can_execute_unsafe_code
@@ -36,7 +39,7 @@ from xmodule.exceptions import NotFoundError, ProcessingError
 from xmodule.modulestore import Location
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
-from xmodule_modifiers import replace_course_urls, replace_jump_to_id_urls, replace_static_urls, add_histogram, wrap_xblock
+from xmodule_modifiers import replace_urls, add_histogram, wrap_xblock
 from xmodule.lti_module import LTIModule
 
 
@@ -54,6 +57,9 @@ xqueue_interface = XQueueInterface(
     requests_auth,
 )
 
+# Name of the request cache dict of the ModuleRenderContext of each user and course
+MODULE_RENDER_CONTEXTS_CACHE = 'courseware.module_render.contexts'
+
 
 def make_track_function(request):
     '''
@@ -205,6 +211,55 @@ def get_module_for_descriptor(user, request, descriptor, field_data_cache, cours
                                               static_asset_path)
 
 
+class ModuleRenderContext(object):
+    """
+    The parts of a module's runtime that only depend on the user and the
+    course, computed when first needed. Within a request, they are shared
+    by all the modules rendered for the user in the course.
+    """
+    def __init__(self, user, course_id):
+        self.user = user
+        self.course_id = course_id
+
+    @classmethod
+    def for_user(cls, user, course_id):
+        """
+        Return the context of `user` in `course_id` for the current request,
+        or a new one outside of requests
+        """
+        contexts = RequestCache.get_request_cache_dict(MODULE_RENDER_CONTEXTS_CACHE)
+        if contexts is None:
+            return cls(user, course_id)
+
+        key = (user.id, course_id)
+        if key not in contexts:
+            contexts[key] = cls(user, course_id)
+        return contexts[key]
+
+    @lazy
+    def jump_to_id_base_url(self):
+        """
+        The url that /jump_to_id/<id> links are rewritten to, followed by the id
+        """
+        # NOTE: module_id is empty string here. The 'module_id' will get assigned in the replacement
+        # function, we just need to specify something to get the reverse() to work.
+        return reverse('jump_to_id', kwargs={'course_id': self.course_id, 'module_id': ''})
+
+    @lazy
+    def anonymous_student_id(self):
+        """
+        The per-student anonymized id of the user
+        """
+        return anonymous_id_for_user(self.user, '')
+
+    @lazy
+    def course_anonymous_student_id(self):
+        """
+        The per-course anonymized id of the user
+        """
+        return anonymous_id_for_user(self.user, self.course_id)
+
+
 def get_module_for_descriptor_internal(user, descriptor, field_data_cache, course_id,
                                        track_function, xqueue_callback_url_prefix,
                                        position=None, wrap_xmodule_display=True, grade_bucket_type=None,
@@ -222,6 +277,8 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
     student_data = DbModel(DjangoKeyValueStore(field_data_cache))
     descriptor._field_data = LmsFieldData(descriptor._field_data, student_data)
 
+    render_context = ModuleRenderContext.for_user(user, course_id)
+
 
     def make_xqueue_callback(dispatch='score_update'):
         # Fully qualified callback URL for external queueing system
@@ -308,8 +365,11 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
         # Update the grades
         student_module.grade = event.get('value')
         student_module.max_grade = event.get('max_value')
-        # Save all changes to the underlying KeyValueStore
-        student_module.save()
+        # Save all changes to the underlying KeyValueStore. Inside a handler
+        # this is deferred, and combined with the save of the module's fields
+        field_data_cache.save(student_module)
+        # The student's stored course grade no longer reflects this score
+        field_data_cache.after_write(partial(OfflineComputedGrade.invalidate, user_id, course_id))
 
         # Bin score into range and increment stats
         score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
@@ -340,32 +400,29 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
     # prefix is going to have to be specific to the module, not the directory
     # that the xml was loaded from
 
-    # Rewrite urls beginning in /static to point to course-specific content
-    block_wrappers.append(partial(
-        replace_static_urls,
-        getattr(descriptor, 'data_dir', None),
-        course_id=course_id,
-        static_asset_path=static_asset_path or descriptor.static_asset_path
-    ))
-
-    # Allow URLs of the form '/course/' refer to the root of multicourse directory
+    # In a single pass over the content:
+    # - Rewrite urls beginning in /static to point to course-specific content
+    # - Allow URLs of the form '/course/' refer to the root of multicourse directory
     #   hierarchy of this course
-    block_wrappers.append(partial(replace_course_urls, course_id))
-
-    # this will rewrite intra-courseware links (/jump_to_id/<id>). This format
-    # is an improvement over the /course/... format for studio authored courses,
-    # because it is agnostic to course-hierarchy.
-    # NOTE: module_id is empty string here. The 'module_id' will get assigned in the replacement
-    # function, we just need to specify something to get the reverse() to work.
+    # - Rewrite intra-courseware links (/jump_to_id/<id>). This format
+    #   is an improvement over the /course/... format for studio authored courses,
+    #   because it is agnostic to course-hierarchy.
     block_wrappers.append(partial(
-        replace_jump_to_id_urls,
+        replace_urls,
         course_id,
-        reverse('jump_to_id', kwargs={'course_id': course_id, 'module_id': ''}),
+        render_context.jump_to_id_base_url,
+        getattr(descriptor, 'data_dir', None),
+        static_asset_path=static_asset_path or descriptor.static_asset_path
     ))
 
     if settings.FEATURES.get('DISPLAY_HISTOGRAMS_TO_STAFF'):
-        if has_access(user, descriptor, 'staff', course_id):
-            block_wrappers.append(partial(add_histogram, user))
+        def add_histogram_for_staff(block, view, frag, context):
+            """Add the histogram if the module is rendered for staff"""
+            if has_access(user, descriptor, 'staff', course_id):
+                return add_histogram(user, block, view, frag, context)
+            return frag
+
+        block_wrappers.append(add_histogram_for_staff)
 
     # These modules store data using the anonymous_student_id as a key.
     # To prevent loss of data, we will continue to provide old modules with
@@ -373,10 +430,11 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
     # while giving selected modules a per-course anonymized id.
     # As we have the time to manually test more modules, we can add to the list
     # of modules that get the per-course anonymized id.
+    # They are only computed if the module uses them.
     if issubclass(getattr(descriptor, 'module_class', None), LTIModule):
-        anonymous_student_id = anonymous_id_for_user(user, course_id)
+        anonymous_student_id = LazyValue(lambda: render_context.course_anonymous_student_id)
     else:
-        anonymous_student_id = anonymous_id_for_user(user, '')
+        anonymous_student_id = LazyValue(lambda: render_context.anonymous_student_id)
 
     system = LmsModuleSystem(
         track_function=track_function,
@@ -405,7 +463,7 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
         replace_jump_to_id_urls=partial(
             static_replace.replace_jump_to_id_urls,
             course_id=course_id,
-            jump_to_id_base_url=reverse('jump_to_id', kwargs={'course_id': course_id, 'module_id': ''})
+            jump_to_id_base_url=render_context.jump_to_id_base_url
         ),
         node_path=settings.NODE_PATH,
         publish=publish,
@@ -429,13 +487,13 @@ def get_module_for_descriptor_internal(user, descriptor, field_data_cache, cours
             make_psychometrics_data_update_handler(course_id, user, descriptor.location.url())
         )
 
-    system.set('user_is_staff', has_access(user, descriptor.location, 'staff', course_id))
+    # Only checked if the module needs to know
+    system.user_is_staff = LazyValue(partial(has_access, user, descriptor.location, 'staff', course_id))
 
     # make an ErrorDescriptor -- assuming that the descriptor's system is ok
-    if has_access(user, descriptor.location, 'staff', course_id):
-        system.error_descriptor_class = ErrorDescriptor
-    else:
-        system.error_descriptor_class = NonStaffErrorDescriptor
+    system.error_descriptor_class = LazyValue(
+        lambda: ErrorDescriptor if system.user_is_staff else NonStaffErrorDescriptor
+    )
 
     descriptor.xmodule_runtime = system
     descriptor.scope_ids = descriptor.scope_ids._replace(user_id=user.id)
@@ -571,7 +629,10 @@ def _invoke_xblock_handler(request, course_id, usage_id, handler, suffix, user):
 
     req = django_to_webob_request(request)
     try:
-        resp = instance.handle(handler, req, suffix)
+        # Coalesce the grade the handler publishes and the fields it changes
+        # into one write per row
+        with field_data_cache.deferred_writes():
+            resp = instance.handle(handler, req, suffix)
 
     except NoSuchHandlerError:
         log.exception("XBlock %s attempted to access missing handler %r", instance, handler)
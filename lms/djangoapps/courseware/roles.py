@@ -4,14 +4,36 @@ adding users, removing users, and listing members
 """
 
 from abc import ABCMeta, abstractmethod
+import operator
 
 from django.contrib.auth.models import User, Group
+from django.db.models import Q
 
 from xmodule.modulestore import Location
 from xmodule.modulestore.exceptions import InvalidLocationError, ItemNotFoundError
 from xmodule.modulestore.django import loc_mapper
 from xmodule.modulestore.locator import CourseLocator
 
+from request_cache.middleware import RequestCache
+
+# Name of the request cache dict of courseware.access decisions, which have to
+# be forgotten when role memberships change
+ACCESS_DECISIONS_CACHE = 'courseware.access.decisions'
+
+# Name of the request cache dict mapping the group names of a GroupBasedRole
+# to the ids of its members
+ROLE_MEMBERS_CACHE = 'courseware.roles.members'
+
+
+def forget_access_decisions():
+    """
+    Clear the access decisions and role memberships cached for the current request
+    """
+    for name in (ACCESS_DECISIONS_CACHE, ROLE_MEMBERS_CACHE):
+        cached = RequestCache.get_request_cache_dict(name)
+        if cached is not None:
+            cached.clear()
+
 
 class CourseContextRequired(Exception):
     """
@@ -54,6 +76,14 @@ class AccessRole(object):
         """
         return User.objects.none()
 
+    def filter_users(self, users):
+        """
+        Return the supplied django users that have this role, in order.
+
+        Subclasses answer this for all the users at once.
+        """
+        return [user for user in users if self.has_user(user)]
+
 
 class GlobalStaff(AccessRole):
     """
@@ -66,15 +96,20 @@ class GlobalStaff(AccessRole):
         for user in users:
             user.is_staff = True
             user.save()
+        forget_access_decisions()
 
     def remove_users(self, *users):
         for user in users:
             user.is_staff = False
             user.save()
+        forget_access_decisions()
 
     def users_with_role(self):
         raise Exception("This operation is un-indexed, and shouldn't be used")
 
+    def filter_users(self, users):
+        return [user for user in users if user.is_staff]
+
 
 class GroupBasedRole(AccessRole):
     """
@@ -100,6 +135,10 @@ class GroupBasedRole(AccessRole):
         if not user.is_authenticated():
             return False
 
+        members = self._cached_member_ids()
+        if members is not None:
+            return user.id in members
+
         if not hasattr(user, '_groups'):
             user._groups = set(name.lower() for name in user.groups.values_list('name', flat=True))
 
@@ -114,6 +153,7 @@ class GroupBasedRole(AccessRole):
         for user in users:
             if hasattr(user, '_groups'):
                 del user._groups
+        forget_access_decisions()
 
     def remove_users(self, *users):
         """
@@ -124,6 +164,7 @@ class GroupBasedRole(AccessRole):
         for user in users:
             if hasattr(user, '_groups'):
                 del user._groups
+        forget_access_decisions()
 
     def users_with_role(self):
         """
@@ -131,6 +172,54 @@ class GroupBasedRole(AccessRole):
         """
         return User.objects.filter(groups__name__in=self._group_names)
 
+    def filter_users(self, users):
+        """
+        Return the supplied django users that have this role, in order, with
+        at most one query.
+
+        Within a request, the ids of all the members of the role are loaded
+        instead, and kept until the end of the request (or until a role
+        changes), so that later checks of the role don't query at all. A
+        single user is checked with has_user instead, as the groups it loads
+        also answer the user's other roles.
+        """
+        users = [user for user in users if user.is_authenticated()]
+        if not users:
+            return []
+
+        members = self._cached_member_ids()
+        if members is None and len(users) == 1:
+            return [user for user in users if self.has_user(user)]
+        if members is None:
+            cached = RequestCache.get_request_cache_dict(ROLE_MEMBERS_CACHE)
+            member_query = self._member_query()
+            if cached is None:
+                # no request to keep them for, so only look for these users
+                member_query = member_query.filter(id__in=[user.id for user in users])
+            members = frozenset(member_query.values_list('id', flat=True))
+            if cached is not None:
+                cached[tuple(self._group_names)] = members
+        return [user for user in users if user.id in members]
+
+    def _member_query(self):
+        """
+        Return a QuerySet of the users with this role. Unlike users_with_role,
+        it matches group names ignoring case, as has_user does.
+        """
+        return User.objects.filter(
+            reduce(operator.or_, (Q(groups__name__iexact=name) for name in self._group_names))
+        ).distinct()
+
+    def _cached_member_ids(self):
+        """
+        Return the ids of the members of this role loaded during the current
+        request, or None
+        """
+        cached = RequestCache.get_request_cache_dict(ROLE_MEMBERS_CACHE)
+        if cached is None:
+            return None
+        return cached.get(tuple(self._group_names))
+
 
 class CourseRole(GroupBasedRole):
     """
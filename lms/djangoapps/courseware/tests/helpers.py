@@ -1,13 +1,32 @@
 import json
+from contextlib import contextmanager
 
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db import connection
 
 from student.models import Registration
 
 from django.test import TestCase
 
 
+@contextmanager
+def count_queries():
+    """
+    Yields a list that, once the block exits, holds the SQL queries that were
+    run inside of it.
+    """
+    old_debug_cursor = connection.use_debug_cursor
+    connection.use_debug_cursor = True
+    start = len(connection.queries)
+    queries = []
+    try:
+        yield queries
+    finally:
+        queries.extend(connection.queries[start:])
+        connection.use_debug_cursor = old_debug_cursor
+
+
 def check_for_get_code(self, code, url):
         """
         Check that we got the expected code when accessing url via GET.
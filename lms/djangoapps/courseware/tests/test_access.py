@@ -1,7 +1,7 @@
 import courseware.access as access
 import datetime
 
-from mock import Mock
+from mock import Mock, patch
 
 from django.test import TestCase
 from django.test.utils import override_settings
@@ -10,6 +10,9 @@ from courseware.tests.factories import UserFactory, CourseEnrollmentAllowedFacto
 from student.tests.factories import AnonymousUserFactory
 from xmodule.modulestore import Location
 from courseware.tests.tests import TEST_DATA_MIXED_MODULESTORE
+from courseware.roles import CourseStaffRole
+from request_cache.middleware import RequestCache
+from xmodule.modulestore.django import loc_mapper
 import pytz
 
 
@@ -50,6 +53,16 @@ class AccessTestCase(TestCase):
         self.assertFalse(access._has_access_to_location(self.student, self.course, 'staff', None))
         self.assertFalse(access._has_access_to_location(self.student, self.course, 'instructor', None))
 
+    def test_users_with_staff_access(self):
+        course = Mock(location=self.course)
+        users = [None, self.anonymous_user, self.student, self.global_staff, self.course_staff, self.course_instructor]
+        # a query per course and org role, whatever the number of users
+        with self.assertNumQueries(4):
+            self.assertEqual(
+                access.users_with_staff_access(users, course),
+                [self.global_staff, self.course_staff, self.course_instructor]
+            )
+
     def test__has_access_string(self):
         u = Mock(is_staff=True)
         self.assertFalse(access._has_access_string(u, 'not_global', 'staff', None))
@@ -102,3 +115,45 @@ class AccessTestCase(TestCase):
     def test__user_passed_as_none(self):
         """Ensure has_access handles a user being passed as null"""
         access.has_access(None, 'global', 'staff', None)
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class RequestCachedAccessTestCase(TestCase):
+    """
+    Tests for the caching of access decisions and roles within a request
+    """
+
+    def setUp(self):
+        self.course = Location('i4x://edX/toy/course/2012_Fall')
+        self.course_id = 'edX/toy/2012_Fall'
+        self.student = UserFactory()
+        self.course_staff = StaffFactory(course=self.course)
+
+        middleware = RequestCache()
+        middleware.process_request(None)
+        self.addCleanup(middleware.process_response, None, None)
+
+    def test_roles_built_once_per_course(self):
+        with patch('courseware.roles.loc_mapper', wraps=loc_mapper) as mock_loc_mapper:
+            for i in range(50):
+                location = Location('i4x', 'edX', 'toy', 'html', 'html_{}'.format(i))
+                self.assertFalse(access.has_access(self.student, location, 'staff', self.course_id))
+                self.assertFalse(access.has_access(self.student, location, 'staff', self.course_id))
+        # one CourseStaffRole and one CourseInstructorRole
+        self.assertEquals(mock_loc_mapper.call_count, 2)
+
+    def test_decisions_forgotten_when_roles_change(self):
+        self.assertFalse(access.has_access(self.student, self.course, 'staff'))
+        CourseStaffRole(self.course).add_users(self.student)
+        self.assertTrue(access.has_access(self.student, self.course, 'staff'))
+        CourseStaffRole(self.course).remove_users(self.student)
+        self.assertFalse(access.has_access(self.student, self.course, 'staff'))
+
+    def test_masquerading_changes_decisions(self):
+        self.assertTrue(access.has_access(self.course_staff, self.course, 'staff'))
+        self.course_staff.masquerade_as_student = True
+        self.assertFalse(access.has_access(self.course_staff, self.course, 'staff'))
+
+    def test_not_cached_outside_requests(self):
+        RequestCache().process_response(None, None)
+        self.assertIsNone(RequestCache.get_request_cache_dict(access.ROLES_CACHE))
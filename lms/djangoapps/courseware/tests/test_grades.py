@@ -1,16 +1,25 @@
 """
 Test grade calculation.
 """
+
+from datetime import datetime, timedelta
+
 from django.http import Http404
+from django.test.client import RequestFactory
 from django.test.utils import override_settings
 from mock import patch
+from pytz import UTC
 
+from courseware.tests.factories import StudentModuleFactory
+from courseware.tests.helpers import count_queries
 from courseware.tests.modulestore_config import TEST_DATA_MIXED_MODULESTORE
 from student.tests.factories import UserFactory
-from xmodule.modulestore.tests.factories import CourseFactory
+from xmodule.modulestore.django import modulestore
+from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 
-from courseware.grades import grade, iterate_grades_for
+from courseware.grades import CACHED_GRADE_MAX_AGE, cached_grade, grade, grading_version, iterate_grades_for
+from courseware.models import OfflineComputedGrade
 
 
 def _grade_with_errors(student, request, course, keep_raw_scores=False):
@@ -105,8 +114,21 @@ class TestGradeIteration(ModuleStoreTestCase):
         self.assertTrue(all_gradesets[student2])
         self.assertTrue(all_gradesets[student5])
 
+    def test_batched_grades_match_unbatched(self):
+        """Grading in batches should give every student the same grades as
+        grading them one at a time."""
+        unbatched_gradesets, _ = self._gradesets_and_errors_for(self.course.id, self.students)
+        batched_gradesets, batched_errors = self._gradesets_and_errors_for(
+            self.course.id, self.students, batch_size=2
+        )
+        self.assertEqual(len(batched_errors), 0)
+        self.assertEqual(len(batched_gradesets), len(self.students))
+        for student in self.students:
+            self.assertEqual(batched_gradesets[student]['grade'], unbatched_gradesets[student]['grade'])
+            self.assertEqual(batched_gradesets[student]['percent'], unbatched_gradesets[student]['percent'])
+
     ################################# Helpers #################################
-    def _gradesets_and_errors_for(self, course_id, students):
+    def _gradesets_and_errors_for(self, course_id, students, batch_size=None):
         """Simple helper method to iterate through student grades and give us
         two dictionaries -- one that has all students and their respective
         gradesets, and one that has only students that could not be graded and
@@ -114,9 +136,186 @@ class TestGradeIteration(ModuleStoreTestCase):
         students_to_gradesets = {}
         students_to_errors = {}
 
-        for student, gradeset, err_msg in iterate_grades_for(course_id, students):
+        for student, gradeset, err_msg in iterate_grades_for(course_id, students, batch_size):
             students_to_gradesets[student] = gradeset
             if err_msg:
                 students_to_errors[student] = err_msg
 
         return students_to_gradesets, students_to_errors
+
+
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+class TestGradingFromStoredScores(ModuleStoreTestCase):
+    """
+    Test grading a student who has stored scores for a course's problems.
+    """
+    COURSE_NUM = "1001"
+    COURSE_NAME = "grading_query_count_course"
+
+    def setUp(self):
+        self.course = CourseFactory.create(
+            display_name=self.COURSE_NAME,
+            number=self.COURSE_NUM
+        )
+        chapter = ItemFactory.create(parent_location=self.course.location, category='chapter')
+        self.section = ItemFactory.create(
+            parent_location=chapter.location,
+            category='sequential',
+            metadata={'graded': True, 'format': 'Homework'}
+        )
+        self.student = UserFactory.create()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.student
+        self.request.session = {}
+
+    def _add_answered_problems(self, count):
+        """
+        Add `count` problems to the graded section, each with a StudentModule
+        holding a stored score for our student.
+        """
+        for _ in range(count):
+            problem = ItemFactory.create(parent_location=self.section.location, category='problem')
+            StudentModuleFactory.create(
+                student=self.student,
+                course_id=self.course.id,
+                module_state_key=problem.location.url(),
+                grade=1,
+                max_grade=1,
+            )
+        self.course = modulestore().get_instance(self.course.id, self.course.location)
+
+    def _grade_query_count(self):
+        """Number of queries run to grade our student."""
+        with count_queries() as queries:
+            grade(self.student, self.request, self.course)
+        return len(queries)
+
+    def test_grade_query_count_is_constant(self):
+        self._add_answered_problems(2)
+        few_problems = self._grade_query_count()
+
+        self._add_answered_problems(10)
+        many_problems = self._grade_query_count()
+
+        self.assertEqual(few_problems, many_problems)
+
+    def test_grade_uses_stored_scores(self):
+        self._add_answered_problems(3)
+        gradeset = grade(self.student, self.request, self.course, keep_raw_scores=True)
+        self.assertEqual([score.earned for score in gradeset['raw_scores']], [1, 1, 1])
+
+
+    def test_batched_grading_uses_stored_scores(self):
+        self._add_answered_problems(3)
+        results = list(iterate_grades_for(self.course.id, [self.student], batch_size=10))
+        self.assertEqual(len(results), 1)
+        _, gradeset, err_msg = results[0]
+        self.assertEqual(err_msg, "")
+        self.assertEqual([score.earned for score in gradeset['raw_scores']], [1, 1, 1])
+
+    @patch.dict('courseware.access.settings.FEATURES', {'DISABLE_START_DATES': False})
+    def test_batched_grading_skips_unreleased_problems(self):
+        self._add_answered_problems(1)
+        unreleased = ItemFactory.create(
+            parent_location=self.section.location,
+            category='problem',
+            metadata={'start': '2100-01-01T00:00:00Z'},
+        )
+        # Somebody else (e.g. staff) has a max_grade for the unreleased problem
+        other_student = UserFactory.create()
+        StudentModuleFactory.create(
+            student=other_student,
+            course_id=self.course.id,
+            module_state_key=unreleased.location.url(),
+            grade=1,
+            max_grade=1,
+        )
+        self.course = modulestore().get_instance(self.course.id, self.course.location)
+
+        students = [other_student, self.student]
+        unbatched = dict(
+            (student, gradeset) for student, gradeset, _ in iterate_grades_for(self.course.id, students)
+        )
+        batched = dict(
+            (student, gradeset) for student, gradeset, _ in iterate_grades_for(self.course.id, students, batch_size=10)
+        )
+        self.assertEqual(unbatched[self.student]['percent'], batched[self.student]['percent'])
+        self.assertEqual(
+            [score.possible for score in batched[self.student]['raw_scores']],
+            [1],
+        )
+
+    def test_cached_grade_is_stored_and_reused(self):
+        self._add_answered_problems(2)
+        first = cached_grade(self.student, self.request, self.course)
+        self.assertTrue(
+            OfflineComputedGrade.objects.filter(user=self.student, course_id=self.course.id).exists()
+        )
+
+        with patch('courseware.grades.grade') as mock_grade:
+            # Reading a current gradeset doesn't write anything
+            with self.assertNumQueries(1):
+                second = cached_grade(self.student, self.request, self.course)
+            self.assertFalse(mock_grade.called)
+
+        self.assertEqual(first['percent'], second['percent'])
+        self.assertEqual(first['totaled_scores'], second['totaled_scores'])
+
+    def test_cached_grade_is_invalidated(self):
+        self._add_answered_problems(2)
+        cached_grade(self.student, self.request, self.course)
+
+        OfflineComputedGrade.invalidate(self.student.id, self.course.id)
+        with patch('courseware.grades.grade', wraps=grade) as mock_grade:
+            cached_grade(self.student, self.request, self.course)
+            self.assertTrue(mock_grade.called)
+
+    def test_cached_grade_tracks_course_structure(self):
+        self._add_answered_problems(2)
+        first = cached_grade(self.student, self.request, self.course)
+
+        # Adding a problem changes the course's grading version, so the
+        # stored gradeset has to be recomputed
+        self._add_answered_problems(1)
+        second = cached_grade(self.student, self.request, self.course)
+        self.assertEqual(len(second['raw_scores']), len(first['raw_scores']) + 1)
+
+    def test_cached_grade_not_stored_if_invalidated_while_grading(self):
+        self._add_answered_problems(2)
+
+        def grade_then_publish(*args, **kwargs):
+            """A score is published after the scores were read"""
+            gradeset = grade(*args, **kwargs)
+            OfflineComputedGrade.invalidate(self.student.id, self.course.id)
+            return gradeset
+
+        with patch('courseware.grades.grade', side_effect=grade_then_publish):
+            cached_grade(self.student, self.request, self.course)
+
+        stored = OfflineComputedGrade.objects.get(user=self.student, course_id=self.course.id)
+        self.assertIsNone(stored.gradeset)
+        self.assertEqual(stored.generation, 1)
+
+    def test_cached_grade_tracks_releases(self):
+        self._add_answered_problems(1)
+        ItemFactory.create(
+            parent_location=self.section.location,
+            category='problem',
+            metadata={'start': '2100-01-01T00:00:00Z'},
+        )
+        self.course = modulestore().get_instance(self.course.id, self.course.location)
+        version = grading_version(self.course)
+
+        with patch('courseware.grades.timezone.now', return_value=datetime(2100, 1, 2, tzinfo=UTC)):
+            self.assertNotEqual(grading_version(self.course), version)
+
+    def test_cached_grade_expires(self):
+        self._add_answered_problems(1)
+        cached_grade(self.student, self.request, self.course)
+
+        OfflineComputedGrade.objects.filter(user=self.student, course_id=self.course.id).update(
+            updated=datetime.now(UTC) - CACHED_GRADE_MAX_AGE - timedelta(minutes=1)
+        )
+        with patch('courseware.grades.grade', wraps=grade) as mock_grade:
+            cached_grade(self.student, self.request, self.course)
+            self.assertTrue(mock_grade.called)
@@ -153,6 +153,165 @@ class TestStudentModuleStorage(TestCase):
         self.assertEquals(len(exception_context.exception.saved_field_names), 0)
 
 
+class TestDecodedState(TestCase):
+    """
+    Check that each StudentModule's state is decoded once per FieldDataCache,
+    and only encoded again when it changed
+    """
+    def setUp(self):
+        # about 50KB, like the state of a capa problem with many inputs
+        state = dict(('field_%d' % i, ['answer %d' % i] * 100) for i in range(50))
+        student_module = StudentModuleFactory(state=json.dumps(state))
+        self.user = student_module.student
+        self.field_names = sorted(state)[:12]
+        self.descriptor = mock_descriptor([mock_field(Scope.user_state, name) for name in self.field_names])
+
+    def _read_fields(self):
+        """Read a dozen fields from a new FieldDataCache, as a capa module would"""
+        kvs = DjangoKeyValueStore(FieldDataCache([self.descriptor], course_id, self.user))
+        return [kvs.get(user_state_key(name)) for name in self.field_names]
+
+    def test_decoded_once(self):
+        with patch('courseware.model_data.json', wraps=json) as mock_json:
+            self._read_fields()
+        self.assertEquals(mock_json.loads.call_count, 1)
+        self.assertFalse(mock_json.dumps.called)
+
+    def test_reads_are_copies(self):
+        kvs = DjangoKeyValueStore(FieldDataCache([self.descriptor], course_id, self.user))
+        kvs.get(user_state_key('field_0')).append('changed')
+        self.assertNotIn('changed', kvs.get(user_state_key('field_0')))
+
+    def test_encoded_when_written(self):
+        field_data_cache = FieldDataCache([self.descriptor], course_id, self.user)
+        kvs = DjangoKeyValueStore(field_data_cache)
+        value = ['new value']
+        with field_data_cache.deferred_writes():
+            kvs.set(user_state_key('field_0'), value)
+            kvs.delete(user_state_key('field_1'))
+            value.append('changed after set')
+        state = json.loads(StudentModule.objects.get().state)
+        self.assertEquals(state['field_0'], ['new value'])
+        self.assertNotIn('field_1', state)
+
+
+class TestDeferredWrites(TestCase):
+    """
+    Check that writes made inside FieldDataCache.deferred_writes are
+    coalesced into one save per row when the block exits
+    """
+    def setUp(self):
+        student_module = StudentModuleFactory(state=json.dumps({'a_field': 'a_value', 'b_field': 'b_value'}))
+        self.user = student_module.student
+        self.assertEqual(self.user.id, 1)   # check our assumption hard-coded in the key functions above.
+        self.field_data_cache = FieldDataCache([mock_descriptor([mock_field(Scope.user_state, 'a_field')])], course_id, self.user)
+        self.kvs = DjangoKeyValueStore(self.field_data_cache)
+
+    def test_writes_outside_block_are_immediate(self):
+        self.kvs.set(user_state_key('a_field'), 'new_value')
+        self.kvs.set(user_state_key('b_field'), 'new_value')
+        self.assertEquals(self.field_data_cache.writes, 2)
+
+    def test_writes_are_coalesced(self):
+        callback = Mock()
+        with self.field_data_cache.deferred_writes():
+            student_module = self.field_data_cache.find_or_create(user_state_key('a_field'))
+            student_module.grade = 1
+            student_module.max_grade = 2
+            self.field_data_cache.save(student_module)
+            self.field_data_cache.after_write(callback)
+            self.kvs.set_many({user_state_key('a_field'): 'new_value', user_state_key('c_field'): 'c_value'})
+
+            # nothing has been written yet, but reads see the changes
+            self.assertEquals(self.field_data_cache.writes, 0)
+            self.assertFalse(callback.called)
+            self.assertEquals(self.kvs.get(user_state_key('a_field')), 'new_value')
+            self.assertEquals(json.loads(StudentModule.objects.get().state)['a_field'], 'a_value')
+
+        self.assertEquals(self.field_data_cache.writes, 1)
+        callback.assert_called_once_with()
+        student_module = StudentModule.objects.get()
+        self.assertEquals((student_module.grade, student_module.max_grade), (1, 2))
+        self.assertEquals(
+            {'a_field': 'new_value', 'b_field': 'b_value', 'c_field': 'c_value'},
+            json.loads(student_module.state)
+        )
+
+    def test_write_after_concurrent_delete(self):
+        self.assertEquals(self.kvs.get(user_state_key('a_field')), 'a_value')
+        StudentModule.objects.all().delete()
+        self.kvs.set(user_state_key('a_field'), 'new_value')
+        self.assertEquals(json.loads(StudentModule.objects.get().state)['a_field'], 'new_value')
+
+    def test_writes_are_flushed_on_error(self):
+        with self.assertRaises(ValueError):
+            with self.field_data_cache.deferred_writes():
+                self.kvs.set(user_state_key('a_field'), 'new_value')
+                raise ValueError()
+        self.assertEquals(json.loads(StudentModule.objects.get().state)['a_field'], 'new_value')
+
+
+class TestCacheForSection(TestCase):
+    """
+    Check that FieldDataCache.cache_for_section reuses what it learned about
+    a section until the course changes
+    """
+    def setUp(self):
+        student_module = StudentModuleFactory(state=json.dumps({'a_field': 'a_value'}))
+        self.user = student_module.student
+        self.problem = mock_descriptor([mock_field(Scope.user_state, 'a_field')])
+        self.html = mock_descriptor([mock_field(Scope.settings, 'display_name')])
+        self.html.location = location('html_id')
+        self.section = mock_descriptor([mock_field(Scope.settings, 'display_name')])
+        self.section.location = location('section_id')
+        for descriptor in (self.problem, self.html, self.section):
+            descriptor.get_children.return_value = []
+            descriptor.get_required_module_descriptors.return_value = []
+        self.section.get_children.return_value = [self.problem, self.html]
+
+        self.store = Mock()
+        self.store.get_course_version.return_value = 'v1'
+        patcher = patch('courseware.model_data.modulestore', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = patch.dict('courseware.model_data._SECTION_CACHE_TARGETS', clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_loads_descendants(self):
+        field_data_cache = FieldDataCache.cache_for_section(course_id, self.user, self.section)
+        self.assertEquals(
+            'a_value',
+            DjangoKeyValueStore(field_data_cache).get(user_state_key('a_field'))
+        )
+
+    def test_only_queries_modules_with_user_state(self):
+        with patch.object(FieldDataCache, '_chunked_query', return_value=[]) as chunked_query:
+            FieldDataCache.cache_for_section(course_id, self.user, self.section)
+        chunked_query.assert_called_once_with(
+            StudentModule,
+            'module_state_key__in',
+            set([location('def_id').url()]),
+            course_id=course_id,
+            student=self.user.pk,
+        )
+
+    def test_descendants_walked_once_per_version(self):
+        FieldDataCache.cache_for_section(course_id, self.user, self.section)
+        FieldDataCache.cache_for_section(course_id, self.user, self.section)
+        self.assertEquals(self.section.get_children.call_count, 1)
+
+        self.store.get_course_version.return_value = 'v2'
+        FieldDataCache.cache_for_section(course_id, self.user, self.section)
+        self.assertEquals(self.section.get_children.call_count, 2)
+
+    def test_no_course_version(self):
+        self.store.get_course_version.return_value = None
+        FieldDataCache.cache_for_section(course_id, self.user, self.section)
+        FieldDataCache.cache_for_section(course_id, self.user, self.section)
+        self.assertEquals(self.section.get_children.call_count, 2)
+
+
 class TestMissingStudentModule(TestCase):
     def setUp(self):
         self.user = UserFactory.create(username='user')
@@ -29,6 +29,8 @@ from courseware.model_data import FieldDataCache
 from courseware.courses import get_course_with_access, course_image_url, get_course_info_section
 
 from .factories import UserFactory
+from request_cache.middleware import RequestCache
+from student.models import anonymous_id_for_user
 from lms.lib.xblock.runtime import quote_slashes
 
 
@@ -592,3 +594,81 @@ class TestAnonymousStudentId(ModuleStoreTestCase, LoginEnrollmentTestCase):
             'f82b5416c9f54b5ce33989511bb5ef2e',
             self._get_anonymous_id('MITx/6.00x/2013_Spring', descriptor_class)
         )
+
+
+class TestLazyRuntime(ModuleStoreTestCase):
+    """
+    Test that the parts of module runtimes that don't depend on the module
+    are computed when used, once per request
+    """
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.request.session = {}
+        self.course = CourseFactory.create()
+        self.sequence = ItemFactory.create(category='sequential', parent_location=self.course.location)
+        for i in range(40):
+            vertical = ItemFactory.create(category='vertical', parent_location=self.sequence.location)
+            ItemFactory.create(
+                category='html',
+                parent_location=vertical.location,
+                data='<a href="/jump_to_id/{}">Link</a> for %%USER_ID%%'.format(i),
+            )
+        self.sequence = modulestore().get_instance(self.course.id, self.sequence.location, depth=None)
+
+    def _render_sequence(self):
+        """
+        Render the sequence, returning its html, the number of calls to
+        module_render.reverse and anonymous_id_for_user
+        """
+        field_data_cache = FieldDataCache.cache_for_descriptor_descendents(
+            self.course.id, self.user, self.sequence, depth=None
+        )
+        with patch('courseware.module_render.reverse', wraps=reverse) as mock_reverse:
+            with patch('courseware.module_render.anonymous_id_for_user', wraps=anonymous_id_for_user) as mock_anon_id:
+                module = render.get_module_for_descriptor(
+                    self.user, self.request, self.sequence, field_data_cache, self.course.id
+                )
+                html = module.render('student_view').content
+        return html, mock_reverse.call_count, mock_anon_id.call_count
+
+    def test_services_shared_within_request(self):
+        middleware = RequestCache()
+        middleware.process_request(self.request)
+        try:
+            html, reverse_calls, anon_id_calls = self._render_sequence()
+        finally:
+            middleware.process_response(self.request, None)
+
+        self.assertIn(anonymous_id_for_user(self.user, ''), html)
+        self.assertIn('/jump_to_id/39', html)
+        self.assertEquals(reverse_calls, 1)
+        self.assertEquals(anon_id_calls, 1)
+
+        # outside of a request, every one of the 40 html modules computes its own
+        _, uncached_reverse_calls, uncached_anon_id_calls = self._render_sequence()
+        self.assertGreaterEqual(uncached_reverse_calls, 40)
+        self.assertGreaterEqual(uncached_anon_id_calls, 40)
+
+    @patch.dict(settings.FEATURES, {'DISPLAY_HISTOGRAMS_TO_STAFF': False})
+    def test_staff_checked_when_used(self):
+        with patch('courseware.module_render.has_access', return_value=True) as mock_has_access:
+            field_data_cache = FieldDataCache.cache_for_descriptor_descendents(
+                self.course.id, self.user, self.sequence, depth=None
+            )
+            module = render.get_module_for_descriptor_internal(
+                self.user, self.sequence, field_data_cache, self.course.id, Mock(), Mock()
+            )
+
+            # Rendering the sequence and its children instantiates all their
+            # xmodules, but none of them needs to know whether the user is staff
+            module.render('student_view')
+            staff_checks = [args for args, _ in mock_has_access.call_args_list if args[2] == 'staff']
+            self.assertEquals(staff_checks, [])
+
+            self.assertTrue(module.xmodule_runtime.user_is_staff)
+            self.assertTrue(module.xmodule_runtime.get('user_is_staff'))
+            staff_checks = [args for args, _ in mock_has_access.call_args_list if args[2] == 'staff']
+            self.assertEquals(len(staff_checks), 1)
+
@@ -8,7 +8,8 @@ from xmodule.modulestore import Location
 from courseware.tests.factories import UserFactory, StaffFactory, InstructorFactory
 from student.tests.factories import AnonymousUserFactory
 
-from courseware.roles import GlobalStaff, CourseRole
+from courseware.roles import GlobalStaff, CourseRole, CourseStaffRole, CourseInstructorRole
+from request_cache.middleware import RequestCache
 
 
 class RolesTestCase(TestCase):
@@ -45,3 +46,46 @@ class RolesTestCase(TestCase):
         self.assertTrue(CourseRole("role", lowercase_loc).has_user(uppercase_user))
         self.assertTrue(CourseRole("role", uppercase_loc).has_user(uppercase_user))
 
+
+    def test_filter_users(self):
+        users = [self.anonymous_user, self.student, self.global_staff, self.course_staff, self.course_instructor]
+        self.assertEquals(GlobalStaff().filter_users(users), [self.global_staff])
+        with self.assertNumQueries(1):
+            self.assertEquals(CourseStaffRole(self.course).filter_users(users), [self.course_staff])
+        self.assertEquals(CourseInstructorRole(self.course).filter_users(users), [self.course_instructor])
+
+    def test_filter_users_case_insensitive(self):
+        uppercase_user = UserFactory(groups="ROLE_ORG/COURSE/NAME")
+        self.assertEquals(CourseRole("role", "i4x://org/course/course/name").filter_users([uppercase_user]), [uppercase_user])
+
+
+class RequestCachedRolesTestCase(TestCase):
+    """
+    Tests of the caching of role memberships within a request
+    """
+
+    def setUp(self):
+        self.course = Location('i4x://edX/toy/course/2012_Fall')
+        self.students = [UserFactory() for _ in range(5)]
+        self.course_staff = StaffFactory(course=self.course)
+
+        middleware = RequestCache()
+        middleware.process_request(None)
+        self.addCleanup(middleware.process_response, None, None)
+
+    def test_members_loaded_once(self):
+        role = CourseStaffRole(self.course)
+        with self.assertNumQueries(1):
+            self.assertEquals(role.filter_users(self.students + [self.course_staff]), [self.course_staff])
+            self.assertEquals(role.filter_users(self.students), [])
+            for student in self.students:
+                self.assertFalse(CourseStaffRole(self.course).has_user(student))
+            self.assertTrue(role.has_user(self.course_staff))
+
+    def test_members_forgotten_when_roles_change(self):
+        role = CourseStaffRole(self.course)
+        self.assertEquals(role.filter_users(self.students), [])
+        role.add_users(self.students[0])
+        self.assertEquals(role.filter_users(self.students), [self.students[0]])
+        role.remove_users(self.students[0])
+        self.assertFalse(role.has_user(self.students[0]))
@@ -29,7 +29,7 @@ from capa.tests.response_xml_factory import (
     OptionResponseXMLFactory, CustomResponseXMLFactory, SchematicResponseXMLFactory,
     CodeResponseXMLFactory,
 )
-from courseware.tests.helpers import LoginEnrollmentTestCase
+from courseware.tests.helpers import LoginEnrollmentTestCase, count_queries
 from courseware.tests.modulestore_config import TEST_DATA_MIXED_MODULESTORE
 from lms.lib.xblock.runtime import quote_slashes
 from student.tests.factories import UserFactory
@@ -430,6 +430,23 @@ class TestCourseGrader(TestSubmittingProblems):
         )
         self.assertEqual(json.loads(resp.content).get("success"), err_msg)
 
+    def test_one_write_per_submission(self):
+        """
+        Check that a submission writes its StudentModule once, grade included.
+        """
+        self.basic_setup()
+        with count_queries() as queries:
+            self.submit_question_answer('p1', {'2_1': 'Correct'})
+        updates = [
+            query for query in queries
+            if query['sql'].startswith('UPDATE "courseware_studentmodule"')
+        ]
+        self.assertEqual(len(updates), 1)
+
+        student_module = StudentModule.objects.get(student=self.student_user, module_state_key=self.problem_location('p1'))
+        self.assertEqual((student_module.grade, student_module.max_grade), (1, 1))
+        self.assertEqual(json.loads(student_module.state)['attempts'], 1)
+
     def test_none_grade(self):
         """
         Check grade is 0 to begin with.
@@ -935,6 +952,44 @@ class TestAnswerDistributions(TestSubmittingProblems):
             }
         )
 
+    def test_chunked_reads(self):
+        # Reading one submission per query gives the same counts, and reports
+        # progress after each chunk
+        self.submit_question_answer('p1', {'2_1': u'Correct'})
+        self.submit_question_answer('p2', {'2_1': u'Incorrect'})
+        self.submit_question_answer('p3', {'2_1': u'Correct'})
+
+        progress = []
+        self.assertEqual(
+            grades.answer_distributions(self.course.id, chunk_size=1, progress_callback=progress.append),
+            grades.answer_distributions(self.course.id, chunk_size=100),
+        )
+        self.assertEqual(progress, [1, 2, 3])
+
+    def test_student_answers_from_state(self):
+        state = json.dumps({
+            'correct_map': {'i4x-MITx-100-problem-p1_2_1': {'correctness': 'correct'}},
+            'student_answers': {'i4x-MITx-100-problem-p1_2_1': u'ⓤⓝⓘⓒⓞⓓⓔ'},
+            'input_state': {'i4x-MITx-100-problem-p1_2_1': {}},
+        })
+        self.assertEqual(
+            grades.student_answers_from_state(state),
+            {'i4x-MITx-100-problem-p1_2_1': u'ⓤⓝⓘⓒⓞⓓⓔ'}
+        )
+        self.assertEqual(grades.student_answers_from_state('{"seed": 1}'), {})
+        # only the top level student_answers are the answers
+        state = (
+            '{"input_state": {"student_answers": {"nested": "not an answer"}}, '
+            '"student_answers": {"i4x-MITx-100-problem-p1_2_1": "42"}}'
+        )
+        self.assertEqual(
+            grades.student_answers_from_state(state),
+            {'i4x-MITx-100-problem-p1_2_1': u'42'}
+        )
+        self.assertEqual(grades.student_answers_from_state(None), {})
+        with self.assertRaises(ValueError):
+            grades.student_answers_from_state('{"student_answers": [1, 2]}')
+
     def test_other_data_types(self):
         # We'll submit one problem, and then muck with the student_answers
         # dict inside its state to try different data types (str, int, float,
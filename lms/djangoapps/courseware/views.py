@@ -306,9 +306,10 @@ def index(request, course_id, chapter=None, section=None,
             section_descriptor = modulestore().get_instance(course.id, section_descriptor.location, depth=None)
 
             # Load all descendants of the section, because we're going to display its
-            # html, which in general will need all of its children
-            section_field_data_cache = FieldDataCache.cache_for_descriptor_descendents(
-                course_id, user, section_descriptor, depth=None)
+            # html, which in general will need all of its children. Which of them
+            # need which fields is remembered per version of the course.
+            section_field_data_cache = FieldDataCache.cache_for_section(
+                course_id, user, section_descriptor)
 
             section_module = get_module_for_descriptor(request.user,
                 request,
@@ -636,7 +637,7 @@ def _progress(request, course_id, student_id):
 
     courseware_summary = grades.progress_summary(student, request, course)
 
-    grade_summary = grades.grade(student, request, course)
+    grade_summary = grades.cached_grade(student, request, course)
 
     if courseware_summary is None:
         #This means the student didn't have access to the course (which the instructor requested)
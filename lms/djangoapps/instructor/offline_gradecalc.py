@@ -5,26 +5,13 @@
 #
 # The grades are stored in the OfflineComputedGrade table of the courseware model.
 
-import json
 import time
 
-from json import JSONEncoder
 from courseware import grades, models
 from courseware.courses import get_course_by_id
 from django.contrib.auth.models import User
 
 
-class MyEncoder(JSONEncoder):
-
-    def _iterencode(self, obj, markers=None):
-        if isinstance(obj, tuple) and hasattr(obj, '_asdict'):
-            gen = self._iterencode_dict(obj._asdict(), markers)
-        else:
-            gen = JSONEncoder._iterencode(self, obj, markers)
-        for chunk in gen:
-            yield chunk
-
-
 def offline_grade_calculation(course_id):
     '''
     Compute grades for all students for a specified course, and save results to the DB.
@@ -36,8 +23,6 @@ def offline_grade_calculation(course_id):
         courseenrollment__is_active=1
     ).prefetch_related("groups").order_by('username')
 
-    enc = MyEncoder()
-
     class DummyRequest(object):
         META = {}
         def __init__(self):
@@ -49,17 +34,16 @@ def offline_grade_calculation(course_id):
 
     print "%d enrolled students" % len(enrolled_students)
     course = get_course_by_id(course_id)
+    grading_version = grades.grading_version(course)
 
     for student in enrolled_students:
         request = DummyRequest()
         request.user = student
         request.session = {}
 
+        stored, _ = models.OfflineComputedGrade.objects.get_or_create(user=student, course_id=course_id)
         gradeset = grades.grade(student, request, course, keep_raw_scores=True)
-        gs = enc.encode(gradeset)
-        ocg, created = models.OfflineComputedGrade.objects.get_or_create(user=student, course_id=course_id)
-        ocg.gradeset = gs
-        ocg.save()
+        grades.store_gradeset(student, course_id, gradeset, grading_version, stored.generation)
         print "%s done" % student  	# print statement used because this is run by a management command
 
     tend = time.time()
@@ -94,7 +78,10 @@ def student_grades(student, request, course, keep_raw_scores=False, use_offline=
     try:
         ocg = models.OfflineComputedGrade.objects.get(user=student, course_id=course.id)
     except models.OfflineComputedGrade.DoesNotExist:
+        ocg = None
+
+    if ocg is None or ocg.gradeset is None:
         return dict(raw_scores=[], section_breakdown=[],
                     msg='Error: no offline gradeset available for %s, %s' % (student, course.id))
 
-    return json.loads(ocg.gradeset)
+    return grades.load_gradeset(ocg.gradeset)
@@ -129,6 +129,7 @@ class TestInstructorAPIDenyLevels(ModuleStoreTestCase, LoginEnrollmentTestCase):
             ('list_background_email_tasks', {}),
             ('list_grade_downloads', {}),
             ('calculate_grades_csv', {}),
+            ('calculate_answer_distribution_csv', {}),
         ]
         # Endpoints that only Instructors can access
         self.instructor_level_endpoints = [
@@ -783,8 +784,8 @@ class TestInstructorAPILevelsDataDump(ModuleStoreTestCase, LoginEnrollmentTestCa
         Test the CSV output for the anonymized user ids.
         """
         url = reverse('get_anon_ids', kwargs={'course_id': self.course.id})
-        with patch('instructor.views.api.unique_id_for_user') as mock_unique:
-            mock_unique.return_value = '42'
+        with patch('instructor.views.api.unique_ids_for_users') as mock_unique:
+            mock_unique.side_effect = lambda users: dict((user.id, '42') for user in users)
             response = self.client.get(url, {})
         self.assertEqual(response['Content-Type'], 'text/csv')
         body = response.content.replace('\r', '')
@@ -835,6 +836,24 @@ class TestInstructorAPILevelsDataDump(ModuleStoreTestCase, LoginEnrollmentTestCa
         already_running_status = "A grade report generation task is already in progress. Check the 'Pending Instructor Tasks' table for the status of the task. When completed, the report will be available for download in the table below."
         self.assertIn(already_running_status, response.content)
 
+    def test_calculate_answer_distribution_csv_success(self):
+        url = reverse('calculate_answer_distribution_csv', kwargs={'course_id': self.course.id})
+
+        with patch('instructor_task.api.submit_calculate_answer_distribution_csv') as mock_calculate:
+            mock_calculate.return_value = True
+            response = self.client.get(url, {})
+        success_status = "Your answer distribution report is being generated! You can view the status of the generation task in the 'Pending Instructor Tasks' section."
+        self.assertIn(success_status, response.content)
+
+    def test_calculate_answer_distribution_csv_already_running(self):
+        url = reverse('calculate_answer_distribution_csv', kwargs={'course_id': self.course.id})
+
+        with patch('instructor_task.api.submit_calculate_answer_distribution_csv') as mock_calculate:
+            mock_calculate.side_effect = AlreadyRunningError()
+            response = self.client.get(url, {})
+        already_running_status = "An answer distribution report generation task is already in progress. Check the 'Pending Instructor Tasks' table for the status of the task. When completed, the report will be available for download in the table below."
+        self.assertIn(already_running_status, response.content)
+
     def test_get_students_features_csv(self):
         """
         Test that some minimum of information is formatted
@@ -58,8 +58,8 @@ class TestInstructorDashboardAnonCSV(ModuleStoreTestCase, LoginEnrollmentTestCas
         course = self.toy
         url = reverse('instructor_dashboard', kwargs={'course_id': course.id})
 
-        with patch('instructor.views.legacy.unique_id_for_user') as mock_unique:
-            mock_unique.return_value = 42
+        with patch('instructor.views.legacy.unique_ids_for_users') as mock_unique:
+            mock_unique.side_effect = lambda users: dict((user.id, 42) for user in users)
             response = self.client.post(url, {'action': 'Download CSV of all student anonymized IDs'})
 
         self.assertEqual(response['Content-Type'], 'text/csv')
@@ -32,7 +32,7 @@ from xmodule.html_module import HtmlDescriptor
 
 from bulk_email.models import CourseEmail, CourseAuthorization
 from courseware import grades
-from courseware.access import has_access
+from courseware.access import has_access, users_with_staff_access
 from courseware.courses import get_course_with_access, get_cms_course_link
 from courseware.roles import (
     CourseStaffRole, CourseInstructorRole, CourseBetaTesterRole, GlobalStaff
@@ -55,7 +55,7 @@ from instructor_task.api import (
 from instructor_task.views import get_task_completion_info
 from edxmako.shortcuts import render_to_response, render_to_string
 from psychometrics import psychoanalyze
-from student.models import CourseEnrollment, CourseEnrollmentAllowed, unique_id_for_user
+from student.models import CourseEnrollment, CourseEnrollmentAllowed, unique_ids_for_users
 from student.views import course_from_id
 import track.views
 from xblock.field_data import DictFieldData
@@ -596,7 +596,8 @@ def instructor_dashboard(request, course_id):
         ).order_by('id')
 
         datatable = {'header': ['User ID', 'Anonymized user ID']}
-        datatable['data'] = [[s.id, unique_id_for_user(s)] for s in students]
+        unique_ids = unique_ids_for_users(students)
+        datatable['data'] = [[s.id, unique_ids[s.id]] for s in students]
         return return_csv(course_id.replace('/', '-') + '-anon-ids.csv', datatable)
 
     #----------------------------------------
@@ -1269,9 +1270,10 @@ def _do_enroll_students(course, course_id, students, overload=False, auto_enroll
     status = dict([x, 'unprocessed'] for x in new_students)
 
     if overload:  	# delete all but staff
-        todelete = CourseEnrollment.objects.filter(course_id=course_id)
+        todelete = list(CourseEnrollment.objects.filter(course_id=course_id).select_related('user'))
+        staff_ids = set(user.id for user in users_with_staff_access([ce.user for ce in todelete], course))
         for ce in todelete:
-            if not has_access(ce.user, course, 'staff') and ce.user.email.lower() not in new_students_lc:
+            if ce.user.id not in staff_ids and ce.user.email.lower() not in new_students_lc:
                 status[ce.user.email] = 'deleted'
                 ce.deactivate()
             else:
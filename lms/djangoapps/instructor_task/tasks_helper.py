@@ -11,6 +11,7 @@ from time import time
 from celery import Task, current_task
 from celery.utils.log import get_task_logger
 from celery.states import SUCCESS, FAILURE
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import transaction, reset_queries
 from dogapi import dog_stats_api
@@ -19,7 +20,7 @@ from pytz import UTC
 from xmodule.modulestore.django import modulestore
 from track.views import task_track
 
-from courseware.grades import iterate_grades_for
+from courseware.grades import answer_distributions, iterate_grades_for
 from courseware.models import StudentModule
 from courseware.model_data import FieldDataCache
 from courseware.module_render import get_module_for_descriptor_internal
@@ -513,7 +514,10 @@ def push_grades_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input,
     header = None
     rows = []
     err_rows = [["id", "username", "error_msg"]]
-    for student, gradeset, err_msg in iterate_grades_for(course_id, enrolled_students):
+    grades_for_students = iterate_grades_for(
+        course_id, enrolled_students, batch_size=settings.GRADES_DOWNLOAD_BATCH_SIZE
+    )
+    for student, gradeset, err_msg in grades_for_students:
         # Periodically update task status (this is a cache write)
         if num_attempted % status_interval == 0:
             update_task_progress()
@@ -572,3 +576,63 @@ def push_grades_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input,
 
     # One last update before we close out...
     return update_task_progress()
+
+
+def push_answer_distribution_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
+    """
+    For a given `course_id`, compute the distribution of the answers submitted
+    to its problems and store it as a CSV file using a `GradesStore`, next to
+    the grade reports.
+
+    The submissions are read in chunks of settings.ANSWER_DISTRIBUTION_CHUNK_SIZE,
+    and the task's progress is updated after each chunk.
+    """
+    start_time = datetime.now(UTC)
+    num_total = StudentModule.all_submitted_problems_read_only(course_id).count()
+    progress = {'attempted': 0, 'step': "Computing answer distribution"}
+
+    def update_task_progress():
+        """Return a dict containing info about current task"""
+        current_time = datetime.now(UTC)
+        progress.update({
+            'action_name': action_name,
+            'succeeded': progress['attempted'],
+            'failed': 0,
+            'total': num_total,
+            'duration_ms': int((current_time - start_time).total_seconds() * 1000),
+        })
+        _get_current_task().update_state(state=PROGRESS, meta=progress)
+        return progress
+
+    def chunk_done(num_processed):
+        """Report the submissions processed so far"""
+        progress['attempted'] = num_processed
+        update_task_progress()
+
+    update_task_progress()
+    distribution = answer_distributions(course_id, progress_callback=chunk_done)
+
+    progress['step'] = "Uploading CSV"
+    update_task_progress()
+
+    rows = [['url_name', 'display name', 'answer id', 'answer', 'count']]
+    for (url_name, display_name, answer_id), answers in sorted(distribution.items()):
+        for answer, count in answers.iteritems():
+            rows.append([
+                url_name.encode('utf-8'),
+                display_name.encode('utf-8'),
+                answer_id.encode('utf-8'),
+                answer.encode('utf-8'),
+                count,
+            ])
+
+    timestamp_str = start_time.strftime("%Y-%m-%d-%H%M")
+    course_id_prefix = urllib.quote(course_id.replace("/", "_"))
+    GradesStore.from_config().store_rows(
+        course_id,
+        "{}_answer_distribution_{}.csv".format(course_id_prefix, timestamp_str),
+        rows
+    )
+
+    # One last update before we close out...
+    return update_task_progress()
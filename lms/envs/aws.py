@@ -345,3 +345,5 @@ VERIFY_STUDENT = AUTH_TOKENS.get("VERIFY_STUDENT", VERIFY_STUDENT)
 GRADES_DOWNLOAD_ROUTING_KEY = HIGH_MEM_QUEUE
 
 GRADES_DOWNLOAD = ENV_TOKENS.get("GRADES_DOWNLOAD", GRADES_DOWNLOAD)
+GRADES_DOWNLOAD_BATCH_SIZE = ENV_TOKENS.get("GRADES_DOWNLOAD_BATCH_SIZE", GRADES_DOWNLOAD_BATCH_SIZE)
+ANSWER_DISTRIBUTION_CHUNK_SIZE = ENV_TOKENS.get("ANSWER_DISTRIBUTION_CHUNK_SIZE", ANSWER_DISTRIBUTION_CHUNK_SIZE)
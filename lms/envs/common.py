@@ -419,6 +419,11 @@ CODE_JAIL = {
         # How many CPU seconds can jailed code use?
         'CPU': 1,
     },
+
+    # Run jailed code in a pool of pre-started sandboxed Python processes,
+    # e.g. {'size': 4, 'max_jobs': 100, 'max_memory': 200000000}.
+    # None means start a new one each time.
+    'pool': None,
 }
 
 # Some courses are allowed to run unsafe code. This is a list of regexes, one
@@ -1100,3 +1105,10 @@ GRADES_DOWNLOAD = {
     'BUCKET': 'edx-grades',
     'ROOT_PATH': '/tmp/edx-s3/grades',
 }
+
+# Number of students whose stored scores are loaded together when generating
+# a grades CSV. Set to None to grade students one at a time.
+GRADES_DOWNLOAD_BATCH_SIZE = 100
+
+# Number of submitted problems read per query when computing answer distributions
+ANSWER_DISTRIBUTION_CHUNK_SIZE = 1000
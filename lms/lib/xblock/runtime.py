@@ -130,8 +130,50 @@ class LmsHandlerUrls(object):
         return handler_url(self.course_id, block, handler_name, suffix='', query='', thirdparty=thirdparty)
 
 
+class LazyValue(object):
+    """
+    Wraps a function computing the value of a `LazyAttribute`, which is only
+    called the first time the attribute is read.
+    """
+    def __init__(self, func):
+        self.func = func
+
+
+class LazyAttribute(object):
+    """
+    An attribute that can be set to a `LazyValue`, to compute its value
+    on first use instead of when it is set.
+
+    The value is kept in the instance's __dict__ under the same name, where
+    ModuleSystem.get and set look for it.
+    """
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        value = instance.__dict__[self.name]
+        if isinstance(value, LazyValue):
+            value = instance.__dict__[self.name] = value.func()
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+
 class LmsModuleSystem(LmsHandlerUrls, ModuleSystem):  # pylint: disable=abstract-method
     """
-    ModuleSystem specialized to the LMS
+    ModuleSystem specialized to the LMS.
+
+    The attributes below may be given a `LazyValue`, as they are costly to
+    compute and many modules never use them.
     """
-    pass
+    anonymous_student_id = LazyAttribute('anonymous_student_id')
+    user_is_staff = LazyAttribute('user_is_staff')
+    error_descriptor_class = LazyAttribute('error_descriptor_class')
+
+    def get(self, attr):
+        if isinstance(getattr(type(self), attr, None), LazyAttribute):
+            return getattr(self, attr)
+        return super(LmsModuleSystem, self).get(attr)
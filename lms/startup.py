@@ -10,6 +10,7 @@ settings.INSTALLED_APPS  # pylint: disable=W0104
 
 from django_startup import autostartup
 from xmodule.modulestore.django import modulestore
+from capa.safe_exec import configure_pool
 
 log = logging.getLogger(__name__)
 
@@ -24,3 +25,7 @@ def run():
     if settings.INIT_MODULESTORE_ON_STARTUP:
         for store_name in settings.MODULESTORE:
             modulestore(store_name)
+
+    # Run capa's sandboxed code in a pool of pre-started processes, if configured.
+    if settings.CODE_JAIL.get('pool'):
+        configure_pool(**settings.CODE_JAIL['pool'])